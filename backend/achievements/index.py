@@ -1,177 +1,268 @@
-import json
 import os
-from typing import Dict, Any
-import psycopg2
-from psycopg2.extras import RealDictCursor
+import time
+from typing import Dict, Any, Optional, List, Tuple
+from cache_layer import invalidate_user_achievements, shared_cache, user_achievements_cache_key
+from request_layer import (
+    HttpError, Request, dispatch, etag_matches, evaluate_achievements, make_etag, not_modified, route,
+    row_serializer
+)
 
-def get_db_connection():
+ALLOWED_METHODS = 'GET, POST, OPTIONS'
+
+ACHIEVEMENTS_CATALOG_TTL_SECONDS = float(os.environ.get('ACHIEVEMENTS_CATALOG_TTL_SECONDS', '60'))
+ACHIEVEMENTS_PAYLOAD_TTL_SECONDS = int(os.environ.get('ACHIEVEMENTS_PAYLOAD_TTL_SECONDS', '600'))
+
+class CatalogCache:
     '''
-    Создает подключение к базе данных PostgreSQL
-    Returns: соединение с БД
+    Каталог достижений в памяти экземпляра функции.
+    После истечения TTL сверяет версию каталога из cache_versions и
+    перечитывает таблицу achievements только если версия изменилась.
     '''
-    database_url = os.environ.get('DATABASE_URL')
-    return psycopg2.connect(database_url, cursor_factory=RealDictCursor)
 
-def handler(event: Dict[str, Any], context: Any) -> Dict[str, Any]:
+    def __init__(self, ttl: float):
+        self.ttl = ttl
+        self.version: Optional[int] = None
+        self.items: List[Dict[str, Any]] = []
+        self.by_id: Dict[int, Dict[str, Any]] = {}
+        self.checked_at = 0.0
+        self.stats: Dict[str, int] = {'hits': 0, 'revalidations': 0, 'misses': 0}
+
+    def is_fresh(self) -> bool:
+        return self.version is not None and time.monotonic() - self.checked_at < self.ttl
+
+    def load(self, cursor) -> List[Dict[str, Any]]:
+        if self.is_fresh():
+            self.stats['hits'] += 1
+            return self.items
+        
+        cursor.execute("SELECT version FROM cache_versions WHERE name = 'achievements'")
+        row = cursor.fetchone()
+        version = row['version'] if row else 0
+        if version == self.version:
+            self.stats['revalidations'] += 1
+        else:
+            self.stats['misses'] += 1
+            cursor.execute('SELECT id, title, description, icon, required_count FROM achievements ORDER BY id')
+            self.items = cursor.fetchall()
+            self.by_id = {item['id']: item for item in self.items}
+            self.version = version
+        self.checked_at = time.monotonic()
+        return self.items
+
+catalog_cache = CatalogCache(ACHIEVEMENTS_CATALOG_TTL_SECONDS)
+payload_stats: Dict[str, int] = {'hits': 0, 'misses': 0}
+
+def get_cached_user_payload(user_id: Any) -> Optional[Tuple[str, str]]:
     '''
-    Business: API для управления достижениями пользователей
-    Args: event - dict с httpMethod, body, queryStringParameters
-          context - объект с атрибутами request_id, function_name
-    Returns: HTTP response dict с достижениями пользователя
+    Отдает готовый JSON достижений пользователя из общего кэша без обращения к БД.
+    Запись считается актуальной, только если собрана для текущей версии каталога.
+    Returns: кортеж ETag, тело ответа или None при промахе
+    '''
+    if shared_cache is None or not user_id or not catalog_cache.is_fresh():
+        return None
+    cached = shared_cache.get(user_achievements_cache_key(user_id))
+    if cached:
+        version, _, rest = cached.partition(':')
+        etag, _, body = rest.partition(':')
+        if version == str(catalog_cache.version):
+            payload_stats['hits'] += 1
+            return etag, body
+    payload_stats['misses'] += 1
+    return None
+
+def payload_generation(user_id: Any) -> Optional[str]:
+    '''
+    Поколение закэшированных достижений пользователя до чтения из БД
+    Returns: поколение или None, если кэша нет и сохранять ответ некуда
+    '''
+    if shared_cache is None:
+        return None
+    return shared_cache.generation(user_achievements_cache_key(user_id))
+
+def store_user_payload(user_id: Any, etag: str, body: str, generation: str) -> None:
+    '''
+    Кладет ответ в общий кэш, только если с начала чтения из БД достижения пользователя не сбрасывались:
+    иначе ответ, собранный по строкам до записи, пережил бы сброс на ACHIEVEMENTS_PAYLOAD_TTL_SECONDS
+    '''
+    shared_cache.set_if_generation(user_achievements_cache_key(user_id), f'{catalog_cache.version}:{etag}:{body}',
+                                   ACHIEVEMENTS_PAYLOAD_TTL_SECONDS, generation)
+
+def describe_cache() -> str:
+    return ' '.join(
+        [f'catalog_{name}={value}' for name, value in catalog_cache.stats.items()] +
+        [f'payload_{name}={value}' for name, value in payload_stats.items()]
+    )
+
+ACHIEVEMENTS_REEVALUATE_CHUNK_SIZE = int(os.environ.get('ACHIEVEMENTS_REEVALUATE_CHUNK_SIZE', '500'))
+ACHIEVEMENTS_REEVALUATE_MAX_CHUNK_SIZE = int(os.environ.get('ACHIEVEMENTS_REEVALUATE_MAX_CHUNK_SIZE', '5000'))
+ACHIEVEMENTS_REEVALUATE_TIME_BUDGET_SECONDS = float(os.environ.get('ACHIEVEMENTS_REEVALUATE_TIME_BUDGET_SECONDS', '25'))
+SCHEDULER_SECRET = os.environ.get('SCHEDULER_SECRET')
+
+def reevaluate_all_users(conn, after_id: int, chunk_size: int, deadline: float) -> Dict[str, Any]:
     '''
-    method: str = event.get('httpMethod', 'GET')
+    Пересчитывает user_achievements всех пользователей пачками по возрастанию id.
+    Каждая пачка фиксируется отдельно, поэтому прерванный прогон можно продолжить с lastUserId.
+    Returns: dict с количеством обработанных пользователей и точкой продолжения
+    '''
+    processed = 0
+    changed = 0
+    unlocked = 0
+    done = False
     
-    if method == 'OPTIONS':
-        return {
-            'statusCode': 200,
-            'headers': {
-                'Access-Control-Allow-Origin': '*',
-                'Access-Control-Allow-Methods': 'GET, POST, OPTIONS',
-                'Access-Control-Allow-Headers': 'Content-Type, X-User-Id',
-                'Access-Control-Max-Age': '86400'
-            },
-            'body': '',
-            'isBase64Encoded': False
-        }
+    with conn.cursor() as cursor:
+        while time.monotonic() < deadline:
+            cursor.execute('SELECT id FROM users WHERE id > %s ORDER BY id LIMIT %s', (after_id, chunk_size))
+            user_ids = [row['id'] for row in cursor.fetchall()]
+            if not user_ids:
+                done = True
+                break
+            
+            cursor.execute('''
+                SELECT COUNT(*) AS changed, COUNT(*) FILTER (WHERE newly_unlocked) AS unlocked
+                FROM evaluate_user_achievements(%s::integer[])
+            ''', (user_ids,))
+            counts = cursor.fetchone()
+            conn.commit()
+            invalidate_user_achievements(*user_ids)
+            
+            processed += len(user_ids)
+            changed += counts['changed']
+            unlocked += counts['unlocked']
+            after_id = user_ids[-1]
     
-    headers = {
-        'Content-Type': 'application/json',
-        'Access-Control-Allow-Origin': '*'
+    return {
+        'processedUsers': processed,
+        'changedRows': changed,
+        'unlocked': unlocked,
+        'lastUserId': after_id,
+        'done': done
     }
+
+serialize_achievement = row_serializer(
+    {'id': 'id', 'title': 'title', 'description': 'description', 'icon': 'icon'},
+    {'id': str}
+)
+
+@route('GET', uses_db=False)
+def get_achievements(request: Request) -> Dict[str, Any]:
+    user_id = request.params.get('user_id')
+    cache_headers = {'Cache-Control': 'private, no-cache'}
+    # Заголовок X-Db-Lsn проверяется и при попадании в кэш: некорректное значение всегда 400
+    request.read_after()
     
-    try:
-        conn = get_db_connection()
-        cursor = conn.cursor()
-        
-        if method == 'GET':
-            params = event.get('queryStringParameters', {}) or {}
-            user_id = params.get('user_id')
-            
-            if not user_id:
-                return {
-                    'statusCode': 400,
-                    'headers': headers,
-                    'body': json.dumps({'error': 'user_id is required'}),
-                    'isBase64Encoded': False
-                }
-            
-            query = '''
-                SELECT 
-                    a.id,
-                    a.title,
-                    a.description,
-                    a.icon,
-                    a.required_count,
-                    COALESCE(ua.progress, 0) as progress,
-                    COALESCE(ua.unlocked, false) as unlocked,
-                    ua.unlocked_at
-                FROM achievements a
-                LEFT JOIN user_achievements ua ON a.id = ua.achievement_id AND ua.user_id = %s
-                ORDER BY a.id
-            '''
-            cursor.execute(query, (user_id,))
-            achievements = cursor.fetchall()
-            
-            achievements_list = []
-            for achievement in achievements:
-                progress_percent = min(100, int((achievement['progress'] / achievement['required_count']) * 100))
-                achievements_list.append({
-                    'id': str(achievement['id']),
-                    'title': achievement['title'],
-                    'description': achievement['description'],
-                    'icon': achievement['icon'],
-                    'progress': progress_percent,
-                    'unlocked': achievement['unlocked'],
-                    'unlockedAt': achievement['unlocked_at'].isoformat() if achievement['unlocked_at'] else None
-                })
-            
-            cursor.close()
-            conn.close()
-            
-            return {
-                'statusCode': 200,
-                'headers': headers,
-                'body': json.dumps({'achievements': achievements_list}),
-                'isBase64Encoded': False
-            }
+    cached = get_cached_user_payload(user_id)
+    if cached is not None:
+        etag, cached_body = cached
+        request.headers['X-Cache'] = 'HIT'
+        request.headers['X-Achievements-Cache'] = describe_cache()
+        if etag_matches(request, etag):
+            return not_modified(request.headers, etag)
+        return request.respond(200, cached_body, {**cache_headers, 'ETag': etag})
+    
+    if not user_id:
+        raise HttpError(400, 'user_id is required')
+    
+    generation = payload_generation(user_id)
+    with request.database() as cursor:
+        catalog = catalog_cache.load(cursor)
+        cursor.execute('SELECT achievements_version FROM users WHERE id = %s', (user_id,))
+        version_row = cursor.fetchone()
+        etag = make_etag(user_id, catalog_cache.version, version_row['achievements_version'] if version_row else None)
+        if etag_matches(request, etag):
+            return not_modified(request.headers, etag)
         
-        elif method == 'POST':
-            body_data = json.loads(event.get('body', '{}'))
-            
-            user_id = body_data.get('user_id')
-            achievement_id = body_data.get('achievement_id')
-            progress_increment = body_data.get('progress_increment', 1)
-            
-            if not user_id or not achievement_id:
-                return {
-                    'statusCode': 400,
-                    'headers': headers,
-                    'body': json.dumps({'error': 'user_id and achievement_id are required'}),
-                    'isBase64Encoded': False
-                }
-            
-            query_achievement = 'SELECT required_count FROM achievements WHERE id = %s'
-            cursor.execute(query_achievement, (achievement_id,))
-            achievement = cursor.fetchone()
-            
-            if not achievement:
-                return {
-                    'statusCode': 404,
-                    'headers': headers,
-                    'body': json.dumps({'error': 'Achievement not found'}),
-                    'isBase64Encoded': False
-                }
-            
-            required_count = achievement['required_count']
-            
-            query = '''
-                INSERT INTO user_achievements (user_id, achievement_id, progress, unlocked, unlocked_at)
-                VALUES (%s, %s, %s, 
-                    CASE WHEN %s >= %s THEN true ELSE false END,
-                    CASE WHEN %s >= %s THEN CURRENT_TIMESTAMP ELSE NULL END)
-                ON CONFLICT (user_id, achievement_id) 
-                DO UPDATE SET 
-                    progress = user_achievements.progress + %s,
-                    unlocked = CASE WHEN user_achievements.progress + %s >= %s THEN true ELSE user_achievements.unlocked END,
-                    unlocked_at = CASE WHEN user_achievements.progress + %s >= %s AND user_achievements.unlocked_at IS NULL 
-                                  THEN CURRENT_TIMESTAMP ELSE user_achievements.unlocked_at END
-                RETURNING progress, unlocked
-            '''
-            cursor.execute(query, (
-                user_id, achievement_id, progress_increment,
-                progress_increment, required_count,
-                progress_increment, required_count,
-                progress_increment, progress_increment, required_count,
-                progress_increment, required_count
-            ))
-            
-            result = cursor.fetchone()
-            conn.commit()
-            cursor.close()
-            conn.close()
-            
-            return {
-                'statusCode': 200,
-                'headers': headers,
-                'body': json.dumps({
-                    'progress': result['progress'],
-                    'unlocked': result['unlocked']
-                }),
-                'isBase64Encoded': False
-            }
+        query = '''
+            SELECT achievement_id, progress, unlocked, unlocked_at
+            FROM user_achievements
+            WHERE user_id = %s
+        '''
+        cursor.execute(query, (user_id,))
+        progress_by_id = {row['achievement_id']: row for row in cursor.fetchall()}
+    
+    achievements_list = []
+    for achievement in catalog:
+        state = progress_by_id.get(achievement['id'])
+        progress = state['progress'] if state else 0
+        progress_percent = min(100, int((progress / max(achievement['required_count'] or 1, 1)) * 100))
+        achievements_list.append({
+            **serialize_achievement(achievement),
+            'progress': progress_percent,
+            'unlocked': bool(state and state['unlocked']),
+            'unlockedAt': state['unlocked_at'] if state else None
+        })
+    
+    body = request.encode({'achievements': achievements_list})
+    # Отставшая реплика без позиции записи клиента может вернуть состояние до последнего сброса кэша,
+    # такое тело не кэшируется, иначе оно пережило бы сброс
+    if generation is not None and (request.db_route == 'primary' or request.read_after() is not None):
+        store_user_payload(user_id, etag, body, generation)
+    request.headers['X-Cache'] = 'MISS'
+    request.headers['X-Achievements-Cache'] = describe_cache()
+    
+    return request.respond(200, body, {**cache_headers, 'ETag': etag})
+
+@route('POST')
+def evaluate_user(request: Request) -> Dict[str, Any]:
+    body_data = request.json
+    conn = request.conn
+    cursor = request.cursor
+    
+    if body_data.get('mode') == 'reevaluate_all':
+        # Пересчет всех пользователей запускает только планировщик: он держит соединение до ACHIEVEMENTS_REEVALUATE_TIME_BUDGET_SECONDS
+        if not request.has_secret('X-Scheduler-Secret', SCHEDULER_SECRET):
+            raise HttpError(401, 'Invalid scheduler secret')
+        try:
+            after_id = int(body_data.get('after_id', 0))
+            chunk_size = min(max(int(body_data.get('chunk_size', ACHIEVEMENTS_REEVALUATE_CHUNK_SIZE)), 1),
+                             ACHIEVEMENTS_REEVALUATE_MAX_CHUNK_SIZE)
+        except (TypeError, ValueError):
+            raise HttpError(400, 'after_id and chunk_size must be integers')
+        return request.respond(200, reevaluate_all_users(
+            conn,
+            after_id,
+            chunk_size,
+            time.monotonic() + ACHIEVEMENTS_REEVALUATE_TIME_BUDGET_SECONDS
+        ))
+    
+    user_id = body_data.get('user_id')
+    achievement_id = body_data.get('achievement_id')
+    
+    if not user_id:
+        raise HttpError(400, 'user_id is required')
+    
+    # Идентификатор достижения проверяется до пересчета: ошибка запроса не должна фиксировать изменения
+    if achievement_id:
+        try:
+            achievement_id = int(achievement_id)
+        except (TypeError, ValueError):
+            raise HttpError(400, 'achievement_id must be an integer')
+        catalog_cache.load(cursor)
+        if achievement_id not in catalog_cache.by_id:
+            raise HttpError(404, 'Achievement not found')
+    
+    unlocked_achievements = evaluate_achievements(cursor, [user_id])
+    request.commit(lambda: invalidate_user_achievements(user_id))
+    response_data: Dict[str, Any] = {'unlockedAchievements': unlocked_achievements}
+    
+    if achievement_id:
+        query = '''
+            SELECT progress, unlocked
+            FROM user_achievements
+            WHERE user_id = %s AND achievement_id = %s
+        '''
+        cursor.execute(query, (user_id, achievement_id))
+        achievement = cursor.fetchone() or {'progress': 0, 'unlocked': False}
         
-        else:
-            return {
-                'statusCode': 405,
-                'headers': headers,
-                'body': json.dumps({'error': 'Method not allowed'}),
-                'isBase64Encoded': False
-            }
+        response_data['progress'] = achievement['progress']
+        response_data['unlocked'] = achievement['unlocked']
     
-    except Exception as e:
-        return {
-            'statusCode': 500,
-            'headers': headers,
-            'body': json.dumps({'error': str(e)}),
-            'isBase64Encoded': False
-        }
+    return request.respond(200, response_data)
+
+def handler(event: Dict[str, Any], context: Any) -> Dict[str, Any]:
+    '''
+    Business: API достижений пользователей; прогресс считается на сервере по статистике пользователя
+    Args: event - dict с httpMethod, body, queryStringParameters
+          context - объект с атрибутами request_id, function_name
+    Returns: HTTP response dict с достижениями пользователя
+    '''
+    return dispatch(event, context, ALLOWED_METHODS)
@@ -0,0 +1,861 @@
+import asyncio
+import json
+import os
+import random
+import time
+from datetime import date
+from typing import Dict, Any, List, Tuple
+import aiohttp
+from cache_layer import invalidate_user_achievements
+from request_layer import Request, db_pool, log_event
+from task_rules import parse_interval
+
+SCHEDULER_SECRET = os.environ.get('SCHEDULER_SECRET')
+SCHEDULER_BATCH_SIZE = int(os.environ.get('SCHEDULER_BATCH_SIZE', '200'))
+SCHEDULER_TIME_BUDGET_SECONDS = float(os.environ.get('SCHEDULER_TIME_BUDGET_SECONDS', '50'))
+
+REMINDER_LEASE_SECONDS = int(os.environ.get('REMINDER_LEASE_SECONDS', '60'))
+
+# Забранные напоминания не сдвигаются по расписанию, а арендуются на REMINDER_LEASE_SECONDS,
+# умноженные на номер попытки: если отправка не удалась или воркер упал, напоминание снова созреет после аренды
+CLAIM_DUE_REMINDERS_QUERY = '''
+    WITH due AS (
+        SELECT id, next_remind_at AS due_at
+        FROM tasks
+        WHERE status = 'active'
+          AND next_remind_at IS NOT NULL
+          AND next_remind_at <= CURRENT_TIMESTAMP
+          AND remind_every_seconds > 0
+        ORDER BY next_remind_at
+        LIMIT %(batch_size)s
+        FOR UPDATE SKIP LOCKED
+    ),
+    claimed AS (
+        UPDATE tasks t
+        SET next_remind_at = CURRENT_TIMESTAMP + make_interval(secs => %(lease)s * (t.reminder_attempts + 1)),
+            reminder_attempts = t.reminder_attempts + 1
+        FROM due
+        WHERE t.id = due.id
+        RETURNING t.id, t.user_id, t.title, t.priority, t.reminder_count, t.reminder_attempts AS attempts,
+                  due.due_at, t.next_remind_at AS leased_until
+    )
+    SELECT c.id, c.user_id, c.title, c.priority, c.reminder_count, c.attempts, c.due_at, c.leased_until,
+           u.telegram_id
+    FROM claimed c
+    LEFT JOIN users u ON u.id = c.user_id
+'''
+
+# Сдвиг расписания после отправки: только если аренда все еще наша, иначе задание
+# успели отложить (/snooze) или изменить, и его новое время не перетирается
+ADVANCE_REMINDERS_QUERY = '''
+    UPDATE tasks t
+    SET reminder_count = t.reminder_count + %(sent)s,
+        reminder_attempts = 0,
+        next_remind_at = d.due_at + make_interval(secs => t.remind_every_seconds * (
+            FLOOR(EXTRACT(EPOCH FROM CURRENT_TIMESTAMP - d.due_at) / t.remind_every_seconds) + 1
+        ))
+    FROM unnest(%(ids)s::integer[], %(due_ats)s::timestamp[], %(leased_until)s::timestamp[])
+        AS d(id, due_at, leased_until)
+    WHERE t.id = d.id AND t.next_remind_at = d.leased_until AND t.remind_every_seconds > 0
+'''
+
+def claim_due_reminders(conn, batch_size: int) -> List[Dict[str, Any]]:
+    '''
+    Забирает пачку созревших напоминаний в аренду одним запросом.
+    SKIP LOCKED позволяет запускать несколько воркеров параллельно.
+    Returns: список напоминаний с telegram_id получателя, исходным временем и сроком аренды
+    '''
+    with conn.cursor() as cursor:
+        cursor.execute(CLAIM_DUE_REMINDERS_QUERY, {'batch_size': batch_size, 'lease': REMINDER_LEASE_SECONDS})
+        reminders = cursor.fetchall()
+    conn.commit()
+    return reminders
+
+def advance_reminders(conn, reminders: List[Dict[str, Any]], sent: bool = True) -> None:
+    '''
+    Сдвигает расписание напоминаний на следующий интервал после исходного времени и сбрасывает попытки;
+    sent=False - напоминание пропущено после TELEGRAM_MAX_ATTEMPTS и не засчитывается в reminder_count
+    '''
+    if not reminders:
+        return
+    with conn.cursor() as cursor:
+        cursor.execute(ADVANCE_REMINDERS_QUERY, {
+            'ids': [reminder['id'] for reminder in reminders],
+            'due_ats': [reminder['due_at'] for reminder in reminders],
+            'leased_until': [reminder['leased_until'] for reminder in reminders],
+            'sent': 1 if sent else 0
+        })
+    conn.commit()
+
+TELEGRAM_BOT_TOKEN = os.environ.get('TELEGRAM_BOT_TOKEN')
+TELEGRAM_API_URL = os.environ.get('TELEGRAM_API_URL', 'https://api.telegram.org')
+TELEGRAM_GLOBAL_RATE = float(os.environ.get('TELEGRAM_GLOBAL_RATE', '25'))
+TELEGRAM_CHAT_RATE = float(os.environ.get('TELEGRAM_CHAT_RATE', '1'))
+TELEGRAM_MAX_CONCURRENCY = int(os.environ.get('TELEGRAM_MAX_CONCURRENCY', '16'))
+TELEGRAM_MAX_ATTEMPTS = int(os.environ.get('TELEGRAM_MAX_ATTEMPTS', '4'))
+
+class TokenBucket:
+    '''
+    Ведро токенов: не больше rate отправок в секунду с запасом capacity
+    '''
+
+    def __init__(self, rate: float, capacity: float):
+        self.rate = rate
+        self.capacity = capacity
+        self.tokens = capacity
+        self.updated = time.monotonic()
+        self._lock = asyncio.Lock()
+
+    async def acquire(self) -> None:
+        async with self._lock:
+            while True:
+                now = time.monotonic()
+                self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+                self.updated = now
+                if self.tokens >= 1:
+                    self.tokens -= 1
+                    return
+                await asyncio.sleep((1 - self.tokens) / self.rate)
+
+class TelegramSender:
+    '''
+    Отправляет сообщения в Bot API с ограниченной параллельностью,
+    общим и per-chat лимитами и повторами при 429 и ошибках сервера
+    '''
+
+    def __init__(self, session: aiohttp.ClientSession, token: str, base_url: str,
+                 global_rate: float, chat_rate: float, max_concurrency: int, max_attempts: int):
+        self.session = session
+        self.url = f'{base_url.rstrip("/")}/bot{token}/sendMessage'
+        self.global_bucket = TokenBucket(global_rate, global_rate)
+        self.chat_rate = chat_rate
+        self.chat_buckets: Dict[int, TokenBucket] = {}
+        self.semaphore = asyncio.Semaphore(max_concurrency)
+        self.max_attempts = max_attempts
+        self.stats: Dict[str, int] = {'sent': 0, 'throttled': 0, 'retried': 0, 'failed': 0}
+
+    async def send_message(self, chat_id: int, text: str) -> bool:
+        chat_bucket = self.chat_buckets.get(chat_id)
+        if chat_bucket is None:
+            chat_bucket = self.chat_buckets[chat_id] = TokenBucket(self.chat_rate, 1)
+        
+        for attempt in range(self.max_attempts):
+            await chat_bucket.acquire()
+            await self.global_bucket.acquire()
+            retry_after = min(30.0, 0.5 * 2 ** attempt) * (0.5 + random.random())
+            try:
+                async with self.semaphore:
+                    async with self.session.post(self.url, json={'chat_id': chat_id, 'text': text}) as response:
+                        status = response.status
+                        payload = await response.json(content_type=None)
+            except (aiohttp.ClientError, asyncio.TimeoutError, ValueError):
+                status = None
+                payload = {}
+            
+            if status == 200 and payload.get('ok'):
+                self.stats['sent'] += 1
+                return True
+            if status == 429:
+                self.stats['throttled'] += 1
+                retry_after = float((payload.get('parameters') or {}).get('retry_after', retry_after))
+            elif status is not None and status < 500:
+                break
+            
+            if attempt + 1 < self.max_attempts:
+                self.stats['retried'] += 1
+                await asyncio.sleep(retry_after)
+        
+        self.stats['failed'] += 1
+        return False
+
+def build_reminder_messages(reminders: List[Dict[str, Any]]) -> Dict[int, str]:
+    '''
+    Склеивает несколько созревших заданий одного пользователя в одно сообщение
+    Returns: dict telegram_id -> текст сообщения
+    '''
+    titles_by_chat: Dict[int, List[str]] = {}
+    for reminder in reminders:
+        if reminder['telegram_id'] is None:
+            continue
+        titles_by_chat.setdefault(reminder['telegram_id'], []).append(reminder['title'])
+    
+    messages = {}
+    for chat_id, titles in titles_by_chat.items():
+        if len(titles) == 1:
+            messages[chat_id] = f'⏰ Напоминание: {titles[0]}'
+        else:
+            messages[chat_id] = '⏰ Напоминания:\n' + '\n'.join(f'• {title}' for title in titles)
+    return messages
+
+async def dispatch_reminders(sender: TelegramSender,
+                             reminders: List[Dict[str, Any]]) -> Tuple[List[Dict[str, Any]], List[Dict[str, Any]]]:
+    '''
+    Передает забранные напоминания на доставку в Telegram
+    Returns: напоминания, с которыми покончено (сообщение доставлено или получателя нет),
+             и напоминания чатов, куда отправить не удалось
+    '''
+    messages = build_reminder_messages(reminders)
+    results = await asyncio.gather(*(sender.send_message(chat_id, text) for chat_id, text in messages.items()))
+    failed_chats = {chat_id for chat_id, delivered in zip(messages, results) if not delivered}
+    settled = [reminder for reminder in reminders if reminder['telegram_id'] not in failed_chats]
+    failed = [reminder for reminder in reminders if reminder['telegram_id'] in failed_chats]
+    return settled, failed
+
+def bot_token_missing(job: str, totals: Dict[str, Any]) -> Dict[str, Any]:
+    '''
+    Без TELEGRAM_BOT_TOKEN рассылка не начинается: напоминания и ответы остаются в очереди
+    и уйдут, когда токен появится, вместо того чтобы считаться доставленными
+    '''
+    log_event('telegram_bot_token_missing', job=job)
+    return {**totals, 'skipped': 'TELEGRAM_BOT_TOKEN is not set'}
+
+def log_failed_reminders(failed: List[Dict[str, Any]]) -> None:
+    '''
+    Пишет в лог по строке на чат, куда не ушло напоминание: какие задания повторятся после аренды,
+    а какие пропущены до следующего интервала
+    '''
+    by_chat: Dict[int, List[Dict[str, Any]]] = {}
+    for reminder in failed:
+        by_chat.setdefault(reminder['telegram_id'], []).append(reminder)
+    for chat_id, reminders in by_chat.items():
+        print(json.dumps({
+            'event': 'reminder_send_failed',
+            'telegram_id': chat_id,
+            'retry_task_ids': [reminder['id'] for reminder in reminders
+                               if reminder['attempts'] < TELEGRAM_MAX_ATTEMPTS],
+            'dropped_task_ids': [reminder['id'] for reminder in reminders
+                                 if reminder['attempts'] >= TELEGRAM_MAX_ATTEMPTS],
+            'attempts': max(reminder['attempts'] for reminder in reminders)
+        }))
+
+async def process_due_reminders(conn, batch_size: int, deadline: float) -> Dict[str, int]:
+    '''
+    Цикл claim-and-dispatch: забирает пачки созревших напоминаний до истечения бюджета времени.
+    Расписание сдвигается только после отправки; напоминания неотправленных чатов остаются
+    в аренде и уходят повторно, когда она истечет, а после TELEGRAM_MAX_ATTEMPTS попыток
+    пропускаются до следующего интервала. Каждая неудача пишется в лог
+    Returns: счетчики обработки и доставки
+    '''
+    totals = {'claimed': 0, 'batches': 0, 'dispatched': 0, 'requeued': 0, 'dropped': 0}
+    if not TELEGRAM_BOT_TOKEN:
+        return bot_token_missing('reminders', totals)
+    async with aiohttp.ClientSession(timeout=aiohttp.ClientTimeout(total=10)) as session:
+        sender = TelegramSender(session, TELEGRAM_BOT_TOKEN, TELEGRAM_API_URL, TELEGRAM_GLOBAL_RATE,
+                                TELEGRAM_CHAT_RATE, TELEGRAM_MAX_CONCURRENCY, TELEGRAM_MAX_ATTEMPTS)
+        
+        while time.monotonic() < deadline:
+            reminders = claim_due_reminders(conn, batch_size)
+            if not reminders:
+                break
+            
+            totals['batches'] += 1
+            totals['claimed'] += len(reminders)
+            settled, failed = await dispatch_reminders(sender, reminders)
+            dropped = [reminder for reminder in failed if reminder['attempts'] >= TELEGRAM_MAX_ATTEMPTS]
+            advance_reminders(conn, settled)
+            advance_reminders(conn, dropped, sent=False)
+            log_failed_reminders(failed)
+            totals['dispatched'] += len({reminder['telegram_id'] for reminder in settled
+                                         if reminder['telegram_id'] is not None})
+            totals['requeued'] += len(failed) - len(dropped)
+            totals['dropped'] += len(dropped)
+            
+            if len(reminders) < batch_size:
+                break
+        
+        totals.update(sender.stats)
+    return totals
+
+def next_user_chunk(cursor, after_id: int, chunk_size: int) -> List[int]:
+    '''
+    Следующая пачка id пользователей по возрастанию после after_id (keyset, без OFFSET)
+    '''
+    cursor.execute('SELECT id FROM users WHERE id > %s ORDER BY id LIMIT %s', (after_id, chunk_size))
+    return [row['id'] for row in cursor.fetchall()]
+
+STATS_REPAIR_CHUNK_SIZE = int(os.environ.get('STATS_REPAIR_CHUNK_SIZE', '500'))
+
+REPAIR_TASK_STATS_QUERY = '''
+    WITH actual AS (
+        SELECT user_id, COALESCE(priority, 'medium') AS priority, COALESCE(status, 'active') AS status,
+               COUNT(*)::INTEGER AS task_count
+        FROM all_tasks
+        WHERE user_id = ANY(%(user_ids)s::integer[])
+        GROUP BY 1, 2, 3
+    ),
+    stored AS (
+        SELECT user_id, priority, status, task_count
+        FROM user_task_stats
+        WHERE user_id = ANY(%(user_ids)s::integer[])
+    ),
+    drift AS (
+        SELECT COALESCE(a.user_id, s.user_id) AS user_id,
+               COALESCE(a.priority, s.priority) AS priority,
+               COALESCE(a.status, s.status) AS status,
+               COALESCE(a.task_count, 0) AS task_count,
+               ABS(COALESCE(a.task_count, 0) - COALESCE(s.task_count, 0)) AS difference
+        FROM actual a
+        FULL JOIN stored s ON s.user_id = a.user_id AND s.priority = a.priority AND s.status = a.status
+        WHERE COALESCE(a.task_count, 0) <> COALESCE(s.task_count, 0)
+    ),
+    fixed AS (
+        INSERT INTO user_task_stats (user_id, priority, status, task_count)
+        SELECT user_id, priority, status, task_count FROM drift
+        ON CONFLICT (user_id, priority, status) DO UPDATE SET task_count = EXCLUDED.task_count
+    )
+    SELECT COUNT(*) AS drift_rows, COALESCE(SUM(difference), 0) AS drift_total FROM drift
+'''
+
+REPAIR_TASK_DAILY_STATS_QUERY = '''
+    WITH actual AS (
+        SELECT user_id, day, SUM(created)::INTEGER AS created_count, SUM(completed)::INTEGER AS completed_count
+        FROM (
+            SELECT user_id, created_at::date AS day, 1 AS created, 0 AS completed
+            FROM all_tasks
+            WHERE user_id = ANY(%(user_ids)s::integer[]) AND created_at IS NOT NULL
+            UNION ALL
+            SELECT user_id, completed_at::date, 0, 1
+            FROM all_tasks
+            WHERE user_id = ANY(%(user_ids)s::integer[]) AND status = 'completed' AND completed_at IS NOT NULL
+        ) events
+        GROUP BY user_id, day
+    ),
+    stored AS (
+        SELECT user_id, day, created_count, completed_count
+        FROM user_task_daily_stats
+        WHERE user_id = ANY(%(user_ids)s::integer[])
+    ),
+    drift AS (
+        SELECT COALESCE(a.user_id, s.user_id) AS user_id,
+               COALESCE(a.day, s.day) AS day,
+               COALESCE(a.created_count, 0) AS created_count,
+               COALESCE(a.completed_count, 0) AS completed_count,
+               ABS(COALESCE(a.created_count, 0) - COALESCE(s.created_count, 0))
+                 + ABS(COALESCE(a.completed_count, 0) - COALESCE(s.completed_count, 0)) AS difference
+        FROM actual a
+        FULL JOIN stored s ON s.user_id = a.user_id AND s.day = a.day
+        WHERE COALESCE(a.created_count, 0) <> COALESCE(s.created_count, 0)
+           OR COALESCE(a.completed_count, 0) <> COALESCE(s.completed_count, 0)
+    ),
+    fixed AS (
+        INSERT INTO user_task_daily_stats (user_id, day, created_count, completed_count)
+        SELECT user_id, day, created_count, completed_count FROM drift
+        ON CONFLICT (user_id, day) DO UPDATE SET
+            created_count = EXCLUDED.created_count,
+            completed_count = EXCLUDED.completed_count
+    )
+    SELECT COUNT(*) AS drift_rows, COALESCE(SUM(difference), 0) AS drift_total FROM drift
+'''
+
+def repair_task_stats(conn, after_id: int, chunk_size: int, deadline: float) -> Dict[str, Any]:
+    '''
+    Пересобирает счетчики user_task_stats и user_task_daily_stats из tasks пачками пользователей.
+    Каждая пачка фиксируется отдельно, расхождения пишутся в лог.
+    Returns: dict с количеством обработанных пользователей, расхождениями и точкой продолжения
+    '''
+    totals = {'processedUsers': 0, 'driftRows': 0, 'driftTotal': 0, 'lastUserId': after_id, 'done': False}
+    
+    with conn.cursor() as cursor:
+        while time.monotonic() < deadline:
+            user_ids = next_user_chunk(cursor, after_id, chunk_size)
+            if not user_ids:
+                totals['done'] = True
+                break
+            
+            drift_rows = 0
+            drift_total = 0
+            for query in (REPAIR_TASK_STATS_QUERY, REPAIR_TASK_DAILY_STATS_QUERY):
+                cursor.execute(query, {'user_ids': user_ids})
+                drift = cursor.fetchone()
+                drift_rows += drift['drift_rows']
+                drift_total += drift['drift_total']
+            conn.commit()
+            
+            if drift_rows:
+                print(json.dumps({
+                    'event': 'task_stats_drift',
+                    'from_user_id': user_ids[0],
+                    'to_user_id': user_ids[-1],
+                    'rows': drift_rows,
+                    'total': drift_total
+                }))
+            
+            after_id = user_ids[-1]
+            totals['processedUsers'] += len(user_ids)
+            totals['driftRows'] += drift_rows
+            totals['driftTotal'] += drift_total
+            totals['lastUserId'] = after_id
+    
+    return totals
+
+
+STREAKS_CHUNK_SIZE = int(os.environ.get('STREAKS_CHUNK_SIZE', '1000'))
+
+ROLLOVER_STREAKS_QUERY = '''
+    UPDATE users
+    SET streak = 0
+    WHERE id = ANY(%s::integer[])
+      AND streak > 0
+      AND (last_completed_on IS NULL
+           OR last_completed_on < user_local_date(now() AT TIME ZONE 'UTC', timezone) - 1)
+    RETURNING id
+'''
+
+RECOMPUTE_STREAKS_QUERY = '''
+    UPDATE users u
+    SET streak = s.streak, last_completed_on = s.last_completed_on
+    FROM compute_user_streaks(%s::integer[]) s
+    WHERE u.id = s.user_id
+      AND (u.streak IS DISTINCT FROM s.streak OR u.last_completed_on IS DISTINCT FROM s.last_completed_on)
+    RETURNING u.id
+'''
+
+EVALUATE_ACHIEVEMENTS_QUERY = '''
+    SELECT COUNT(*) FILTER (WHERE newly_unlocked) AS unlocked
+    FROM evaluate_user_achievements(%s::integer[])
+'''
+
+def roll_streaks(conn, after_id: int, chunk_size: int, deadline: float, recompute: bool) -> Dict[str, Any]:
+    '''
+    Обнуляет прерванные серии по last_completed_on в локальном часовом поясе пользователя.
+    Серия растет инкрементально при выполнении задания, поэтому история здесь не читается;
+    recompute=True пересобирает серии из tasks.completed_at (после миграций и для сверки).
+    Returns: dict с количеством обработанных и измененных пользователей и точкой продолжения
+    '''
+    query = RECOMPUTE_STREAKS_QUERY if recompute else ROLLOVER_STREAKS_QUERY
+    totals = {'processedUsers': 0, 'changedUsers': 0, 'unlockedAchievements': 0, 'lastUserId': after_id, 'done': False}
+    
+    with conn.cursor() as cursor:
+        while time.monotonic() < deadline:
+            user_ids = next_user_chunk(cursor, after_id, chunk_size)
+            if not user_ids:
+                totals['done'] = True
+                break
+            
+            cursor.execute(query, (user_ids,))
+            changed_ids = [row['id'] for row in cursor.fetchall()]
+            if changed_ids:
+                cursor.execute(EVALUATE_ACHIEVEMENTS_QUERY, (changed_ids,))
+                totals['unlockedAchievements'] += cursor.fetchone()['unlocked']
+            conn.commit()
+            invalidate_user_achievements(*changed_ids)
+            
+            after_id = user_ids[-1]
+            totals['processedUsers'] += len(user_ids)
+            totals['changedUsers'] += len(changed_ids)
+            totals['lastUserId'] = after_id
+    
+    return totals
+
+TASKS_ARCHIVE_AFTER_DAYS = int(os.environ.get('TASKS_ARCHIVE_AFTER_DAYS', '30'))
+TASKS_ARCHIVE_BATCH_SIZE = int(os.environ.get('TASKS_ARCHIVE_BATCH_SIZE', '1000'))
+
+ARCHIVE_CANDIDATE_RANGE_QUERY = '''
+    SELECT date_trunc('month', MIN(completed_at))::date AS first_month,
+           date_trunc('month', MAX(completed_at))::date AS last_month
+    FROM (
+        SELECT completed_at
+        FROM tasks
+        WHERE status = 'completed' AND completed_at IS NOT NULL
+          AND completed_at < (now() AT TIME ZONE 'UTC') - make_interval(days => %(after_days)s)
+        ORDER BY completed_at
+        LIMIT %(batch_size)s
+    ) candidates
+'''
+
+ARCHIVE_TASKS_QUERY = '''
+    WITH candidates AS (
+        SELECT id
+        FROM tasks
+        WHERE status = 'completed' AND completed_at IS NOT NULL
+          AND completed_at < (now() AT TIME ZONE 'UTC') - make_interval(days => %(after_days)s)
+          AND completed_at < %(partitions_end)s
+        ORDER BY completed_at
+        LIMIT %(batch_size)s
+        FOR UPDATE SKIP LOCKED
+    ),
+    moved AS (
+        DELETE FROM tasks t
+        USING candidates c
+        WHERE t.id = c.id
+        RETURNING t.*
+    ),
+    archived AS (
+        INSERT INTO tasks_archive
+        SELECT * FROM moved
+        RETURNING id
+    )
+    SELECT COUNT(*) AS archived FROM archived
+'''
+
+def next_month(month: date) -> date:
+    return date(month.year + month.month // 12, month.month % 12 + 1, 1)
+
+def archive_tasks(conn, after_days: int, batch_size: int, deadline: float) -> Dict[str, Any]:
+    '''
+    Переносит выполненные задания старше after_days из tasks в секционированный tasks_archive.
+    Каждая пачка - отдельная короткая транзакция с FOR UPDATE SKIP LOCKED, поэтому перенос
+    не блокирует обработчики надолго и может идти параллельно. Недостающие месячные секции
+    создаются и фиксируются до переноса строк.
+    Returns: dict с количеством перенесенных заданий и пачек
+    '''
+    totals = {'archivedTasks': 0, 'batches': 0, 'createdPartitions': [], 'done': False}
+    query_params = {'after_days': after_days, 'batch_size': batch_size}
+    
+    with conn.cursor() as cursor:
+        while time.monotonic() < deadline:
+            cursor.execute(ARCHIVE_CANDIDATE_RANGE_QUERY, query_params)
+            candidate_range = cursor.fetchone()
+            if candidate_range['first_month'] is None:
+                totals['done'] = True
+                break
+            month = candidate_range['first_month']
+            while month <= candidate_range['last_month']:
+                cursor.execute('SELECT create_tasks_archive_partition(%s) AS name', (month,))
+                created = cursor.fetchone()['name']
+                if created:
+                    totals['createdPartitions'].append(created)
+                month = next_month(month)
+            conn.commit()
+            
+            cursor.execute("SET LOCAL app.archiving = 'on'")
+            cursor.execute(ARCHIVE_TASKS_QUERY, {**query_params, 'partitions_end': next_month(candidate_range['last_month'])})
+            archived = cursor.fetchone()['archived']
+            conn.commit()
+            
+            totals['batches'] += 1
+            totals['archivedTasks'] += archived
+            if archived == 0:
+                totals['done'] = True
+                break
+    
+    return totals
+
+IDEMPOTENCY_CLEANUP_BATCH_SIZE = int(os.environ.get('IDEMPOTENCY_CLEANUP_BATCH_SIZE', '5000'))
+
+DELETE_EXPIRED_IDEMPOTENCY_KEYS_QUERY = '''
+    DELETE FROM idempotency_keys k
+    USING (
+        SELECT scope, idempotency_key
+        FROM idempotency_keys
+        WHERE expires_at <= CURRENT_TIMESTAMP
+        ORDER BY expires_at
+        LIMIT %s
+        FOR UPDATE SKIP LOCKED
+    ) expired
+    WHERE k.scope = expired.scope AND k.idempotency_key = expired.idempotency_key
+'''
+
+def evict_idempotency_keys(conn, batch_size: int, deadline: float) -> Dict[str, Any]:
+    '''
+    Удаляет просроченные ключи идемпотентности пачками по индексу expires_at,
+    каждая пачка фиксируется отдельно
+    Returns: dict с количеством удаленных ключей и пачек
+    '''
+    totals = {'deletedKeys': 0, 'batches': 0, 'done': False}
+    
+    with conn.cursor() as cursor:
+        while time.monotonic() < deadline:
+            cursor.execute(DELETE_EXPIRED_IDEMPOTENCY_KEYS_QUERY, (batch_size,))
+            deleted = cursor.rowcount
+            conn.commit()
+            totals['batches'] += 1
+            totals['deletedKeys'] += deleted
+            if deleted < batch_size:
+                totals['done'] = True
+                break
+    
+    return totals
+
+TASK_ASSIGNEES_BATCH_SIZE = int(os.environ.get('TASK_ASSIGNEES_BATCH_SIZE', '5000'))
+TASK_ASSIGNEES_TABLES = ('tasks', 'tasks_archive')
+
+BACKFILL_TASK_ASSIGNEES_QUERY = '''
+    SELECT last_id, resolved FROM backfill_task_assignees(%s, %s, %s)
+'''
+
+def backfill_task_assignees(conn, table: str, after_id: int, batch_size: int, deadline: float) -> Dict[str, Any]:
+    '''
+    Переносит старые значения assigned_to в assignee_id пачками по id: сначала tasks, затем tasks_archive.
+    Каждая пачка - отдельная транзакция, блокируются только измененные строки, уведомления исполнителям
+    при переносе не ставятся. Продолжить с места остановки: table=<table>&after_id=<lastTaskId>
+    Returns: dict с таблицей, последним просмотренным id и количеством узнанных исполнителей
+    '''
+    if table not in TASK_ASSIGNEES_TABLES:
+        raise ValueError(f'Unknown table, expected one of: {", ".join(TASK_ASSIGNEES_TABLES)}')
+    totals = {'table': table, 'lastTaskId': after_id, 'batches': 0, 'resolvedTasks': 0, 'done': False}
+    
+    with conn.cursor() as cursor:
+        while time.monotonic() < deadline:
+            cursor.execute(BACKFILL_TASK_ASSIGNEES_QUERY, (table, after_id, batch_size))
+            batch = cursor.fetchone()
+            conn.commit()
+            totals['batches'] += 1
+            totals['resolvedTasks'] += batch['resolved']
+            
+            if batch['last_id'] is None:
+                next_index = TASK_ASSIGNEES_TABLES.index(table) + 1
+                if next_index == len(TASK_ASSIGNEES_TABLES):
+                    totals['done'] = True
+                    break
+                table, after_id = TASK_ASSIGNEES_TABLES[next_index], 0
+            else:
+                after_id = batch['last_id']
+            totals['table'] = table
+            totals['lastTaskId'] = after_id
+    
+    return totals
+
+REMINDER_SCHEDULE_BATCH_SIZE = int(os.environ.get('REMINDER_SCHEDULE_BATCH_SIZE', '5000'))
+
+NEXT_UNSCHEDULED_TASKS_QUERY = '''
+    SELECT id, interval
+    FROM tasks
+    WHERE id > %s AND remind_every_seconds IS NULL
+    ORDER BY id
+    LIMIT %s
+'''
+
+SCHEDULE_REMINDERS_QUERY = '''
+    UPDATE tasks t
+    SET remind_every_seconds = s.seconds,
+        next_remind_at = CASE
+            WHEN t.status = 'active' AND t.next_remind_at IS NULL
+                THEN CURRENT_TIMESTAMP + make_interval(secs => s.seconds)
+            ELSE t.next_remind_at
+        END
+    FROM unnest(%s::integer[], %s::integer[]) AS s(id, seconds)
+    WHERE t.id = s.id AND t.remind_every_seconds IS NULL
+'''
+
+def backfill_reminder_schedule(conn, after_id: int, batch_size: int, deadline: float) -> Dict[str, Any]:
+    '''
+    Заполняет remind_every_seconds и next_remind_at у заданий, созданных до расписания напоминаний,
+    тем же parse_interval, что и tasks с ботом. Нераспознанные интервалы остаются без расписания
+    и попадают в счетчик. Продолжить с места остановки: after_id=<lastTaskId>
+    Returns: dict с последним просмотренным id и количеством заполненных и нераспознанных заданий
+    '''
+    totals = {'lastTaskId': after_id, 'batches': 0, 'scheduledTasks': 0, 'unrecognizedTasks': 0, 'done': False}
+    
+    with conn.cursor() as cursor:
+        while time.monotonic() < deadline:
+            cursor.execute(NEXT_UNSCHEDULED_TASKS_QUERY, (after_id, batch_size))
+            rows = cursor.fetchall()
+            if not rows:
+                conn.rollback()
+                totals['done'] = True
+                break
+            
+            parsed = [(row['id'], parse_interval(row['interval'])) for row in rows]
+            scheduled = [(task_id, seconds) for task_id, seconds in parsed if seconds is not None]
+            cursor.execute(SCHEDULE_REMINDERS_QUERY, ([task_id for task_id, _ in scheduled],
+                                                      [seconds for _, seconds in scheduled]))
+            conn.commit()
+            totals['batches'] += 1
+            totals['scheduledTasks'] += cursor.rowcount
+            totals['unrecognizedTasks'] += len(parsed) - len(scheduled)
+            after_id = rows[-1]['id']
+            totals['lastTaskId'] = after_id
+    
+    return totals
+
+TELEGRAM_OUTBOX_BATCH_SIZE = int(os.environ.get('TELEGRAM_OUTBOX_BATCH_SIZE', '200'))
+TELEGRAM_OUTBOX_LEASE_SECONDS = int(os.environ.get('TELEGRAM_OUTBOX_LEASE_SECONDS', '60'))
+
+CLAIM_OUTBOX_QUERY = '''
+    UPDATE telegram_outbox o
+    SET attempts = o.attempts + 1,
+        next_attempt_at = CURRENT_TIMESTAMP + make_interval(secs => %(lease)s * (o.attempts + 1))
+    FROM (
+        SELECT id
+        FROM telegram_outbox
+        WHERE next_attempt_at <= CURRENT_TIMESTAMP
+        ORDER BY next_attempt_at
+        LIMIT %(batch_size)s
+        FOR UPDATE SKIP LOCKED
+    ) due
+    WHERE o.id = due.id
+    RETURNING o.id, o.chat_id, o.text, o.attempts
+'''
+
+def build_outbox_messages(rows: List[Dict[str, Any]]) -> Dict[int, Tuple[List[int], str]]:
+    '''
+    Склеивает ответы одному чату из пачки в одно сообщение в порядке постановки в очередь
+    Returns: dict chat_id -> (id строк очереди, текст сообщения)
+    '''
+    messages: Dict[int, Tuple[List[int], str]] = {}
+    for row in sorted(rows, key=lambda row: row['id']):
+        ids, text = messages.get(row['chat_id'], ([], ''))
+        messages[row['chat_id']] = (ids + [row['id']], f'{text}\n\n{row["text"]}' if text else row['text'])
+    return messages
+
+async def process_telegram_outbox(conn, batch_size: int, deadline: float) -> Dict[str, int]:
+    '''
+    Отправляет ответы бота из telegram_outbox. Пачка забирается короткой транзакцией с арендой
+    на TELEGRAM_OUTBOX_LEASE_SECONDS, отправленные строки удаляются; неотправленные вернутся
+    после аренды, а после TELEGRAM_MAX_ATTEMPTS попыток удаляются с записью в лог
+    Returns: счетчики обработки и доставки
+    '''
+    totals = {'claimed': 0, 'batches': 0, 'dispatched': 0, 'dropped': 0}
+    if not TELEGRAM_BOT_TOKEN:
+        return bot_token_missing('telegram_outbox', totals)
+    async with aiohttp.ClientSession(timeout=aiohttp.ClientTimeout(total=10)) as session:
+        sender = TelegramSender(session, TELEGRAM_BOT_TOKEN, TELEGRAM_API_URL, TELEGRAM_GLOBAL_RATE,
+                                TELEGRAM_CHAT_RATE, TELEGRAM_MAX_CONCURRENCY, TELEGRAM_MAX_ATTEMPTS)
+        
+        with conn.cursor() as cursor:
+            while time.monotonic() < deadline:
+                cursor.execute(CLAIM_OUTBOX_QUERY, {'lease': TELEGRAM_OUTBOX_LEASE_SECONDS, 'batch_size': batch_size})
+                rows = cursor.fetchall()
+                conn.commit()
+                if not rows:
+                    break
+                
+                totals['batches'] += 1
+                totals['claimed'] += len(rows)
+                messages = build_outbox_messages(rows)
+                delivered = await asyncio.gather(*(sender.send_message(chat_id, text)
+                                                   for chat_id, (_, text) in messages.items()))
+                
+                done_ids = []
+                attempts = {row['id']: row['attempts'] for row in rows}
+                for (chat_id, (ids, _)), sent in zip(messages.items(), delivered):
+                    if sent:
+                        totals['dispatched'] += 1
+                        done_ids.extend(ids)
+                    elif max(attempts[row_id] for row_id in ids) >= TELEGRAM_MAX_ATTEMPTS:
+                        totals['dropped'] += len(ids)
+                        done_ids.extend(ids)
+                        print(json.dumps({'event': 'outbox_dropped', 'telegram_id': chat_id, 'rows': len(ids)}))
+                cursor.execute('DELETE FROM telegram_outbox WHERE id = ANY(%s)', (done_ids,))
+                conn.commit()
+                
+                if len(rows) < batch_size:
+                    break
+        
+        totals.update(sender.stats)
+    return totals
+
+def run_reminders_job(conn, params: Dict[str, Any], deadline: float) -> Dict[str, Any]:
+    batch_size = int(params.get('batch_size') or SCHEDULER_BATCH_SIZE)
+    return asyncio.run(process_due_reminders(conn, batch_size, deadline))
+
+def run_telegram_outbox_job(conn, params: Dict[str, Any], deadline: float) -> Dict[str, Any]:
+    batch_size = int(params.get('batch_size') or TELEGRAM_OUTBOX_BATCH_SIZE)
+    return asyncio.run(process_telegram_outbox(conn, batch_size, deadline))
+
+def run_repair_task_stats_job(conn, params: Dict[str, Any], deadline: float) -> Dict[str, Any]:
+    chunk_size = int(params.get('chunk_size') or STATS_REPAIR_CHUNK_SIZE)
+    return repair_task_stats(conn, int(params.get('after_id') or 0), chunk_size, deadline)
+
+def run_streaks_job(conn, params: Dict[str, Any], deadline: float) -> Dict[str, Any]:
+    chunk_size = int(params.get('chunk_size') or STREAKS_CHUNK_SIZE)
+    recompute = params.get('recompute') in ('1', 'true')
+    return roll_streaks(conn, int(params.get('after_id') or 0), chunk_size, deadline, recompute)
+
+def run_archive_tasks_job(conn, params: Dict[str, Any], deadline: float) -> Dict[str, Any]:
+    # Раньше срока не архивируется ничего: архив только для чтения, и досрочный перенос не отменить
+    after_days = max(int(params.get('after_days') or TASKS_ARCHIVE_AFTER_DAYS), TASKS_ARCHIVE_AFTER_DAYS)
+    batch_size = int(params.get('batch_size') or TASKS_ARCHIVE_BATCH_SIZE)
+    return archive_tasks(conn, after_days, batch_size, deadline)
+
+def run_assignees_job(conn, params: Dict[str, Any], deadline: float) -> Dict[str, Any]:
+    batch_size = int(params.get('batch_size') or TASK_ASSIGNEES_BATCH_SIZE)
+    return backfill_task_assignees(conn, params.get('table') or TASK_ASSIGNEES_TABLES[0],
+                                   int(params.get('after_id') or 0), batch_size, deadline)
+
+def run_reminder_schedule_job(conn, params: Dict[str, Any], deadline: float) -> Dict[str, Any]:
+    batch_size = int(params.get('batch_size') or REMINDER_SCHEDULE_BATCH_SIZE)
+    return backfill_reminder_schedule(conn, int(params.get('after_id') or 0), batch_size, deadline)
+
+def run_idempotency_keys_job(conn, params: Dict[str, Any], deadline: float) -> Dict[str, Any]:
+    batch_size = int(params.get('batch_size') or IDEMPOTENCY_CLEANUP_BATCH_SIZE)
+    return evict_idempotency_keys(conn, batch_size, deadline)
+
+SCHEDULER_JOBS = {
+    'reminders': run_reminders_job,
+    'telegram_outbox': run_telegram_outbox_job,
+    'repair_task_stats': run_repair_task_stats_job,
+    'streaks': run_streaks_job,
+    'archive_tasks': run_archive_tasks_job,
+    'assignees': run_assignees_job,
+    'reminder_schedule': run_reminder_schedule_job,
+    'idempotency_keys': run_idempotency_keys_job
+}
+
+def has_valid_secret(request: Request) -> bool:
+    '''
+    Сверяет X-Scheduler-Secret с SCHEDULER_SECRET. Без настроенного секрета задачи не запускаются:
+    иначе кто угодно мог бы архивировать задания, рассылать напоминания и пересчитывать счетчики
+    '''
+    return request.has_secret('X-Scheduler-Secret', SCHEDULER_SECRET)
+
+def handler(event: Dict[str, Any], context: Any) -> Dict[str, Any]:
+    '''
+    Business: Фоновые задачи по таймеру: рассылка созревших напоминаний и ответов бота в Telegram, сброс серий, обслуживание счетчиков, архивация выполненных заданий, перенос исполнителей заданий, заполнение расписания напоминаний и очистка ключей идемпотентности
+    Args: event - dict с httpMethod, заголовком X-Scheduler-Secret и queryStringParameters
+                  (job, batch_size, chunk_size, after_id, recompute, after_days, table)
+          context - объект с атрибутами request_id, function_name
+    Returns: HTTP response dict со счетчиками выполненной задачи; 401 без верного секрета
+    '''
+    method: str = event.get('httpMethod', 'GET')
+    
+    if method == 'OPTIONS':
+        return {
+            'statusCode': 200,
+            'headers': {
+                'Access-Control-Allow-Origin': '*',
+                'Access-Control-Allow-Methods': 'GET, POST, OPTIONS',
+                'Access-Control-Allow-Headers': 'Content-Type, X-User-Id',
+                'Access-Control-Max-Age': '86400'
+            },
+            'body': '',
+            'isBase64Encoded': False
+        }
+    
+    headers = {
+        'Content-Type': 'application/json',
+        'Access-Control-Allow-Origin': '*'
+    }
+    
+    if not SCHEDULER_SECRET:
+        log_event('scheduler_secret_missing', request_id=getattr(context, 'request_id', None))
+    if not has_valid_secret(Request(event, context)):
+        return {
+            'statusCode': 401,
+            'headers': headers,
+            'body': json.dumps({'error': 'Invalid scheduler secret'}),
+            'isBase64Encoded': False
+        }
+    
+    params = event.get('queryStringParameters', {}) or {}
+    job = SCHEDULER_JOBS.get(params.get('job') or 'reminders')
+    deadline = time.monotonic() + SCHEDULER_TIME_BUDGET_SECONDS
+    
+    if job is None:
+        return {
+            'statusCode': 400,
+            'headers': headers,
+            'body': json.dumps({'error': f'Unknown job, expected one of: {", ".join(SCHEDULER_JOBS)}'}),
+            'isBase64Encoded': False
+        }
+    
+    try:
+        with db_pool.connection() as conn:
+            headers['X-Db-Pool'] = db_pool.describe()
+            result = job(conn, params, deadline)
+        
+        return {
+            'statusCode': 200,
+            'headers': headers,
+            'body': json.dumps(result),
+            'isBase64Encoded': False
+        }
+    
+    except Exception as e:
+        return {
+            'statusCode': 500,
+            'headers': headers,
+            'body': json.dumps({'error': str(e)}),
+            'isBase64Encoded': False
+        }
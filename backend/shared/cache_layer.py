@@ -0,0 +1,101 @@
+'''
+Общий кэш между экземплярами функций поверх Redis и ключи закэшированных достижений пользователей.
+Сброс ключа увеличивает его поколение, а запись кэша проходит, только если поколение не изменилось
+с начала чтения из БД: так запрос, прочитавший строки до сброса, не положит их в кэш после него.
+Копируется в каталоги функций командой python backend/shared/sync.py; правки вносятся только здесь
+'''
+import os
+from typing import Any, Optional
+
+redis = None
+
+SHARED_CACHE_URL = os.environ.get('SHARED_CACHE_URL')
+SHARED_CACHE_GENERATION_TTL_SECONDS = int(os.environ.get('SHARED_CACHE_GENERATION_TTL_SECONDS', '86400'))
+
+# Запись только при неизменном поколении: проверка и SET выполняются в Redis атомарно
+SET_IF_GENERATION_SCRIPT = '''
+    if (redis.call('GET', KEYS[2]) or '0') == ARGV[1] then
+        redis.call('SET', KEYS[1], ARGV[2], 'EX', ARGV[3])
+        return 1
+    end
+    return 0
+'''
+
+def generation_key(key: str) -> str:
+    return f'{key}:generation'
+
+class RedisSharedCache:
+    '''
+    Общий кэш между экземплярами функций поверх Redis.
+    Ошибки кэша не ломают запрос: чтение превращается в промах, запись игнорируется.
+    '''
+
+    def __init__(self, url: str):
+        self.client = redis.Redis.from_url(url, socket_timeout=0.2, socket_connect_timeout=0.2)
+
+    def get(self, key: str) -> Optional[str]:
+        try:
+            value = self.client.get(key)
+        except redis.RedisError:
+            return None
+        return value.decode() if value is not None else None
+
+    def generation(self, key: str) -> Optional[str]:
+        '''
+        Текущее поколение ключа; None, если Redis недоступен и записывать нельзя
+        '''
+        try:
+            value = self.client.get(generation_key(key))
+        except redis.RedisError:
+            return None
+        return value.decode() if value is not None else '0'
+
+    def set_if_generation(self, key: str, value: str, ttl: int, generation: str) -> bool:
+        try:
+            return bool(self.client.eval(SET_IF_GENERATION_SCRIPT, 2, key, generation_key(key), generation, value, ttl))
+        except redis.RedisError:
+            return False
+
+    def invalidate(self, *keys: str) -> None:
+        '''
+        Удаляет ключи и увеличивает их поколения одним обращением к Redis
+        '''
+        if not keys:
+            return
+        try:
+            pipeline = self.client.pipeline(transaction=False)
+            pipeline.delete(*keys)
+            for key in keys:
+                pipeline.incr(generation_key(key))
+                pipeline.expire(generation_key(key), SHARED_CACHE_GENERATION_TTL_SECONDS)
+            pipeline.execute()
+        except redis.RedisError:
+            pass
+
+def create_shared_cache():
+    '''
+    Подключает общий кэш, если задан SHARED_CACHE_URL и установлен redis.
+    redis импортируется только здесь: без общего кэша холодный старт его не загружает.
+    Можно подменить на любой объект с методами get/generation/set_if_generation/invalidate.
+    Returns: объект кэша или None
+    '''
+    global redis
+    if not SHARED_CACHE_URL:
+        return None
+    try:
+        import redis
+    except ImportError:
+        return None
+    return RedisSharedCache(SHARED_CACHE_URL)
+
+shared_cache = create_shared_cache()
+
+def user_achievements_cache_key(user_id: Any) -> str:
+    return f'achievements:user:{user_id}'
+
+def invalidate_user_achievements(*user_ids: Any) -> None:
+    '''
+    Сбрасывает закэшированные достижения пользователей после записи в user_achievements
+    '''
+    if shared_cache is not None:
+        shared_cache.invalidate(*(user_achievements_cache_key(user_id) for user_id in user_ids))
@@ -0,0 +1,53 @@
+'''
+Копирует общие модули из backend/shared в каталоги функций, которые их используют. Каждая функция
+разворачивается из своего каталога отдельно, поэтому копия лежит рядом с index.py и коммитится вместе
+с ним. С --check только сверяет копии и завершается с ошибкой, если какая-то из них устарела.
+
+Запуск: python backend/shared/sync.py [--check]
+'''
+import argparse
+import os
+import sys
+from typing import Dict, Tuple
+
+SHARED_DIR = os.path.dirname(os.path.abspath(__file__))
+BACKEND_DIR = os.path.dirname(SHARED_DIR)
+
+VENDORED_MODULES: Dict[str, Tuple[str, ...]] = {
+    'db_layer.py': ('users', 'tasks', 'achievements', 'telegram', 'scheduler'),
+    'request_layer.py': ('users', 'tasks', 'achievements', 'telegram', 'scheduler'),
+    'cache_layer.py': ('users', 'tasks', 'achievements', 'telegram', 'scheduler'),
+    'task_rules.py': ('tasks', 'telegram', 'scheduler')
+}
+
+HEADER = '# Копия backend/shared/{name}: правки вносятся там, затем python backend/shared/sync.py\n'
+
+def render(name: str) -> str:
+    with open(os.path.join(SHARED_DIR, name), encoding='utf-8') as source:
+        return HEADER.format(name=name) + source.read()
+
+def main(check: bool) -> None:
+    stale = []
+    for name, functions in VENDORED_MODULES.items():
+        expected = render(name)
+        for function in functions:
+            path = os.path.join(BACKEND_DIR, function, name)
+            current = None
+            if os.path.exists(path):
+                with open(path, encoding='utf-8') as vendored:
+                    current = vendored.read()
+            if current == expected:
+                continue
+            stale.append(os.path.relpath(path, os.path.dirname(BACKEND_DIR)))
+            if not check:
+                with open(path, 'w', encoding='utf-8') as vendored:
+                    vendored.write(expected)
+    for path in stale:
+        print(f'{"stale" if check else "updated"} {path}')
+    if check and stale:
+        sys.exit(1)
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--check', action='store_true')
+    main(parser.parse_args().check)
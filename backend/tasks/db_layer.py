@@ -0,0 +1,137 @@
+# Копия backend/shared/db_layer.py: правки вносятся там, затем python backend/shared/sync.py
+'''
+Пул соединений с PostgreSQL, общий для всех функций backend: соединения переживают тёплые вызовы,
+простаивавшие проверяются, устаревшие выбрасываются. Копируется в каталоги функций командой
+python backend/shared/sync.py; правки вносятся только здесь
+'''
+import os
+import threading
+import time
+from contextlib import contextmanager
+from typing import Any, Dict, List, Optional, Tuple
+import psycopg2
+import psycopg2.extensions
+import psycopg2.pool
+from psycopg2.extras import RealDictCursor
+
+DB_POOL_MAX_SIZE = int(os.environ.get('DB_POOL_MAX_SIZE', '4'))
+DB_POOL_MAX_IDLE_SECONDS = float(os.environ.get('DB_POOL_MAX_IDLE_SECONDS', '300'))
+DB_POOL_MAX_LIFETIME_SECONDS = float(os.environ.get('DB_POOL_MAX_LIFETIME_SECONDS', '1800'))
+DB_POOL_PING_AFTER_SECONDS = float(os.environ.get('DB_POOL_PING_AFTER_SECONDS', '30'))
+
+class ConnectionPool:
+    '''
+    Пул соединений с PostgreSQL, переживающий тёплые вызовы функции.
+    Проверяет простаивавшие соединения, выбрасывает устаревшие и
+    прозрачно переподключается, если сервер закрыл соединение.
+    '''
+
+    def __init__(self, dsn: Optional[str], max_size: int, max_idle: float,
+                 max_lifetime: float, ping_after: float, cursor_factory: Any = RealDictCursor):
+        self.dsn = dsn
+        self.cursor_factory = cursor_factory
+        self.max_size = max_size
+        self.max_idle = max_idle
+        self.max_lifetime = max_lifetime
+        self.ping_after = ping_after
+        self._idle: List[Tuple[Any, float]] = []
+        self._born: Dict[int, float] = {}
+        self._in_use = 0
+        self._lock = threading.Lock()
+        self.stats: Dict[str, int] = {'hits': 0, 'misses': 0, 'evictions': 0, 'reconnects': 0}
+
+    def _connect(self):
+        conn = psycopg2.connect(self.dsn, cursor_factory=self.cursor_factory)
+        self._born[id(conn)] = time.monotonic()
+        return conn
+
+    def _discard(self, conn) -> None:
+        self._born.pop(id(conn), None)
+        try:
+            conn.close()
+        except psycopg2.Error:
+            pass
+
+    def _is_alive(self, conn) -> bool:
+        try:
+            with conn.cursor(cursor_factory=psycopg2.extensions.cursor) as cursor:
+                cursor.execute('SELECT 1')
+            conn.rollback()
+            return True
+        except psycopg2.Error:
+            return False
+
+    def getconn(self):
+        with self._lock:
+            if self._in_use >= self.max_size:
+                raise psycopg2.pool.PoolError('connection pool exhausted')
+            self._in_use += 1
+        try:
+            while True:
+                with self._lock:
+                    if not self._idle:
+                        break
+                    conn, released_at = self._idle.pop()
+                now = time.monotonic()
+                born = self._born.get(id(conn), now)
+                if conn.closed or now - released_at > self.max_idle or now - born > self.max_lifetime:
+                    self.stats['evictions'] += 1
+                    self._discard(conn)
+                    continue
+                if now - released_at > self.ping_after and not self._is_alive(conn):
+                    self.stats['reconnects'] += 1
+                    self._discard(conn)
+                    continue
+                self.stats['hits'] += 1
+                return conn
+            self.stats['misses'] += 1
+            return self._connect()
+        except Exception:
+            with self._lock:
+                self._in_use -= 1
+            raise
+
+    def putconn(self, conn, discard: bool = False) -> None:
+        with self._lock:
+            self._in_use -= 1
+        if discard or conn.closed:
+            self._discard(conn)
+            return
+        try:
+            status = conn.get_transaction_status()
+            if status == psycopg2.extensions.TRANSACTION_STATUS_UNKNOWN:
+                self._discard(conn)
+                return
+            if status != psycopg2.extensions.TRANSACTION_STATUS_IDLE:
+                conn.rollback()
+        except psycopg2.Error:
+            self._discard(conn)
+            return
+        with self._lock:
+            if len(self._idle) < self.max_size:
+                self._idle.append((conn, time.monotonic()))
+                return
+        self._discard(conn)
+
+    @contextmanager
+    def connection(self):
+        conn = self.getconn()
+        broken = False
+        try:
+            yield conn
+        except (psycopg2.OperationalError, psycopg2.InterfaceError):
+            broken = True
+            raise
+        finally:
+            self.putconn(conn, discard=broken)
+
+    def describe(self) -> str:
+        return ' '.join(f'{name}={value}' for name, value in self.stats.items())
+
+def create_db_pool(dsn: Optional[str], cursor_factory: Any = RealDictCursor) -> ConnectionPool:
+    '''
+    Пул с размером и сроками жизни соединений из DB_POOL_*
+    Returns: ConnectionPool для dsn
+    '''
+    return ConnectionPool(dsn, DB_POOL_MAX_SIZE, DB_POOL_MAX_IDLE_SECONDS, DB_POOL_MAX_LIFETIME_SECONDS,
+                          DB_POOL_PING_AFTER_SECONDS, cursor_factory)
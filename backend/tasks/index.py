@@ -1,210 +1,695 @@
-import json
+import base64
+import csv
+import io
 import os
-from typing import Dict, Any, Optional, List
+import time
+from functools import lru_cache
+from typing import Callable, Dict, Any, Optional, List, Tuple
 from datetime import datetime
-import psycopg2
-from psycopg2.extras import RealDictCursor
+import psycopg2.extensions
+from psycopg2.extras import execute_values
+from cache_layer import invalidate_user_achievements
+from request_layer import (
+    HttpError, Request, dispatch, dumps, etag_matches, evaluate_achievements, make_etag, not_modified, route,
+    row_serializer
+)
+from task_rules import TASK_COMPLETION_XP, complete_task, parse_interval
 
-def get_db_connection():
+ALLOWED_METHODS = 'GET, POST, PUT, OPTIONS'
+
+serialize_completed_user = row_serializer({
+    'id': 'id',
+    'telegram_id': 'telegram_id',
+    'username': 'username',
+    'level': 'level',
+    'xp': 'xp',
+    'totalCompleted': 'total_completed',
+    'streak': 'streak',
+    'levelsGained': 'levels_gained',
+    'createdAt': 'created_at'
+})
+
+TASK_EXISTS_QUERY = '''
+    SELECT 1 FROM tasks WHERE id = %(task_id)s
+    UNION ALL
+    SELECT 1 FROM tasks_archive WHERE id = %(task_id)s
+    LIMIT 1
+'''
+
+TASKS_PAGE_DEFAULT_LIMIT = int(os.environ.get('TASKS_PAGE_DEFAULT_LIMIT', '50'))
+TASKS_PAGE_MAX_LIMIT = int(os.environ.get('TASKS_PAGE_MAX_LIMIT', '200'))
+
+TASK_FIELD_COLUMNS = {
+    'id': 'id',
+    'title': 'title',
+    'description': 'description',
+    'interval': 'interval',
+    'assignedTo': 'assigned_to',
+    'status': 'status',
+    'priority': 'priority',
+    'reminderCount': 'reminder_count',
+    'createdAt': 'created_at',
+    'completedAt': 'completed_at',
+    'nextRemindAt': 'next_remind_at'
+}
+
+# Выполненные задания старше TASKS_ARCHIVE_AFTER_DAYS планировщик переносит в tasks_archive,
+# листинг по этому статусу объединяет обе таблицы
+TASK_LISTING_TABLES = {'completed': ('tasks', 'tasks_archive')}
+TASK_LISTING_OWNER_COLUMNS = {'me': 'assignee_id'}
+
+def parse_task_fields(value: Optional[str]) -> List[str]:
     '''
-    Создает подключение к базе данных PostgreSQL
-    Returns: соединение с БД
+    Разбирает параметр fields=title,status в список полей ответа
+    Returns: список известных полей, id всегда первым
     '''
-    database_url = os.environ.get('DATABASE_URL')
-    return psycopg2.connect(database_url, cursor_factory=RealDictCursor)
+    if not value:
+        return list(TASK_FIELD_COLUMNS)
+    requested = [field.strip() for field in value.split(',')]
+    unknown = [field for field in requested if field not in TASK_FIELD_COLUMNS]
+    if unknown:
+        raise ValueError(f'Unknown fields: {", ".join(unknown)}')
+    return ['id'] + [field for field in requested if field != 'id']
 
-def handler(event: Dict[str, Any], context: Any) -> Dict[str, Any]:
+@lru_cache(maxsize=64)
+def task_serializer(fields: Tuple[str, ...]) -> Callable[[Dict[str, Any]], Dict[str, Any]]:
     '''
-    Business: API для управления заданиями пользователей
-    Args: event - dict с httpMethod, body, queryStringParameters, pathParams
-          context - объект с атрибутами request_id, function_name
-    Returns: HTTP response dict с заданиями или статусом операции
+    Сериализатор заданий для набора полей из параметра fields, собирается один раз на набор
+    '''
+    return row_serializer({field: TASK_FIELD_COLUMNS[field] for field in fields}, {'id': str})
+
+serialize_full_task = task_serializer(tuple(TASK_FIELD_COLUMNS))
+serialize_created_task = task_serializer(tuple(field for field in TASK_FIELD_COLUMNS if field != 'completedAt'))
+serialize_completed_task = task_serializer(('id', 'title', 'status', 'completedAt'))
+serialize_updated_task = task_serializer(('id', 'status'))
+
+def encode_cursor(task: Dict[str, Any]) -> str:
+    raw = f"{task['created_at'].isoformat()}|{task['id']}"
+    return base64.urlsafe_b64encode(raw.encode()).decode()
+
+def decode_cursor(cursor_value: str) -> Tuple[datetime, int]:
+    '''
+    Разбирает курсор страницы (created_at, id) последней отданной записи
+    Returns: кортеж created_at, id
     '''
-    method: str = event.get('httpMethod', 'GET')
-    
-    if method == 'OPTIONS':
-        return {
-            'statusCode': 200,
-            'headers': {
-                'Access-Control-Allow-Origin': '*',
-                'Access-Control-Allow-Methods': 'GET, POST, PUT, DELETE, OPTIONS',
-                'Access-Control-Allow-Headers': 'Content-Type, X-User-Id',
-                'Access-Control-Max-Age': '86400'
-            },
-            'body': '',
-            'isBase64Encoded': False
-        }
+    try:
+        created_at, task_id = base64.urlsafe_b64decode(cursor_value.encode()).decode().split('|')
+        return datetime.fromisoformat(created_at), int(task_id)
+    except (ValueError, UnicodeDecodeError):
+        raise ValueError('Invalid cursor')
+
+def encode_search_cursor(mode: str, task: Dict[str, Any]) -> str:
+    raw = f"{mode}|{task['rank']!r}|{task['id']}"
+    return base64.urlsafe_b64encode(raw.encode()).decode()
+
+def decode_search_cursor(cursor_value: str) -> Tuple[str, float, int]:
+    '''
+    Разбирает курсор страницы поиска: режим поиска и (rank, id) последней отданной записи
+    Returns: кортеж mode, rank, id
+    '''
+    try:
+        mode, rank, task_id = base64.urlsafe_b64decode(cursor_value.encode()).decode().split('|')
+        if mode not in TASK_SEARCH_MODES:
+            raise ValueError(mode)
+        return mode, float(rank), int(task_id)
+    except (ValueError, UnicodeDecodeError):
+        raise ValueError('Invalid cursor')
+
+TASKS_MAX_BATCH_SIZE = int(os.environ.get('TASKS_MAX_BATCH_SIZE', '500'))
+INTERVAL_ERROR = 'Unrecognized interval, expected e.g. 30min, 2hours, daily or 1week'
+
+BATCH_UPDATE_STATUS_QUERY = f'''
+    WITH input (id, status) AS (
+        VALUES %s
+    ),
+    previous AS (
+        SELECT t.id, t.status, t.completed_at
+        FROM tasks t
+        JOIN input i ON i.id = t.id
+    ),
+    updated AS (
+        UPDATE tasks t
+        SET status = i.status,
+            completed_at = CASE WHEN i.status = 'completed' THEN CURRENT_TIMESTAMP ELSE t.completed_at END
+        FROM input i
+        WHERE t.id = i.id AND t.status IS DISTINCT FROM i.status
+        RETURNING t.id, t.user_id, t.status, t.completed_at
+    ),
+    completions AS (
+        SELECT u.user_id, COUNT(*)::INTEGER AS completed, MAX(u.completed_at) AS completed_at
+        FROM updated u
+        JOIN previous p ON p.id = u.id
+        WHERE u.status = 'completed' AND p.status <> 'completed' AND u.user_id IS NOT NULL
+        GROUP BY u.user_id
+    ),
+    previous_users AS (
+        SELECT us.id, us.level
+        FROM users us
+        JOIN completions c ON c.user_id = us.id
+        FOR UPDATE OF us
+    ),
+    rewarded AS (
+        UPDATE users us
+        SET xp = us.xp + c.completed * {TASK_COMPLETION_XP},
+            total_completed = us.total_completed + c.completed,
+            level = GREATEST(us.level, level_for_xp(us.xp + c.completed * {TASK_COMPLETION_XP})),
+            streak = next_streak(us.streak, us.last_completed_on, user_local_date(c.completed_at, us.timezone)),
+            last_completed_on = GREATEST(us.last_completed_on, user_local_date(c.completed_at, us.timezone))
+        FROM completions c
+        JOIN previous_users pu ON pu.id = c.user_id
+        WHERE us.id = c.user_id
+        RETURNING us.id, us.telegram_id, us.username, us.level, us.xp, us.total_completed, us.streak, us.created_at,
+                  us.level - pu.level AS levels_gained
+    )
+    SELECT p.id, COALESCE(u.status, p.status) AS status, u.user_id,
+           COALESCE(u.completed_at, p.completed_at) AS completed_at, u.id IS NOT NULL AS changed,
+           row_to_json(r) AS rewarded_user
+    FROM previous p
+    LEFT JOIN updated u ON u.id = p.id
+    LEFT JOIN rewarded r ON r.id = u.user_id
+'''
+
+# Задания, которых нет в tasks, ищутся в архиве: как и одиночный PUT, пачка отвечает на них 409, а не 404
+ARCHIVED_TASK_IDS_QUERY = 'SELECT id FROM tasks_archive WHERE id = ANY(%s)'
+
+def create_tasks_batch(request: Request, user_id: Any, items: List[Dict[str, Any]]) -> Dict[str, Any]:
+    '''
+    Создает пачку заданий одним многострочным INSERT
+    Returns: dict с результатом по каждому элементу и впервые открытыми достижениями
+    '''
+    cursor = request.cursor
+    results: List[Optional[Dict[str, Any]]] = [None] * len(items)
+    rows = []
+    row_indexes = []
+    for index, item in enumerate(items):
+        if not isinstance(item, dict) or not item.get('title') or not item.get('interval'):
+            results[index] = {'index': index, 'statusCode': 400, 'error': 'title and interval are required'}
+            continue
+        remind_every_seconds = parse_interval(item['interval'])
+        if remind_every_seconds is None:
+            results[index] = {'index': index, 'statusCode': 400, 'error': INTERVAL_ERROR}
+            continue
+        rows.append((user_id, item['title'], item.get('description', ''), item['interval'], item.get('assigned_to'),
+                     item.get('priority', 'medium'), remind_every_seconds, remind_every_seconds))
+        row_indexes.append(index)
     
-    headers = {
-        'Content-Type': 'application/json',
-        'Access-Control-Allow-Origin': '*'
-    }
+    unlocked_achievements = []
+    if rows:
+        query = '''
+            INSERT INTO tasks (user_id, title, description, interval, assigned_to, priority, status,
+                               remind_every_seconds, next_remind_at)
+            VALUES %s
+            RETURNING id, title, description, interval, assigned_to, status, priority, reminder_count,
+                      created_at, completed_at, next_remind_at
+        '''
+        template = "(%s, %s, %s, %s, %s, %s, 'active', %s, CURRENT_TIMESTAMP + make_interval(secs => %s))"
+        created = execute_values(cursor, query, rows, template=template, page_size=len(rows), fetch=True)
+        for index, task in zip(row_indexes, created):
+            results[index] = {'index': index, 'statusCode': 201, 'task': serialize_full_task(task)}
+        unlocked_achievements = evaluate_achievements(cursor, [user_id])
+    request.commit((lambda: invalidate_user_achievements(user_id)) if rows else None)
     
-    try:
-        conn = get_db_connection()
-        cursor = conn.cursor()
-        
-        if method == 'GET':
-            params = event.get('queryStringParameters', {}) or {}
-            user_id = params.get('user_id')
-            status = params.get('status', 'active')
-            
-            if not user_id:
-                return {
-                    'statusCode': 400,
-                    'headers': headers,
-                    'body': json.dumps({'error': 'user_id is required'}),
-                    'isBase64Encoded': False
-                }
-            
-            query = '''
-                SELECT id, user_id, title, description, interval, assigned_to, 
-                       status, priority, reminder_count, created_at, completed_at
-                FROM tasks 
-                WHERE user_id = %s AND status = %s
-                ORDER BY created_at DESC
-            '''
-            cursor.execute(query, (user_id, status))
-            tasks = cursor.fetchall()
-            
-            tasks_list = []
-            for task in tasks:
-                tasks_list.append({
+    return {'results': results, 'created': len(rows), 'unlockedAchievements': unlocked_achievements}
+
+def update_tasks_status_batch(request: Request, updates: List[Dict[str, Any]]) -> Dict[str, Any]:
+    '''
+    Меняет статус пачки заданий одним UPDATE ... FROM (VALUES ...).
+    Переход в completed начисляет XP владельцам так же, как одиночное завершение.
+    Returns: dict с результатом по каждому элементу и владельцами, получившими XP (с levelsGained)
+    '''
+    cursor = request.cursor
+    results: List[Optional[Dict[str, Any]]] = [None] * len(updates)
+    rows = []
+    index_by_id: Dict[int, int] = {}
+    for index, update in enumerate(updates):
+        try:
+            task_id = int(update['id'])
+            status = str(update['status'])
+        except (TypeError, KeyError, ValueError):
+            results[index] = {'index': index, 'statusCode': 400, 'error': 'id and status are required'}
+            continue
+        if not status or len(status) > 50:
+            results[index] = {'index': index, 'statusCode': 400, 'error': 'Invalid status'}
+            continue
+        if task_id in index_by_id:
+            results[index] = {'index': index, 'statusCode': 409, 'error': 'Duplicate task id in batch'}
+            continue
+        index_by_id[task_id] = index
+        rows.append((task_id, status))
+    
+    affected_users = set()
+    rewarded_users: Dict[int, Dict[str, Any]] = {}
+    if rows:
+        updated = execute_values(cursor, BATCH_UPDATE_STATUS_QUERY, rows, template='(%s::integer, %s::varchar)',
+                                 page_size=len(rows), fetch=True)
+        found = set()
+        for task in updated:
+            found.add(task['id'])
+            if task['user_id'] is not None:
+                affected_users.add(task['user_id'])
+            if task['rewarded_user']:
+                rewarded_users[task['rewarded_user']['id']] = task['rewarded_user']
+            index = index_by_id[task['id']]
+            # Повторное завершение, как и в одиночном PUT, - конфликт, а не успешный ответ без изменений
+            if not task['changed'] and task['status'] == 'completed':
+                results[index] = {'index': index, 'statusCode': 409, 'error': 'Task already completed'}
+                continue
+            results[index] = {
+                'index': index,
+                'statusCode': 200,
+                'task': {
                     'id': str(task['id']),
-                    'title': task['title'],
-                    'description': task['description'],
-                    'interval': task['interval'],
-                    'assignedTo': task['assigned_to'],
                     'status': task['status'],
-                    'priority': task['priority'],
-                    'reminderCount': task['reminder_count'],
-                    'createdAt': task['created_at'].isoformat() if task['created_at'] else None,
-                    'completedAt': task['completed_at'].isoformat() if task['completed_at'] else None
-                })
-            
-            cursor.close()
-            conn.close()
-            
-            return {
-                'statusCode': 200,
-                'headers': headers,
-                'body': json.dumps({'tasks': tasks_list}),
-                'isBase64Encoded': False
-            }
-        
-        elif method == 'POST':
-            body_data = json.loads(event.get('body', '{}'))
-            
-            user_id = body_data.get('user_id')
-            title = body_data.get('title')
-            description = body_data.get('description', '')
-            interval = body_data.get('interval')
-            assigned_to = body_data.get('assigned_to')
-            priority = body_data.get('priority', 'medium')
-            
-            if not user_id or not title or not interval:
-                return {
-                    'statusCode': 400,
-                    'headers': headers,
-                    'body': json.dumps({'error': 'user_id, title and interval are required'}),
-                    'isBase64Encoded': False
+                    'completedAt': task['completed_at'].isoformat() if task['completed_at'] else None,
+                    'changed': task['changed']
                 }
-            
-            query = '''
-                INSERT INTO tasks (user_id, title, description, interval, assigned_to, priority, status)
-                VALUES (%s, %s, %s, %s, %s, %s, 'active')
-                RETURNING id, title, description, interval, assigned_to, status, priority, reminder_count, created_at
-            '''
-            cursor.execute(query, (user_id, title, description, interval, assigned_to, priority))
-            task = cursor.fetchone()
-            conn.commit()
-            
-            task_data = {
-                'id': str(task['id']),
-                'title': task['title'],
-                'description': task['description'],
-                'interval': task['interval'],
-                'assignedTo': task['assigned_to'],
-                'status': task['status'],
-                'priority': task['priority'],
-                'reminderCount': task['reminder_count'],
-                'createdAt': task['created_at'].isoformat()
             }
-            
-            cursor.close()
-            conn.close()
-            
-            return {
-                'statusCode': 201,
-                'headers': headers,
-                'body': json.dumps({'task': task_data}),
-                'isBase64Encoded': False
-            }
-        
-        elif method == 'PUT':
-            path_params = event.get('pathParams', {}) or {}
-            task_id = path_params.get('id')
-            body_data = json.loads(event.get('body', '{}'))
-            
-            if not task_id:
-                return {
-                    'statusCode': 400,
-                    'headers': headers,
-                    'body': json.dumps({'error': 'task_id is required'}),
-                    'isBase64Encoded': False
-                }
-            
-            status = body_data.get('status')
-            
-            if status == 'completed':
-                query = '''
-                    UPDATE tasks 
-                    SET status = 'completed', completed_at = CURRENT_TIMESTAMP
-                    WHERE id = %s
-                    RETURNING id, status, completed_at
-                '''
-                cursor.execute(query, (task_id,))
+        missing = [task_id for task_id in index_by_id if task_id not in found]
+        requested_status = dict(rows)
+        archived = set()
+        if missing:
+            cursor.execute(ARCHIVED_TASK_IDS_QUERY, (missing,))
+            archived = {row['id'] for row in cursor.fetchall()}
+        for task_id in missing:
+            index = index_by_id[task_id]
+            if task_id not in archived:
+                results[index] = {'index': index, 'statusCode': 404, 'error': 'Task not found'}
+            elif requested_status[task_id] == 'completed':
+                results[index] = {'index': index, 'statusCode': 409, 'error': 'Task already completed'}
             else:
-                query = '''
-                    UPDATE tasks 
-                    SET status = %s
-                    WHERE id = %s
-                    RETURNING id, status
-                '''
-                cursor.execute(query, (status, task_id))
-            
-            task = cursor.fetchone()
-            conn.commit()
-            cursor.close()
-            conn.close()
-            
-            if not task:
-                return {
-                    'statusCode': 404,
-                    'headers': headers,
-                    'body': json.dumps({'error': 'Task not found'}),
-                    'isBase64Encoded': False
-                }
-            
-            return {
-                'statusCode': 200,
-                'headers': headers,
-                'body': json.dumps({'task': dict(task)}),
-                'isBase64Encoded': False
-            }
+                results[index] = {'index': index, 'statusCode': 409, 'error': 'Task is archived'}
+        if affected_users:
+            evaluate_achievements(cursor, sorted(affected_users))
+    request.commit((lambda: invalidate_user_achievements(*affected_users)) if affected_users else None)
+    
+    return {
+        'results': results,
+        'updated': sum(1 for result in results if result and result.get('task', {}).get('changed')),
+        'users': [serialize_completed_user(rewarded_users[user_id]) for user_id in sorted(rewarded_users)]
+    }
+
+def batch_too_large(items: Any) -> bool:
+    return len(items) > TASKS_MAX_BATCH_SIZE
+
+TASK_STATS_DEFAULT_DAYS = 7
+TASK_STATS_MAX_DAYS = 90
+
+def load_task_stats(cursor, user_id: Any, days: int) -> Dict[str, Any]:
+    '''
+    Читает готовые счетчики заданий пользователя из user_task_stats и user_task_daily_stats
+    Returns: dict со счетчиками по статусу, по приоритету и по дням
+    '''
+    cursor.execute(
+        'SELECT priority, status, task_count FROM user_task_stats WHERE user_id = %s AND task_count <> 0',
+        (user_id,)
+    )
+    by_status: Dict[str, int] = {}
+    by_priority: Dict[str, Dict[str, int]] = {}
+    for row in cursor.fetchall():
+        by_status[row['status']] = by_status.get(row['status'], 0) + row['task_count']
+        by_priority.setdefault(row['priority'], {})[row['status']] = row['task_count']
+    
+    cursor.execute('''
+        SELECT day, created_count, completed_count
+        FROM user_task_daily_stats
+        WHERE user_id = %s AND day > CURRENT_DATE - %s
+        ORDER BY day
+    ''', (user_id, days))
+    daily = [
+        {'day': row['day'].isoformat(), 'created': row['created_count'], 'completed': row['completed_count']}
+        for row in cursor.fetchall()
+    ]
+    
+    return {'byStatus': by_status, 'byPriority': by_priority, 'daily': daily}
+
+TASKS_EXPORT_CHUNK_ROWS = int(os.environ.get('TASKS_EXPORT_CHUNK_ROWS', '1000'))
+TASKS_EXPORT_MAX_BYTES = int(os.environ.get('TASKS_EXPORT_MAX_BYTES', '4000000'))
+
+TASK_EXPORT_FIELDS = ('id', 'title', 'description', 'interval', 'assignedTo', 'status', 'priority',
+                      'reminderCount', 'createdAt', 'completedAt')
+TASK_EXPORT_FILTERS = {
+    'created_from': 'created_at >= %s',
+    'created_to': 'created_at < %s',
+    'completed_from': 'completed_at >= %s',
+    'completed_to': 'completed_at < %s'
+}
+TASK_EXPORT_CONTENT_TYPES = {'ndjson': 'application/x-ndjson', 'csv': 'text/csv; charset=utf-8'}
+
+serialize_exported_task = row_serializer(
+    {field: index for index, field in enumerate(TASK_EXPORT_FIELDS)}, {'id': str}
+)
+
+def export_csv_value(value: Any) -> Any:
+    return value.isoformat() if isinstance(value, datetime) else value
+
+def export_tasks(request: Request) -> Dict[str, Any]:
+    '''
+    Выгрузка всей истории заданий пользователя (включая архив) в NDJSON или CSV по возрастанию created_at.
+    Строки читаются именованным серверным курсором пачками по TASKS_EXPORT_CHUNK_ROWS и сразу пишутся в буфер
+    ответа без промежуточных dict; ответ ограничен TASKS_EXPORT_MAX_BYTES в UTF-8, продолжение - по курсору
+    из заголовка X-Next-Cursor, который отдается, только если строки остались. Память вызова не зависит
+    от числа заданий пользователя
+    '''
+    params = request.params
+    export_format = params.get('format', 'ndjson')
+    if export_format not in TASK_EXPORT_CONTENT_TYPES:
+        raise HttpError(400, f'format must be one of: {", ".join(TASK_EXPORT_CONTENT_TYPES)}')
+    
+    conditions = ['user_id = %s']
+    query_params: List[Any] = [params['user_id']]
+    try:
+        for name, condition in TASK_EXPORT_FILTERS.items():
+            if params.get(name):
+                conditions.append(condition)
+                query_params.append(datetime.fromisoformat(params[name]))
+        after = decode_cursor(params['cursor']) if params.get('cursor') else None
+    except ValueError as e:
+        raise HttpError(400, str(e))
+    if after:
+        conditions.append('(created_at, id) > (%s, %s)')
+        query_params.extend(after)
+    
+    columns = ', '.join(TASK_FIELD_COLUMNS[field] for field in TASK_EXPORT_FIELDS)
+    query = f'SELECT {columns} FROM all_tasks WHERE {" AND ".join(conditions)} ORDER BY created_at, id'
+    
+    # Предел считается в байтах тела ответа: буфер пишет UTF-8 сразу в BytesIO, raw.tell() - размер в байтах
+    raw = io.BytesIO()
+    buffer = io.TextIOWrapper(raw, encoding='utf-8', newline='', write_through=True)
+    writer = csv.writer(buffer, lineterminator='\n') if export_format == 'csv' else None
+    if writer is not None and after is None:
+        writer.writerow(TASK_EXPORT_FIELDS)
+    created_at_index = TASK_EXPORT_FIELDS.index('createdAt')
+    last_row = None
+    rows_written = 0
+    
+    with request.conn.cursor(name='tasks_export', cursor_factory=psycopg2.extensions.cursor) as export_cursor:
+        export_cursor.itersize = TASKS_EXPORT_CHUNK_ROWS
+        started = time.perf_counter()
+        export_cursor.execute(query, query_params)
+        request.trace.add('execute', started)
+        while raw.tell() < TASKS_EXPORT_MAX_BYTES:
+            started = time.perf_counter()
+            rows = export_cursor.fetchmany(TASKS_EXPORT_CHUNK_ROWS)
+            request.trace.add('fetch', started)
+            if not rows:
+                last_row = None
+                break
+            started = time.perf_counter()
+            if writer is not None:
+                writer.writerows([export_csv_value(value) for value in row] for row in rows)
+            else:
+                buffer.write('\n'.join(dumps(serialize_exported_task(row)) for row in rows))
+                buffer.write('\n')
+            request.trace.add('serialise', started)
+            rows_written += len(rows)
+            last_row = rows[-1]
+        # Предел мог совпасть с последней строкой: без строки за ним курсор продолжения не нужен
+        if last_row is not None:
+            started = time.perf_counter()
+            if export_cursor.fetchone() is None:
+                last_row = None
+            request.trace.add('fetch', started)
+    
+    headers = {
+        'Content-Type': TASK_EXPORT_CONTENT_TYPES[export_format],
+        'Content-Disposition': f'attachment; filename="tasks-{params["user_id"]}.{export_format}"',
+        'Access-Control-Expose-Headers': 'X-Next-Cursor, X-Export-Rows',
+        'X-Export-Rows': str(rows_written)
+    }
+    if last_row is not None:
+        headers['X-Next-Cursor'] = encode_cursor({'created_at': last_row[created_at_index], 'id': last_row[0]})
+    return request.respond(200, raw.getvalue().decode('utf-8'), headers)
+
+TASK_SEARCH_MAX_QUERY_LENGTH = 200
+TASK_SEARCH_WORD_SIMILARITY = os.environ.get('TASK_SEARCH_WORD_SIMILARITY', '0.4')
+# Битовые карты совпадений у пользователя с большой историей не умещаются в work_mem по умолчанию
+# и становятся постраничными: каждую строку таких страниц приходится перепроверять
+TASK_SEARCH_WORK_MEM = os.environ.get('TASK_SEARCH_WORK_MEM', '16MB')
+
+# Совпадение и релевантность по режимам поиска; выражения совпадают с индексами V0018/V0019.
+# fulltext - все слова как префиксы основ, fuzzy - по триграммам с порогом pg_trgm.word_similarity_threshold
+TASK_SEARCH_MODES = {
+    'fulltext': (
+        'task_search_vector(title, description) @@ task_search_query(%(q)s)',
+        'ts_rank(task_search_vector(title, description), task_search_query(%(q)s))::FLOAT8'
+    ),
+    'fuzzy': (
+        '%(q)s <%% task_search_text(title, description)',
+        'word_similarity(%(q)s, task_search_text(title, description))::FLOAT8'
+    )
+}
+
+def find_tasks(request: Request, mode: str, query_params: Dict[str, Any], columns: str,
+               owner_column: str, status: Optional[str], after: Optional[Tuple[str, float, int]]) -> List[Dict[str, Any]]:
+    '''
+    Страница совпадений в режиме mode по tasks и, если нужно, по архиву
+    Returns: строки заданий с колонкой rank, на одну больше limit, если есть следующая страница
+    '''
+    match, rank = TASK_SEARCH_MODES[mode]
+    status_filter = 'AND status = %(status)s' if status else ''
+    tables = TASK_LISTING_TABLES.get(status, ('tasks',)) if status else ('tasks', 'tasks_archive')
+    branches = [
+        f'''
+        SELECT {columns}, {rank} AS rank
+        FROM {table}
+        WHERE {owner_column} = %(user_id)s {status_filter} AND {match}
+        '''
+        for table in tables
+    ]
+    keyset_filter = 'WHERE (rank, id) < (%(after_rank)s, %(after_id)s)' if after else ''
+    request.cursor.execute(
+        f'''
+        SET LOCAL work_mem = %(work_mem)s;
+        SET LOCAL pg_trgm.word_similarity_threshold = %(similarity)s;
+        SELECT * FROM ({' UNION ALL '.join(branches)}) matched
+        {keyset_filter}
+        ORDER BY rank DESC, id DESC
+        LIMIT %(limit)s
+        ''',
+        query_params
+    )
+    return request.cursor.fetchall()
+
+def search_tasks(request: Request, query_text: str, owner_column: str, status: Optional[str],
+                 fields: List[str], limit: int, after: Optional[Tuple[str, float, int]],
+                 etag: Optional[str]) -> Dict[str, Any]:
+    '''
+    Поиск по названию и описанию заданий пользователя, по убыванию релевантности.
+    Без status ищет по всем статусам, включая архив. Нечеткий поиск по триграммам выполняется,
+    только если полнотекстовый ничего не нашел: объединение обоих в одном запросе на порядок дороже.
+    Режим первой страницы сохраняется в курсоре (mode, rank, id)
+    '''
+    query_params: Dict[str, Any] = {
+        'q': query_text,
+        'user_id': request.params['user_id'],
+        'status': status,
+        'work_mem': TASK_SEARCH_WORK_MEM,
+        'similarity': TASK_SEARCH_WORD_SIMILARITY,
+        'limit': limit + 1
+    }
+    if after:
+        mode, query_params['after_rank'], query_params['after_id'] = after
+    else:
+        mode = 'fulltext'
+    columns = ', '.join(sorted({TASK_FIELD_COLUMNS[field] for field in fields} | {'id'}))
+    
+    tasks = find_tasks(request, mode, query_params, columns, owner_column, status, after)
+    if not tasks and not after:
+        mode = 'fuzzy'
+        tasks = find_tasks(request, mode, query_params, columns, owner_column, status, after)
+    
+    next_cursor = encode_search_cursor(mode, tasks[limit - 1]) if len(tasks) > limit else None
+    serialize = task_serializer(tuple(fields))
+    return request.respond(
+        200,
+        {'tasks': [serialize(task) for task in tasks[:limit]], 'match': mode, 'nextCursor': next_cursor},
+        {'ETag': etag, 'Cache-Control': 'private, no-cache'} if etag else None
+    )
+
+@route('GET')
+def list_tasks(request: Request) -> Dict[str, Any]:
+    params = request.params
+    cursor = request.cursor
+    user_id = params.get('user_id')
+    query_text = (params.get('q') or '').strip()
+    status = params.get('status', None if query_text else 'active')
+    
+    if not user_id:
+        raise HttpError(400, 'user_id is required')
+    
+    if params.get('view') == 'stats':
+        try:
+            days = min(max(int(params.get('days') or TASK_STATS_DEFAULT_DAYS), 1), TASK_STATS_MAX_DAYS)
+        except (TypeError, ValueError):
+            raise HttpError(400, 'days must be an integer')
+        return request.respond(200, {'stats': load_task_stats(cursor, user_id, days)})
+    if params.get('view') == 'export':
+        return export_tasks(request)
+    
+    try:
+        fields = parse_task_fields(params.get('fields'))
+        limit = min(max(int(params.get('limit') or TASKS_PAGE_DEFAULT_LIMIT), 1), TASKS_PAGE_MAX_LIMIT)
+        decode = decode_search_cursor if query_text else decode_cursor
+        after = decode(params['cursor']) if params.get('cursor') else None
+    except ValueError as e:
+        raise HttpError(400, str(e))
+    if len(query_text) > TASK_SEARCH_MAX_QUERY_LENGTH:
+        raise HttpError(400, f'q must be at most {TASK_SEARCH_MAX_QUERY_LENGTH} characters')
+    
+    assigned = params.get('assigned')
+    if assigned is not None and assigned not in TASK_LISTING_OWNER_COLUMNS:
+        raise HttpError(400, f'assigned must be one of: {", ".join(TASK_LISTING_OWNER_COLUMNS)}')
+    owner_column = TASK_LISTING_OWNER_COLUMNS.get(assigned, 'user_id')
+    
+    cursor.execute('SELECT tasks_version FROM users WHERE id = %s', (user_id,))
+    version_row = cursor.fetchone()
+    etag = None
+    if version_row:
+        etag = make_etag(user_id, version_row['tasks_version'], owner_column, status, limit,
+                         params.get('cursor'), ','.join(fields), query_text)
+        if etag_matches(request, etag):
+            return not_modified(request.headers, etag)
+    
+    if query_text:
+        return search_tasks(request, query_text, owner_column, status, fields, limit, after, etag)
+    
+    columns = sorted({TASK_FIELD_COLUMNS[field] for field in fields} | {'id', 'created_at'})
+    branch_params: List[Any] = [user_id, status]
+    keyset_filter = ''
+    if after:
+        keyset_filter = 'AND (created_at, id) < (%s, %s)'
+        branch_params.extend(after)
+    branch_params.append(limit + 1)
+    
+    branches = [
+        f'''
+        (SELECT {', '.join(columns)}
+         FROM {table}
+         WHERE {owner_column} = %s AND status = %s {keyset_filter}
+         ORDER BY created_at DESC, id DESC
+         LIMIT %s)
+        '''
+        for table in TASK_LISTING_TABLES.get(status, ('tasks',))
+    ]
+    query = ' UNION ALL '.join(branches)
+    query_params = branch_params * len(branches)
+    if len(branches) > 1:
+        query += ' ORDER BY created_at DESC, id DESC LIMIT %s'
+        query_params.append(limit + 1)
+    cursor.execute(query, query_params)
+    tasks = cursor.fetchall()
+    
+    next_cursor = encode_cursor(tasks[limit - 1]) if len(tasks) > limit else None
+    serialize = task_serializer(tuple(fields))
+    tasks_list = [serialize(task) for task in tasks[:limit]]
+    
+    return request.respond(
+        200,
+        {'tasks': tasks_list, 'nextCursor': next_cursor},
+        {'ETag': etag, 'Cache-Control': 'private, no-cache'} if etag else None
+    )
+
+@route('POST')
+def create_task(request: Request) -> Dict[str, Any]:
+    body_data = request.json
+    cursor = request.cursor
+    user_id = body_data.get('user_id')
+    
+    if isinstance(body_data.get('tasks'), list):
+        if not user_id or batch_too_large(body_data['tasks']):
+            raise HttpError(400, f'user_id and at most {TASKS_MAX_BATCH_SIZE} tasks are required')
+        return request.respond(200, create_tasks_batch(request, user_id, body_data['tasks']))
+    
+    title = body_data.get('title')
+    description = body_data.get('description', '')
+    interval = body_data.get('interval')
+    assigned_to = body_data.get('assigned_to')
+    priority = body_data.get('priority', 'medium')
+    
+    if not user_id or not title or not interval:
+        raise HttpError(400, 'user_id, title and interval are required')
+    
+    remind_every_seconds = parse_interval(interval)
+    if remind_every_seconds is None:
+        raise HttpError(400, INTERVAL_ERROR)
+    
+    query = '''
+        INSERT INTO tasks (user_id, title, description, interval, assigned_to, priority, status,
+                           remind_every_seconds, next_remind_at)
+        VALUES (%s, %s, %s, %s, %s, %s, 'active',
+                %s, CURRENT_TIMESTAMP + make_interval(secs => %s))
+        RETURNING id, title, description, interval, assigned_to, status, priority, reminder_count,
+                  created_at, next_remind_at
+    '''
+    cursor.execute(query, (user_id, title, description, interval, assigned_to, priority,
+                           remind_every_seconds, remind_every_seconds))
+    task = cursor.fetchone()
+    unlocked_achievements = evaluate_achievements(cursor, [user_id])
+    request.commit(lambda: invalidate_user_achievements(user_id))
+    
+    return request.respond(201, {'task': serialize_created_task(task), 'unlockedAchievements': unlocked_achievements})
+
+@route('PUT')
+def update_task(request: Request) -> Dict[str, Any]:
+    body_data = request.json
+    conn = request.conn
+    cursor = request.cursor
+    path_params = request.event.get('pathParams', {}) or {}
+    task_id = path_params.get('id') or body_data.get('task_id')
+    
+    if isinstance(body_data.get('updates'), list):
+        if batch_too_large(body_data['updates']):
+            raise HttpError(400, f'At most {TASKS_MAX_BATCH_SIZE} updates are allowed')
+        return request.respond(200, update_tasks_status_batch(request, body_data['updates']))
+    
+    if not task_id:
+        raise HttpError(400, 'task_id is required')
+    
+    status = body_data.get('status')
+    
+    if status == 'completed':
+        result = complete_task(cursor, task_id)
         
-        else:
-            return {
-                'statusCode': 405,
-                'headers': headers,
-                'body': json.dumps({'error': 'Method not allowed'}),
-                'isBase64Encoded': False
-            }
+        if not result['task']:
+            conn.rollback()
+            cursor.execute(TASK_EXISTS_QUERY, {'task_id': task_id})
+            if cursor.fetchone():
+                raise HttpError(409, 'Task already completed')
+            raise HttpError(404, 'Task not found')
+        
+        user = result['user']
+        unlocked_achievements = evaluate_achievements(cursor, [user['id']]) if user else []
+        request.commit((lambda: invalidate_user_achievements(user['id'])) if user else None)
+        
+        return request.respond(200, {
+            'task': serialize_completed_task(result['task']),
+            'user': serialize_completed_user(user) if user else None,
+            'unlockedAchievements': unlocked_achievements
+        })
     
-    except Exception as e:
-        return {
-            'statusCode': 500,
-            'headers': headers,
-            'body': json.dumps({'error': str(e)}),
-            'isBase64Encoded': False
-        }
+    query = '''
+        UPDATE tasks 
+        SET status = %s
+        WHERE id = %s
+        RETURNING id, status
+    '''
+    cursor.execute(query, (status, task_id))
+    task = cursor.fetchone()
+    request.commit()
+    
+    if not task:
+        cursor.execute('SELECT 1 FROM tasks_archive WHERE id = %s', (task_id,))
+        if cursor.fetchone():
+            raise HttpError(409, 'Task is archived')
+        raise HttpError(404, 'Task not found')
+    
+    return request.respond(200, {'task': serialize_updated_task(task)})
+
+def handler(event: Dict[str, Any], context: Any) -> Dict[str, Any]:
+    '''
+    Business: API для управления заданиями пользователей
+    Args: event - dict с httpMethod, body, queryStringParameters, pathParams
+          context - объект с атрибутами request_id, function_name
+    Returns: HTTP response dict с заданиями или статусом операции
+    '''
+    return dispatch(event, context, ALLOWED_METHODS)
@@ -0,0 +1,375 @@
+import hashlib
+import json
+import os
+import re
+import threading
+import time
+from collections import OrderedDict
+from typing import Dict, Any, Optional, List, Tuple
+import psycopg2
+import psycopg2.pool
+from cache_layer import invalidate_user_achievements
+from request_layer import Request, db_pool
+from task_rules import TASK_COMPLETION_XP, TASK_TITLE_MAX_LENGTH, complete_task, parse_interval
+
+def log_event(event: str, **fields: Any) -> None:
+    print(json.dumps({'event': event, **fields}, ensure_ascii=False), flush=True)
+
+TELEGRAM_WEBHOOK_SECRET = os.environ.get('TELEGRAM_WEBHOOK_SECRET')
+TELEGRAM_UPDATE_TTL_SECONDS = int(os.environ.get('TELEGRAM_UPDATE_TTL_SECONDS', '86400'))
+TELEGRAM_SEEN_UPDATES_MAX = int(os.environ.get('TELEGRAM_SEEN_UPDATES_MAX', '10000'))
+TELEGRAM_MAX_UPDATES_PER_DELIVERY = int(os.environ.get('TELEGRAM_MAX_UPDATES_PER_DELIVERY', '1000'))
+
+class SeenUpdates:
+    '''
+    Недавно обработанные update_id этого экземпляра функции: повторная доставка отбрасывается
+    без обращения к БД. Записи истекают через ttl, набор ограничен max_size; update_id растут,
+    поэтому самые старые записи лежат в начале и вытесняются первыми.
+    Общая для всех экземпляров защита от повторов - ключи в idempotency_keys
+    '''
+
+    def __init__(self, ttl: float, max_size: int):
+        self.ttl = ttl
+        self.max_size = max_size
+        self._expires: 'OrderedDict[int, float]' = OrderedDict()
+        self._lock = threading.Lock()
+
+    def _prune(self, now: float) -> None:
+        while self._expires:
+            update_id, expires_at = next(iter(self._expires.items()))
+            if expires_at > now and len(self._expires) <= self.max_size:
+                break
+            del self._expires[update_id]
+
+    def __contains__(self, update_id: int) -> bool:
+        with self._lock:
+            expires_at = self._expires.get(update_id)
+            return expires_at is not None and expires_at > time.monotonic()
+
+    def add_many(self, update_ids: List[int]) -> None:
+        now = time.monotonic()
+        with self._lock:
+            for update_id in sorted(update_ids):
+                self._expires[update_id] = now + self.ttl
+                self._expires.move_to_end(update_id)
+            self._prune(now)
+
+seen_updates = SeenUpdates(TELEGRAM_UPDATE_TTL_SECONDS, TELEGRAM_SEEN_UPDATES_MAX)
+
+COMMAND_ALIASES = {
+    'start': 'start',
+    'new': 'new', 'add': 'new',
+    'done': 'done',
+    'snooze': 'snooze',
+    'list': 'list', 'tasks': 'list',
+    'help': 'help'
+}
+COMMAND_PATTERN = re.compile(r'^/?([a-zA-Z]+)(?:@\w+)?(?:\s+(.*))?$', re.DOTALL)
+CALLBACK_PATTERN = re.compile(r'^(done|snooze):(\d+)$')
+NEW_TASK_DEFAULT_INTERVAL = 'daily'
+SNOOZE_DEFAULT_INTERVAL = '1hour'
+
+HELP_TEXT = (
+    'Команды:\n'
+    '/new Название | daily - новое задание (интервал необязателен)\n'
+    '/done 42 - выполнить задание\n'
+    '/snooze 42 2hours - отложить напоминание (по умолчанию на час)\n'
+    '/list - активные задания'
+)
+
+def parse_update(update: Dict[str, Any]) -> Optional[Dict[str, Any]]:
+    '''
+    Достает из обновления Telegram отправителя и команду: текст сообщения ("/done 42", "done 42")
+    или data нажатой inline-кнопки ("done:42"). Поля проверяются по типам: обновления других видов
+    (фото, стикеры, служебные сообщения, правки) и обновления неожиданной формы пропускаются
+    Returns: dict с update_id, telegram_id, chat_id, username, command и args или None,
+             если в обновлении нет текстовой команды от пользователя
+    '''
+    message = update.get('message')
+    callback = update.get('callback_query')
+    if isinstance(message, dict):
+        sender, chat, text = message.get('from'), message.get('chat'), message.get('text')
+        if not isinstance(chat, dict) or not isinstance(text, str) or not text.strip():
+            return None
+        match = COMMAND_PATTERN.match(text.strip())
+        command = COMMAND_ALIASES.get(match.group(1).lower(), 'help') if match else 'help'
+        args = (match.group(2) or '').strip() if match else ''
+    elif isinstance(callback, dict):
+        sender, chat, data = callback.get('from'), None, callback.get('data')
+        if not isinstance(data, str):
+            return None
+        if isinstance(callback.get('message'), dict) and isinstance(callback['message'].get('chat'), dict):
+            chat = callback['message']['chat']
+        match = CALLBACK_PATTERN.match(data)
+        if not match:
+            return None
+        command, args = match.group(1), match.group(2)
+    else:
+        return None
+
+    if not isinstance(sender, dict) or not isinstance(sender.get('id'), int) or sender.get('is_bot'):
+        return None
+    chat_id = chat.get('id') if chat is not None else None
+    username = sender.get('username')
+    return {
+        'update_id': update['update_id'],
+        'telegram_id': sender['id'],
+        'chat_id': chat_id if isinstance(chat_id, int) else sender['id'],
+        'username': username if isinstance(username, str) else None,
+        'command': command,
+        'args': args
+    }
+
+CLAIM_UPDATES_QUERY = '''
+    INSERT INTO idempotency_keys AS k (scope, idempotency_key, request_hash, expires_at)
+    SELECT 'telegram_update', u.update_id::text, u.request_hash, CURRENT_TIMESTAMP + make_interval(secs => %(ttl)s)
+    FROM unnest(%(update_ids)s::bigint[], %(hashes)s::text[]) AS u(update_id, request_hash)
+    ON CONFLICT (scope, idempotency_key) DO UPDATE SET
+        request_hash = EXCLUDED.request_hash,
+        created_at = CURRENT_TIMESTAMP,
+        expires_at = EXCLUDED.expires_at
+    WHERE k.expires_at <= CURRENT_TIMESTAMP
+    RETURNING k.idempotency_key::bigint AS update_id
+'''
+
+LOCK_USER_QUERY = '''
+    SELECT id, level FROM users WHERE telegram_id = %s FOR UPDATE
+'''
+
+START_USER_QUERY = '''
+    INSERT INTO users (telegram_id, username)
+    VALUES (%s, %s)
+    ON CONFLICT (telegram_id) DO UPDATE SET username = COALESCE(EXCLUDED.username, users.username)
+    RETURNING id, level
+'''
+
+CREATE_TASK_QUERY = '''
+    INSERT INTO tasks (user_id, title, description, interval, priority, status, remind_every_seconds, next_remind_at)
+    VALUES (%(user_id)s, %(title)s, '', %(interval)s, 'medium', 'active',
+            %(seconds)s, CURRENT_TIMESTAMP + make_interval(secs => %(seconds)s))
+    RETURNING id
+'''
+
+SNOOZE_TASK_QUERY = '''
+    UPDATE tasks
+    SET next_remind_at = CURRENT_TIMESTAMP + make_interval(secs => %(seconds)s)
+    WHERE id = %(task_id)s AND user_id = %(user_id)s AND status = 'active'
+    RETURNING title
+'''
+
+LIST_TASKS_QUERY = '''
+    SELECT id, title
+    FROM tasks
+    WHERE user_id = %s AND status = 'active'
+    ORDER BY created_at DESC, id DESC
+    LIMIT 10
+'''
+
+EVALUATE_ACHIEVEMENTS_QUERY = '''
+    SELECT a.title
+    FROM evaluate_user_achievements(%s::integer[]) e
+    JOIN achievements a ON a.id = e.achievement_id
+    WHERE e.newly_unlocked
+    ORDER BY a.id
+'''
+
+ENQUEUE_REPLY_QUERY = '''
+    INSERT INTO telegram_outbox (chat_id, text) VALUES (%s, %s)
+'''
+
+# tasks.id - INTEGER: больший номер не найдется, а в запросе дал бы ошибку и откат всей пачки пользователя
+TASK_ID_MAX = 2 ** 31 - 1
+
+def parse_task_id(args: str) -> Optional[int]:
+    first = args.split(maxsplit=1)[0] if args else ''
+    return int(first) if first.isdigit() and int(first) <= TASK_ID_MAX else None
+
+def run_command(cursor, user: Dict[str, Any], command: Dict[str, Any]) -> Tuple[str, bool]:
+    '''
+    Выполняет одну команду пользователя в открытой транзакции
+    Returns: текст ответа и признак того, что изменилась статистика для достижений
+    '''
+    name, args = command['command'], command['args']
+
+    if name == 'start':
+        return '👋 Привет! Я напоминаю о заданиях.\n' + HELP_TEXT, False
+
+    if name == 'new':
+        title, _, interval = args.partition('|')
+        title, interval = title.strip(), interval.strip() or NEW_TASK_DEFAULT_INTERVAL
+        seconds = parse_interval(interval)
+        if not title or len(title) > TASK_TITLE_MAX_LENGTH or seconds is None:
+            return f'Формат: /new Название | daily (название до {TASK_TITLE_MAX_LENGTH} символов)', False
+        cursor.execute(CREATE_TASK_QUERY, {'user_id': user['id'], 'title': title, 'interval': interval,
+                                           'seconds': seconds})
+        return f'✅ Задание #{cursor.fetchone()["id"]} создано: {title}', True
+
+    if name == 'done':
+        task_id = parse_task_id(args)
+        if task_id is None:
+            return 'Формат: /done 42', False
+        completed = complete_task(cursor, task_id, owner_id=user['id'])
+        if completed['task'] is None:
+            return f'Задание #{task_id} не найдено среди активных', False
+        reply = f'🎉 Выполнено: {completed["task"]["title"]} (+{TASK_COMPLETION_XP} XP)'
+        if completed['user']['levels_gained'] > 0:
+            reply += f'\n⬆️ Уровень {completed["user"]["level"]}!'
+        return reply, True
+
+    if name == 'snooze':
+        task_id = parse_task_id(args)
+        interval = args.split(maxsplit=1)[1] if len(args.split(maxsplit=1)) > 1 else SNOOZE_DEFAULT_INTERVAL
+        seconds = parse_interval(interval)
+        if task_id is None or seconds is None:
+            return 'Формат: /snooze 42 2hours', False
+        cursor.execute(SNOOZE_TASK_QUERY, {'task_id': task_id, 'user_id': user['id'], 'seconds': seconds})
+        snoozed = cursor.fetchone()
+        if snoozed is None:
+            return f'Задание #{task_id} не найдено среди активных', False
+        return f'😴 Напомню про «{snoozed["title"]}» через {interval}', False
+
+    if name == 'list':
+        cursor.execute(LIST_TASKS_QUERY, (user['id'],))
+        tasks = cursor.fetchall()
+        if not tasks:
+            return 'Активных заданий нет', False
+        return '📋 Активные задания:\n' + '\n'.join(f'#{task["id"]} {task["title"]}' for task in tasks), False
+
+    return HELP_TEXT, False
+
+def update_hash(update_id: int) -> str:
+    return hashlib.md5(f'telegram_update:{update_id}'.encode()).hexdigest()
+
+def apply_user_updates(conn, telegram_id: int, commands: List[Dict[str, Any]]) -> Dict[str, Any]:
+    '''
+    Применяет все обновления одного пользователя из доставки в одной транзакции: занимает их update_id,
+    блокирует строку пользователя, выполняет команды по порядку, один раз пересчитывает достижения
+    и кладет ответы в telegram_outbox. При ошибке откатывается все вместе с занятыми update_id,
+    и повторная доставка Telegram обработает их заново
+    Returns: dict с обработанными и уже виденными update_id и числом ответов
+    '''
+    update_ids = [command['update_id'] for command in commands]
+    with conn.cursor() as cursor:
+        cursor.execute(CLAIM_UPDATES_QUERY, {
+            'update_ids': update_ids, 'hashes': [update_hash(update_id) for update_id in update_ids],
+            'ttl': TELEGRAM_UPDATE_TTL_SECONDS
+        })
+        claimed = {row['update_id'] for row in cursor.fetchall()}
+        commands = [command for command in commands if command['update_id'] in claimed]
+
+        user = None
+        replies: Dict[int, List[str]] = {}
+        stats_changed = False
+        if commands:
+            cursor.execute(LOCK_USER_QUERY, (telegram_id,))
+            user = cursor.fetchone()
+        for command in commands:
+            if user is None and command['command'] == 'start':
+                cursor.execute(START_USER_QUERY, (telegram_id, command['username']))
+                user = cursor.fetchone()
+            if user is None:
+                reply, changed = 'Сначала отправьте /start', False
+            else:
+                reply, changed = run_command(cursor, user, command)
+            replies.setdefault(command['chat_id'], []).append(reply)
+            stats_changed = stats_changed or changed
+
+        if stats_changed:
+            cursor.execute(EVALUATE_ACHIEVEMENTS_QUERY, ([user['id']],))
+            for achievement in cursor.fetchall():
+                replies[commands[-1]['chat_id']].append(f'🏆 Новое достижение: {achievement["title"]}')
+        for chat_id, texts in replies.items():
+            cursor.execute(ENQUEUE_REPLY_QUERY, (chat_id, '\n\n'.join(texts)))
+    conn.commit()
+
+    if stats_changed:
+        invalidate_user_achievements(user['id'])
+    return {
+        'processed': sorted(claimed),
+        'duplicates': [update_id for update_id in update_ids if update_id not in claimed],
+        'replies': len(replies)
+    }
+
+def has_valid_secret(request: Request) -> bool:
+    '''
+    Сверяет X-Telegram-Bot-Api-Secret-Token с TELEGRAM_WEBHOOK_SECRET. Без настроенного секрета
+    вебхук не принимает ничего: иначе кто угодно мог бы выполнять команды от имени любого telegram_id
+    '''
+    return request.has_secret('X-Telegram-Bot-Api-Secret-Token', TELEGRAM_WEBHOOK_SECRET)
+
+def respond(status_code: int, body: Dict[str, Any]) -> Dict[str, Any]:
+    return {
+        'statusCode': status_code,
+        'headers': {'Content-Type': 'application/json'},
+        'body': json.dumps(body),
+        'isBase64Encoded': False
+    }
+
+def handler(event: Dict[str, Any], context: Any) -> Dict[str, Any]:
+    '''
+    Business: Вебхук Telegram-бота: принимает обновления, отбрасывает повторные доставки по update_id,
+              выполняет команды /new, /done, /snooze, /list в одной транзакции на пользователя
+              и ставит ответы в очередь telegram_outbox, которую отправляет планировщик
+    Args: event - dict с httpMethod, headers и body (Update или массив Update, например результат getUpdates)
+          context - объект с атрибутами request_id, function_name
+    Returns: HTTP response dict со счетчиками обработки; 401 без верного секретного токена;
+             500, если изменения части пользователей не зафиксированы и Telegram должен повторить доставку
+    '''
+    if event.get('httpMethod', 'POST') != 'POST':
+        return respond(405, {'error': 'Method not allowed'})
+    if not TELEGRAM_WEBHOOK_SECRET:
+        log_event('telegram_webhook_secret_missing', request_id=getattr(context, 'request_id', None))
+    if not has_valid_secret(Request(event, context)):
+        return respond(401, {'error': 'Invalid secret token'})
+
+    try:
+        payload = json.loads(event.get('body') or 'null')
+    except ValueError:
+        return respond(400, {'error': 'Invalid JSON body'})
+    updates = payload if isinstance(payload, list) else [payload]
+    if not all(isinstance(update, dict) and isinstance(update.get('update_id'), int) for update in updates):
+        return respond(400, {'error': 'Telegram Update objects with update_id expected'})
+    if len(updates) > TELEGRAM_MAX_UPDATES_PER_DELIVERY:
+        return respond(400, {'error': f'At most {TELEGRAM_MAX_UPDATES_PER_DELIVERY} updates per delivery'})
+
+    totals = {'received': len(updates), 'duplicates': 0, 'processed': 0, 'ignored': 0, 'users': 0,
+              'replies': 0, 'failedUsers': 0}
+    fresh: Dict[int, Dict[str, Any]] = {}
+    for update in updates:
+        if update['update_id'] in seen_updates or update['update_id'] in fresh:
+            totals['duplicates'] += 1
+            continue
+        fresh[update['update_id']] = update
+
+    commands_by_user: Dict[int, List[Dict[str, Any]]] = {}
+    for update_id in sorted(fresh):
+        command = parse_update(fresh[update_id])
+        if command is None:
+            totals['ignored'] += 1
+            continue
+        commands_by_user.setdefault(command['telegram_id'], []).append(command)
+
+    if commands_by_user:
+        try:
+            with db_pool.connection() as conn:
+                for telegram_id, commands in commands_by_user.items():
+                    try:
+                        result = apply_user_updates(conn, telegram_id, commands)
+                    except psycopg2.DatabaseError as e:
+                        conn.rollback()
+                        totals['failedUsers'] += 1
+                        log_event('telegram_update_failed', request_id=getattr(context, 'request_id', None),
+                                  telegram_id=telegram_id, update_ids=[command['update_id'] for command in commands],
+                                  error=f'{type(e).__name__}: {e}')
+                        continue
+                    seen_updates.add_many(result['processed'] + result['duplicates'])
+                    totals['users'] += 1 if result['processed'] else 0
+                    totals['processed'] += len(result['processed'])
+                    totals['duplicates'] += len(result['duplicates'])
+                    totals['replies'] += result['replies']
+        except (psycopg2.OperationalError, psycopg2.InterfaceError, psycopg2.pool.PoolError) as e:
+            log_event('telegram_delivery_failed', request_id=getattr(context, 'request_id', None),
+                      error=f'{type(e).__name__}: {e}')
+            return respond(500, {**totals, 'error': str(e)})
+
+    return respond(500 if totals['failedUsers'] else 200, totals)
@@ -0,0 +1,688 @@
+# Копия backend/shared/request_layer.py: правки вносятся там, затем python backend/shared/sync.py
+'''
+Общий слой запросов функций users, tasks и achievements: пулы основного сервера и реплик, разбор вызова,
+маршруты по HTTP-методам, ключи идемпотентности, замеры запросов, пересчет достижений и ETag.
+Функции разворачиваются по отдельности, поэтому модуль копируется в каталог каждой из них
+командой python backend/shared/sync.py; правки вносятся только здесь
+'''
+import hashlib
+import hmac
+import json
+import os
+import random
+import re
+import threading
+import time
+from contextlib import contextmanager
+from contextvars import ContextVar
+from typing import Callable, Dict, Any, Optional, List, Tuple
+from datetime import date, datetime
+from decimal import Decimal
+import psycopg2
+import psycopg2.extensions
+from psycopg2.extras import RealDictCursor
+from db_layer import ConnectionPool, create_db_pool
+
+try:
+    import orjson
+except ImportError:
+    orjson = None
+
+REQUEST_LOG_SAMPLE_RATE = float(os.environ.get('REQUEST_LOG_SAMPLE_RATE', '0.01'))
+SLOW_QUERY_MS = float(os.environ.get('SLOW_QUERY_MS', '200'))
+SLOW_QUERY_EXPLAIN = os.environ.get('SLOW_QUERY_EXPLAIN', '1') == '1'
+SQL_LOG_MAX_LENGTH = int(os.environ.get('SQL_LOG_MAX_LENGTH', '500'))
+IDEMPOTENCY_KEY_TTL_SECONDS = int(os.environ.get('IDEMPOTENCY_KEY_TTL_SECONDS', '86400'))
+IDEMPOTENCY_KEY_MAX_LENGTH = 255
+
+DATABASE_REPLICA_URLS = [dsn.strip() for dsn in os.environ.get('DATABASE_REPLICA_URLS', '').split(',') if dsn.strip()]
+DB_REPLICA_MAX_LAG_SECONDS = float(os.environ.get('DB_REPLICA_MAX_LAG_SECONDS', '5'))
+DB_REPLICA_CHECK_SECONDS = float(os.environ.get('DB_REPLICA_CHECK_SECONDS', '5'))
+DB_REPLICA_RETRY_SECONDS = float(os.environ.get('DB_REPLICA_RETRY_SECONDS', '30'))
+DB_LSN_HEADER = 'X-Db-Lsn'
+
+# Реплика пригодна для чтения, если она в режиме восстановления и либо получает WAL и проиграла
+# все полученное, либо последняя проигранная транзакция не старше DB_REPLICA_MAX_LAG_SECONDS
+REPLICA_STATUS_QUERY = '''
+    SELECT COALESCE(pg_is_in_recovery() AND (
+               (pg_last_wal_receive_lsn() = pg_last_wal_replay_lsn() AND EXISTS (SELECT 1 FROM pg_stat_wal_receiver))
+               OR now() - pg_last_xact_replay_timestamp() <= make_interval(secs => %s)
+           ), false),
+           pg_last_wal_replay_lsn()::TEXT
+'''
+
+def parse_lsn(value: str) -> int:
+    '''
+    Переводит позицию WAL вида 16/B374D848 в число для сравнения
+    '''
+    high, separator, low = value.partition('/')
+    if not separator:
+        raise ValueError(f'Invalid LSN: {value}')
+    return (int(high, 16) << 32) + int(low, 16)
+
+class ReplicaSet:
+    '''
+    Реплики для чтения: пул на каждую и выбор по кругу среди пригодных.
+    Состояние реплики проверяется не чаще раза в DB_REPLICA_CHECK_SECONDS, недоступная пропускается
+    DB_REPLICA_RETRY_SECONDS. Чтение с позицией WAL записи клиента уходит только на реплику,
+    которая ее уже проиграла, иначе - на основной сервер.
+    '''
+
+    def __init__(self, dsns: List[str], max_lag: float, check_every: float, retry_after: float):
+        self.pools = [
+            create_db_pool(dsn, TracedCursor)
+            for dsn in dsns
+        ]
+        self.max_lag = max_lag
+        self.check_every = check_every
+        self.retry_after = retry_after
+        self._usable = [False] * len(dsns)
+        self._replayed = [0] * len(dsns)
+        self._next_check = [0.0] * len(dsns)
+        self._next = 0
+        self._lock = threading.Lock()
+        self.stats: Dict[str, int] = {'replica': 0, 'primary': 0, 'lagging': 0, 'down': 0}
+
+    def _check(self, index: int) -> None:
+        try:
+            with self.pools[index].connection() as conn:
+                with conn.cursor(cursor_factory=psycopg2.extensions.cursor) as cursor:
+                    cursor.execute(REPLICA_STATUS_QUERY, (self.max_lag,))
+                    usable, replayed = cursor.fetchone()
+                conn.rollback()
+        except psycopg2.Error:
+            self.stats['down'] += 1
+            self._usable[index] = False
+            self._next_check[index] = time.monotonic() + self.retry_after
+            return
+        self._usable[index] = usable
+        self._replayed[index] = parse_lsn(replayed) if replayed else 0
+        self._next_check[index] = time.monotonic() + self.check_every
+
+    def choose(self, min_lsn: Optional[int]) -> Optional[ConnectionPool]:
+        '''
+        Выбирает реплику для чтения; отставшая от min_lsn перепроверяется сразу
+        Returns: пул реплики или None, если читать нужно с основного сервера
+        '''
+        with self._lock:
+            start = self._next
+            self._next = (start + 1) % len(self.pools)
+        for offset in range(len(self.pools)):
+            index = (start + offset) % len(self.pools)
+            behind = min_lsn is not None and self._replayed[index] < min_lsn
+            if time.monotonic() >= self._next_check[index] or (behind and self._usable[index]):
+                self._check(index)
+                behind = min_lsn is not None and self._replayed[index] < min_lsn
+            if not self._usable[index]:
+                continue
+            if behind:
+                self.stats['lagging'] += 1
+                continue
+            self.stats['replica'] += 1
+            return self.pools[index]
+        self.stats['primary'] += 1
+        return None
+
+    def describe(self) -> str:
+        return ' '.join(f'{name}={value}' for name, value in self.stats.items())
+
+RESPONSE_HEADERS = {
+    'Content-Type': 'application/json',
+    'Access-Control-Allow-Origin': '*',
+    'Access-Control-Expose-Headers': 'ETag, Idempotent-Replayed, X-Db-Lsn'
+}
+
+def options_response(allow_methods: str) -> Dict[str, Any]:
+    '''
+    Ответ на CORS preflight; allow_methods - методы, которые принимает функция
+    '''
+    return {
+        'statusCode': 200,
+        'headers': {
+            'Access-Control-Allow-Origin': '*',
+            'Access-Control-Allow-Methods': allow_methods,
+            'Access-Control-Allow-Headers': 'Content-Type, X-User-Id, If-None-Match, Idempotency-Key, X-Db-Lsn',
+            'Access-Control-Max-Age': '86400'
+        },
+        'body': '',
+        'isBase64Encoded': False
+    }
+
+def json_default(value: Any) -> Any:
+    if isinstance(value, (datetime, date)):
+        return value.isoformat()
+    if isinstance(value, Decimal):
+        return float(value)
+    raise TypeError(f'Object of type {type(value).__name__} is not JSON serializable')
+
+def dumps(value: Any) -> str:
+    '''
+    Сериализует тело ответа через orjson, если он установлен, иначе через стандартный json
+    '''
+    if orjson is not None:
+        return orjson.dumps(value, default=json_default).decode()
+    return json.dumps(value, default=json_default)
+
+def loads(raw: Optional[str]) -> Any:
+    if not raw:
+        return {}
+    if orjson is not None:
+        return orjson.loads(raw)
+    return json.loads(raw)
+
+def log_event(event: str, **fields: Any) -> None:
+    print(dumps({'event': event, **fields}), flush=True)
+
+SQL_LITERAL_PATTERN = re.compile(r"'(?:[^']|'')*'|\b\d+(?:\.\d+)?\b|%\(\w+\)s|%s")
+SQL_EXPLAINABLE_PREFIXES = ('SELECT', 'WITH', 'INSERT', 'UPDATE', 'DELETE')
+
+def sql_fingerprint(query: Any) -> str:
+    '''
+    Нормализует текст запроса: схлопывает пробелы, заменяет литералы и плейсхолдеры на ?,
+    а списки VALUES - на (...), чтобы одинаковые запросы с разными параметрами совпадали
+    '''
+    text = query.decode(errors='replace') if isinstance(query, bytes) else str(query)
+    text = SQL_LITERAL_PATTERN.sub('?', ' '.join(text.split()))
+    return collapse_values_list(text)
+
+def collapse_values_list(text: str) -> str:
+    '''
+    Оставляет в VALUES первый кортеж, остальные заменяет на ", ..." - пачка из execute_values
+    дает один отпечаток при любом числе строк
+    '''
+    start = text.find(' VALUES (')
+    if start < 0:
+        return text
+    position = start + len(' VALUES ')
+    tuples = []
+    while text.startswith('(', position):
+        depth = 0
+        for end in range(position, len(text)):
+            depth += {'(': 1, ')': -1}.get(text[end], 0)
+            if depth == 0:
+                break
+        tuples.append(text[position:end + 1])
+        position = end + 1
+        if not text.startswith(',', position):
+            break
+        position += 2 if text.startswith(', ', position) else 1
+    if len(tuples) < 2:
+        return text
+    return text[:start + len(' VALUES ')] + tuples[0] + ', ...' + text[position:]
+
+def describe_query(query: Any) -> Dict[str, str]:
+    fingerprint = sql_fingerprint(query)
+    return {
+        'fingerprint': hashlib.md5(fingerprint.encode()).hexdigest()[:12],
+        'sql': fingerprint[:SQL_LOG_MAX_LENGTH]
+    }
+
+class RequestTrace:
+    '''
+    Замеры одного вызова: время по фазам (connect, execute, fetch, serialise) и выполненные запросы.
+    В лог попадает выборочно с долей REQUEST_LOG_SAMPLE_RATE, а также всегда при ошибке
+    или медленном запросе
+    '''
+
+    def __init__(self, context: Any, method: str):
+        self.request_id = getattr(context, 'request_id', None)
+        self.function = getattr(context, 'function_name', None)
+        self.method = method
+        self.started = time.perf_counter()
+        self.phases: Dict[str, float] = {'connect': 0.0, 'execute': 0.0, 'fetch': 0.0, 'serialise': 0.0}
+        self.queries: List[Tuple[Any, float, int]] = []
+        self.sampled = random.random() < REQUEST_LOG_SAMPLE_RATE
+        self.slow_queries = 0
+
+    def add(self, phase: str, started: float) -> None:
+        self.phases[phase] += time.perf_counter() - started
+
+    def emit(self, status_code: int, error: Optional[BaseException] = None) -> None:
+        if not (self.sampled or self.slow_queries or error is not None):
+            return
+        fields: Dict[str, Any] = {
+            'request_id': self.request_id,
+            'function': self.function,
+            'method': self.method,
+            'status': status_code,
+            'total_ms': round((time.perf_counter() - self.started) * 1000, 3),
+            'phases_ms': {phase: round(seconds * 1000, 3) for phase, seconds in self.phases.items()},
+            'queries': [
+                {**describe_query(query), 'ms': round(seconds * 1000, 3), 'rows': rows}
+                for query, seconds, rows in self.queries
+            ],
+            'sampled': self.sampled
+        }
+        if error is not None:
+            fields['error'] = f'{type(error).__name__}: {error}'
+        log_event('request', **fields)
+
+current_trace: ContextVar[Optional[RequestTrace]] = ContextVar('current_trace', default=None)
+
+def explain_query(cursor) -> Optional[str]:
+    '''
+    План только что выполненного запроса. EXPLAIN без ANALYZE не выполняет запрос повторно;
+    идет отдельным курсором под точкой сохранения, чтобы не сбить результат и транзакцию маршрута
+    '''
+    query = cursor.query
+    conn = cursor.connection
+    if not query or conn.get_transaction_status() != psycopg2.extensions.TRANSACTION_STATUS_INTRANS:
+        return None
+    if not query.lstrip().upper().startswith(tuple(prefix.encode() for prefix in SQL_EXPLAINABLE_PREFIXES)):
+        return None
+    with conn.cursor(cursor_factory=psycopg2.extensions.cursor) as explain_cursor:
+        explain_cursor.execute('SAVEPOINT slow_query_explain')
+        try:
+            explain_cursor.execute(b'EXPLAIN ' + query)
+            plan = '\n'.join(row[0] for row in explain_cursor.fetchall())
+        except psycopg2.Error:
+            explain_cursor.execute('ROLLBACK TO SAVEPOINT slow_query_explain')
+            plan = None
+        explain_cursor.execute('RELEASE SAVEPOINT slow_query_explain')
+    return plan
+
+class TracedCursor(RealDictCursor):
+    '''
+    Курсор пула: время выполнения и выборки, число строк по каждому запросу текущего вызова
+    и журнал запросов дольше SLOW_QUERY_MS
+    '''
+
+    def execute(self, query, vars=None):
+        started = time.perf_counter()
+        try:
+            return super().execute(query, vars)
+        finally:
+            elapsed = time.perf_counter() - started
+            trace = current_trace.get()
+            if trace is not None:
+                trace.phases['execute'] += elapsed
+                trace.queries.append((query, elapsed, self.rowcount))
+            if elapsed * 1000 >= SLOW_QUERY_MS:
+                self._log_slow(query, elapsed, trace)
+
+    def _log_slow(self, query: Any, elapsed: float, trace: Optional[RequestTrace]) -> None:
+        if trace is not None:
+            trace.slow_queries += 1
+        log_event(
+            'slow_query',
+            request_id=trace.request_id if trace else None,
+            function=trace.function if trace else None,
+            ms=round(elapsed * 1000, 3),
+            rows=self.rowcount,
+            plan=explain_query(self) if SLOW_QUERY_EXPLAIN else None,
+            **describe_query(query)
+        )
+
+    def fetchone(self):
+        started = time.perf_counter()
+        try:
+            return super().fetchone()
+        finally:
+            self._add_fetch(started)
+
+    def fetchmany(self, size=None):
+        started = time.perf_counter()
+        try:
+            return super().fetchmany(size)
+        finally:
+            self._add_fetch(started)
+
+    def fetchall(self):
+        started = time.perf_counter()
+        try:
+            return super().fetchall()
+        finally:
+            self._add_fetch(started)
+
+    def _add_fetch(self, started: float) -> None:
+        trace = current_trace.get()
+        if trace is not None:
+            trace.add('fetch', started)
+
+db_pool = create_db_pool(os.environ.get('DATABASE_URL'), TracedCursor)
+
+def get_db_connection():
+    '''
+    Выдает соединение с PostgreSQL из общего пула и возвращает его обратно
+    Returns: контекстный менеджер с соединением с БД
+    '''
+    return db_pool.connection()
+
+replica_set = ReplicaSet(
+    DATABASE_REPLICA_URLS,
+    DB_REPLICA_MAX_LAG_SECONDS,
+    DB_REPLICA_CHECK_SECONDS,
+    DB_REPLICA_RETRY_SECONDS
+) if DATABASE_REPLICA_URLS else None
+
+def row_serializer(fields: Dict[str, str], converters: Optional[Dict[str, Callable[[Any], Any]]] = None) -> Callable[[Dict[str, Any]], Dict[str, Any]]:
+    '''
+    Собирает сериализатор строк одного запроса: соответствие {ключ ответа: колонка} компилируется
+    один раз в функцию с литералом dict вместо цикла по полям для каждой строки
+    Returns: функция row -> dict для ответа
+    '''
+    converters = converters or {}
+    namespace: Dict[str, Any] = {}
+    items = []
+    for index, (key, column) in enumerate(fields.items()):
+        expression = f'row[{column!r}]'
+        if key in converters:
+            namespace[f'convert_{index}'] = converters[key]
+            expression = f'convert_{index}({expression})'
+        items.append(f'{key!r}: {expression}')
+    return eval('lambda row: {' + ', '.join(items) + '}', namespace)
+
+class HttpError(Exception):
+    '''
+    Ошибка запроса, которую dispatch превращает в ответ {"error": message} с нужным статусом
+    '''
+
+    def __init__(self, status_code: int, message: str):
+        super().__init__(message)
+        self.status_code = status_code
+        self.message = message
+
+class Request:
+    '''
+    Вызов функции: параметры, тело, заголовки ответа и соединение с БД, выданное маршруту
+    '''
+
+    def __init__(self, event: Dict[str, Any], context: Any):
+        self.event = event
+        self.context = context
+        self.method: str = event.get('httpMethod', 'GET')
+        self.params: Dict[str, Any] = event.get('queryStringParameters') or {}
+        self.headers: Dict[str, str] = dict(RESPONSE_HEADERS)
+        self.conn = None
+        self.cursor = None
+        self.db_route: Optional[str] = None
+        self.trace = RequestTrace(context, self.method)
+        self._json: Optional[Dict[str, Any]] = None
+        self.defer_commit = False
+        self.after_commit: List[Callable[[], None]] = []
+
+    @property
+    def json(self) -> Dict[str, Any]:
+        if self._json is None:
+            try:
+                value = loads(self.event.get('body'))
+            except ValueError:
+                raise HttpError(400, 'Invalid JSON body')
+            if not isinstance(value, dict):
+                raise HttpError(400, 'JSON object expected')
+            self._json = value
+        return self._json
+
+    def header(self, name: str) -> Optional[str]:
+        '''
+        Заголовок запроса без учета регистра
+        '''
+        name = name.lower()
+        for key, value in (self.event.get('headers') or {}).items():
+            if key.lower() == name:
+                return value
+        return None
+
+    def has_secret(self, name: str, secret: Optional[str]) -> bool:
+        '''
+        Сверяет заголовок с секретом за постоянное время. Без настроенного секрета запрос не проходит
+        '''
+        token = self.header(name)
+        if not secret or not isinstance(token, str):
+            return False
+        return hmac.compare_digest(token.encode(), secret.encode())
+
+    def read_after(self) -> Optional[int]:
+        '''
+        Позиция WAL последней записи клиента из заголовка X-Db-Lsn
+        Returns: позиция числом или None, если заголовка нет
+        '''
+        value = self.header(DB_LSN_HEADER)
+        if not value:
+            return None
+        try:
+            return parse_lsn(value.strip())
+        except ValueError:
+            raise HttpError(400, f'Invalid {DB_LSN_HEADER} header')
+
+    @contextmanager
+    def database(self):
+        '''
+        Соединение для маршрута: GET при заданных DATABASE_REPLICA_URLS читает с реплики,
+        остальные методы и чтения, которые реплики еще не догнали, - с основного сервера.
+        X-Db-Lsn проверяется и без реплик, чтобы клиент получал одинаковый ответ на испорченную позицию
+        '''
+        started = time.perf_counter()
+        pool = db_pool
+        if self.method == 'GET':
+            read_after = self.read_after()
+            if replica_set is not None:
+                pool = replica_set.choose(read_after) or db_pool
+        with pool.connection() as conn, conn.cursor() as cursor:
+            self.trace.add('connect', started)
+            self.db_route = 'primary' if pool is db_pool else 'replica'
+            self.headers['X-Db-Pool'] = pool.describe()
+            if replica_set is not None:
+                self.headers['X-Db-Route'] = f'{self.db_route} {replica_set.describe()}'
+            self.conn, self.cursor = conn, cursor
+            yield cursor
+
+    def commit(self, after: Optional[Callable[[], None]] = None) -> None:
+        '''
+        Фиксирует изменения маршрута; after выполняется после фиксации (например, сброс кэша).
+        Под Idempotency-Key фиксация откладывается до сохранения ответа, чтобы ключ, изменения
+        и ответ записались одной транзакцией
+        '''
+        if after is not None:
+            self.after_commit.append(after)
+        if not self.defer_commit:
+            self.conn.commit()
+            self.run_after_commit()
+
+    def run_after_commit(self) -> None:
+        callbacks, self.after_commit = self.after_commit, []
+        for callback in callbacks:
+            callback()
+
+    def write_lsn(self) -> str:
+        '''
+        Позиция WAL после зафиксированной записи; клиент возвращает ее в X-Db-Lsn при чтениях
+        '''
+        with self.conn.cursor(cursor_factory=psycopg2.extensions.cursor) as cursor:
+            cursor.execute('SELECT pg_current_wal_insert_lsn()::TEXT')
+            return cursor.fetchone()[0]
+
+    def encode(self, value: Any) -> str:
+        '''
+        Сериализует тело ответа, засчитывая время в фазу serialise
+        '''
+        started = time.perf_counter()
+        body = dumps(value)
+        self.trace.add('serialise', started)
+        return body
+
+    def respond(self, status_code: int, body: Any, headers: Optional[Dict[str, str]] = None) -> Dict[str, Any]:
+        '''
+        Собирает ответ; строковое тело считается уже сериализованным JSON
+        '''
+        return {
+            'statusCode': status_code,
+            'headers': {**self.headers, **headers} if headers else self.headers,
+            'body': body if isinstance(body, str) else self.encode(body),
+            'isBase64Encoded': False
+        }
+
+ROUTES: Dict[str, Tuple[Callable[[Request], Dict[str, Any]], bool]] = {}
+
+IDEMPOTENT_METHODS = ('POST', 'PUT')
+
+CLAIM_IDEMPOTENCY_KEY_QUERY = '''
+    INSERT INTO idempotency_keys AS k (scope, idempotency_key, request_hash, expires_at)
+    VALUES (%(scope)s, %(key)s, %(request_hash)s, CURRENT_TIMESTAMP + make_interval(secs => %(ttl)s))
+    ON CONFLICT (scope, idempotency_key) DO UPDATE SET
+        request_hash = EXCLUDED.request_hash,
+        status_code = NULL,
+        response_body = NULL,
+        created_at = CURRENT_TIMESTAMP,
+        expires_at = EXCLUDED.expires_at
+    WHERE k.expires_at <= CURRENT_TIMESTAMP
+    RETURNING 1
+'''
+
+STORED_IDEMPOTENT_RESPONSE_QUERY = '''
+    SELECT request_hash, status_code, response_body
+    FROM idempotency_keys
+    WHERE scope = %(scope)s AND idempotency_key = %(key)s
+'''
+
+# Ответ пишется вставкой: маршрут мог откатить транзакцию вместе с занятым ключом (rollback перед ошибкой)
+SAVE_IDEMPOTENT_RESPONSE_QUERY = '''
+    INSERT INTO idempotency_keys AS k (scope, idempotency_key, request_hash, status_code, response_body, expires_at)
+    VALUES (%(scope)s, %(key)s, %(request_hash)s, %(status_code)s, %(response_body)s,
+            CURRENT_TIMESTAMP + make_interval(secs => %(ttl)s))
+    ON CONFLICT (scope, idempotency_key) DO UPDATE SET
+        status_code = EXCLUDED.status_code,
+        response_body = EXCLUDED.response_body
+    WHERE k.request_hash = EXCLUDED.request_hash AND k.response_body IS NULL
+'''
+
+def request_hash(request: Request) -> str:
+    raw = '\n'.join((
+        request.method,
+        dumps(sorted(request.params.items())),
+        dumps(sorted((request.event.get('pathParams') or {}).items())),
+        request.event.get('body') or ''
+    ))
+    return hashlib.md5(raw.encode()).hexdigest()
+
+def run_route(fn: Callable[[Request], Dict[str, Any]], request: Request) -> Dict[str, Any]:
+    try:
+        return fn(request)
+    except HttpError as e:
+        return request.respond(e.status_code, {'error': e.message})
+
+def run_idempotent_route(fn: Callable[[Request], Dict[str, Any]], request: Request) -> Dict[str, Any]:
+    '''
+    Выполняет записывающий маршрут с заголовком Idempotency-Key не больше одного раза за IDEMPOTENCY_KEY_TTL_SECONDS.
+    Ключ занимается, а ответ сохраняется в той же транзакции, что и изменения маршрута: request.commit()
+    откладывает фиксацию до записи ответа, так что ключ без ответа не переживает сбой между ними.
+    Параллельный повтор ждет на уникальном индексе; повторам ответ отдается с заголовком Idempotent-Replayed.
+    '''
+    key = request.header('Idempotency-Key')
+    if not key:
+        return run_route(fn, request)
+    if len(key) > IDEMPOTENCY_KEY_MAX_LENGTH:
+        raise HttpError(400, 'Idempotency-Key is too long')
+    
+    key_params = {'scope': fn.__name__, 'key': key, 'request_hash': request_hash(request),
+                  'ttl': IDEMPOTENCY_KEY_TTL_SECONDS}
+    request.cursor.execute(CLAIM_IDEMPOTENCY_KEY_QUERY, key_params)
+    if request.cursor.fetchone() is None:
+        request.cursor.execute(STORED_IDEMPOTENT_RESPONSE_QUERY, key_params)
+        stored = request.cursor.fetchone()
+        request.conn.rollback()
+        if stored is None:
+            raise HttpError(409, 'Request with this Idempotency-Key is in progress, retry later')
+        if stored['request_hash'] != key_params['request_hash']:
+            raise HttpError(422, 'Idempotency-Key was already used with a different request')
+        if stored['response_body'] is None:
+            raise HttpError(409, 'Request with this Idempotency-Key is in progress, retry later')
+        return request.respond(stored['status_code'], stored['response_body'], {'Idempotent-Replayed': 'true'})
+    
+    request.defer_commit = True
+    try:
+        response = run_route(fn, request)
+    finally:
+        request.defer_commit = False
+    if response['statusCode'] >= 500:
+        request.conn.rollback()
+        request.after_commit = []
+        return response
+    request.cursor.execute(SAVE_IDEMPOTENT_RESPONSE_QUERY, {
+        **key_params, 'status_code': response['statusCode'], 'response_body': response['body']
+    })
+    request.commit()
+    return response
+
+def route(method: str, uses_db: bool = True):
+    '''
+    Регистрирует обработчик HTTP-метода. При uses_db=False соединение из пула берет сам обработчик
+    через request.database(), например после проверки кэша
+    '''
+    def register(fn: Callable[[Request], Dict[str, Any]]) -> Callable[[Request], Dict[str, Any]]:
+        ROUTES[method] = (fn, uses_db)
+        return fn
+    return register
+
+def dispatch(event: Dict[str, Any], context: Any, allow_methods: str) -> Dict[str, Any]:
+    '''
+    Общий вход: CORS preflight, выбор маршрута, соединение с БД, ключи идемпотентности записей,
+    единая обработка ошибок и запись замеров вызова в лог
+    Returns: HTTP response dict
+    '''
+    method: str = event.get('httpMethod', 'GET')
+    if method == 'OPTIONS':
+        return options_response(allow_methods)
+
+    request = Request(event, context)
+    entry = ROUTES.get(method)
+    if entry is None:
+        return request.respond(405, {'error': 'Method not allowed'})
+    fn, uses_db = entry
+
+    error = None
+    token = current_trace.set(request.trace)
+    try:
+        if not uses_db:
+            response = run_route(fn, request)
+        else:
+            with request.database():
+                if method in IDEMPOTENT_METHODS:
+                    response = run_idempotent_route(fn, request)
+                else:
+                    response = run_route(fn, request)
+                if replica_set is not None and method != 'GET' and response['statusCode'] < 400:
+                    response['headers'] = {**response['headers'], DB_LSN_HEADER: request.write_lsn()}
+    except HttpError as e:
+        response = request.respond(e.status_code, {'error': e.message})
+    except Exception as e:
+        error = e
+        response = request.respond(500, {'error': str(e)})
+    finally:
+        current_trace.reset(token)
+    request.trace.emit(response['statusCode'], error)
+    return response
+
+EVALUATE_ACHIEVEMENTS_QUERY = '''
+    SELECT a.id::text AS id, a.title, a.description, a.icon
+    FROM evaluate_user_achievements(%s::integer[]) e
+    JOIN achievements a ON a.id = e.achievement_id
+    WHERE e.newly_unlocked
+    ORDER BY a.id
+'''
+
+def evaluate_achievements(cursor, user_ids: List[int]) -> List[Dict[str, Any]]:
+    '''
+    Пересчитывает достижения пользователей по их текущей статистике
+    Returns: список впервые открытых достижений
+    '''
+    cursor.execute(EVALUATE_ACHIEVEMENTS_QUERY, (list(user_ids),))
+    return cursor.fetchall()
+
+def make_etag(*parts: Any) -> str:
+    return '"' + hashlib.sha1('|'.join(str(part) for part in parts).encode()).hexdigest()[:20] + '"'
+
+def etag_matches(request: Request, etag: str) -> bool:
+    if_none_match = request.header('If-None-Match')
+    if not if_none_match:
+        return False
+    candidates = [candidate.strip().removeprefix('W/') for candidate in if_none_match.split(',')]
+    return '*' in candidates or etag in candidates
+
+def not_modified(headers: Dict[str, str], etag: str) -> Dict[str, Any]:
+    return {
+        'statusCode': 304,
+        'headers': {**headers, 'ETag': etag, 'Cache-Control': 'private, no-cache'},
+        'body': '',
+        'isBase64Encoded': False
+    }
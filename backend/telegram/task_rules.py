@@ -0,0 +1,83 @@
+# Копия backend/shared/task_rules.py: правки вносятся там, затем python backend/shared/sync.py
+'''
+Правила заданий, общие для функций tasks, telegram и scheduler: разбор интервала напоминаний и завершение
+задания с начислением XP владельцу. Копируется в каталоги функций командой python backend/shared/sync.py
+'''
+import os
+import re
+from typing import Any, Dict, Optional
+
+TASK_COMPLETION_XP = int(os.environ.get('TASK_COMPLETION_XP', '25'))
+
+# Пределы колонок tasks: title VARCHAR(500), interval VARCHAR(100), remind_every_seconds INTEGER
+TASK_TITLE_MAX_LENGTH = 500
+TASK_INTERVAL_MAX_LENGTH = 100
+INTERVAL_MAX_SECONDS = 2 ** 31 - 1
+
+INTERVAL_UNIT_SECONDS = {
+    'm': 60, 'min': 60, 'mins': 60, 'minute': 60, 'minutes': 60,
+    'h': 3600, 'hour': 3600, 'hours': 3600,
+    'd': 86400, 'day': 86400, 'days': 86400,
+    'w': 604800, 'week': 604800, 'weeks': 604800
+}
+INTERVAL_ALIASES = {'hourly': 3600, 'daily': 86400, 'weekly': 604800}
+INTERVAL_PATTERN = re.compile(r'^(\d+)\s*([a-z]+)$')
+
+def parse_interval(value: Optional[str]) -> Optional[int]:
+    '''
+    Переводит строку интервала ("30min", "1hour", "2hours", "daily") в секунды
+    Returns: длительность в секундах или None, если интервал не распознан или не помещается в tasks
+    '''
+    if not isinstance(value, str) or not value or len(value) > TASK_INTERVAL_MAX_LENGTH:
+        return None
+    normalized = value.strip().lower()
+    if normalized in INTERVAL_ALIASES:
+        return INTERVAL_ALIASES[normalized]
+    match = INTERVAL_PATTERN.match(normalized)
+    if not match or match.group(2) not in INTERVAL_UNIT_SECONDS:
+        return None
+    seconds = int(match.group(1)) * INTERVAL_UNIT_SECONDS[match.group(2)]
+    return seconds if 0 < seconds <= INTERVAL_MAX_SECONDS else None
+
+# Задание завершается, а XP, уровень и серия владельца меняются одним запросом.
+# owner_id ограничивает завершение заданиями этого пользователя (команды бота), NULL - любым
+COMPLETE_TASK_QUERY = '''
+    WITH completed_task AS (
+        UPDATE tasks
+        SET status = 'completed', completed_at = CURRENT_TIMESTAMP
+        WHERE id = %(task_id)s AND status <> 'completed'
+          AND (%(owner_id)s::INTEGER IS NULL OR user_id = %(owner_id)s::INTEGER)
+        RETURNING id, user_id, title, status, completed_at
+    ),
+    previous_user AS (
+        SELECT u.id, u.level
+        FROM users u
+        JOIN completed_task ct ON ct.user_id = u.id
+        FOR UPDATE OF u
+    ),
+    updated_user AS (
+        UPDATE users u
+        SET xp = u.xp + %(xp)s,
+            total_completed = u.total_completed + 1,
+            level = GREATEST(u.level, level_for_xp(u.xp + %(xp)s)),
+            streak = next_streak(u.streak, u.last_completed_on, user_local_date(ct.completed_at, u.timezone)),
+            last_completed_on = GREATEST(u.last_completed_on, user_local_date(ct.completed_at, u.timezone))
+        FROM completed_task ct
+        JOIN previous_user pu ON pu.id = ct.user_id
+        WHERE u.id = ct.user_id
+        RETURNING u.id, u.telegram_id, u.username, u.level, u.xp, u.total_completed, u.streak, u.created_at,
+                  u.level - pu.level AS levels_gained
+    )
+    SELECT
+        (SELECT row_to_json(ct) FROM completed_task ct) AS task,
+        (SELECT row_to_json(uu) FROM updated_user uu) AS "user"
+'''
+
+def complete_task(cursor, task_id: Any, owner_id: Optional[int] = None) -> Dict[str, Any]:
+    '''
+    Завершает активное задание и начисляет TASK_COMPLETION_XP владельцу в открытой транзакции
+    Returns: dict с task и user; task равен None, если задание не найдено или уже выполнено,
+             user - если у задания нет владельца
+    '''
+    cursor.execute(COMPLETE_TASK_QUERY, {'task_id': task_id, 'owner_id': owner_id, 'xp': TASK_COMPLETION_XP})
+    return cursor.fetchone()
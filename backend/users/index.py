@@ -1,17 +1,354 @@
-import json
+import bisect
 import os
-from typing import Dict, Any
-from datetime import datetime
-import psycopg2
-from psycopg2.extras import RealDictCursor
+import threading
+import time
+from typing import Dict, Any, Optional, List, Tuple
+from cache_layer import invalidate_user_achievements
+from request_layer import (
+    HttpError, Request, dispatch, etag_matches, evaluate_achievements, make_etag, not_modified, route,
+    row_serializer
+)
 
-def get_db_connection():
+ALLOWED_METHODS = 'GET, POST, PUT, OPTIONS'
+
+def is_valid_timezone(cursor, name: Any) -> bool:
+    '''
+    Проверяет, что PostgreSQL знает часовой пояс (например, Europe/Moscow)
+    '''
+    if not isinstance(name, str) or not name:
+        return False
+    cursor.execute('SELECT EXISTS (SELECT 1 FROM pg_timezone_names WHERE name = %s) AS known', (name,))
+    return cursor.fetchone()['known']
+
+APPLY_XP_QUERY = '''
+    WITH previous AS (
+        SELECT id, level FROM users WHERE id = %(user_id)s FOR UPDATE
+    )
+    UPDATE users u
+    SET xp = u.xp + %(xp)s,
+        level = GREATEST(u.level, level_for_xp(u.xp + %(xp)s)),
+        total_completed = u.total_completed + CASE WHEN %(complete_task)s THEN 1 ELSE 0 END,
+        streak = CASE WHEN %(complete_task)s
+                      THEN next_streak(u.streak, u.last_completed_on, user_local_date(now() AT TIME ZONE 'UTC', u.timezone))
+                      ELSE u.streak END,
+        last_completed_on = CASE WHEN %(complete_task)s
+                                 THEN GREATEST(u.last_completed_on, user_local_date(now() AT TIME ZONE 'UTC', u.timezone))
+                                 ELSE u.last_completed_on END
+    FROM previous p
+    WHERE u.id = p.id
+    RETURNING u.id, u.telegram_id, u.username, u.level, u.xp, u.total_completed, u.streak,
+              u.level - p.level AS levels_gained
+'''
+
+LEADERBOARD_METRICS = ('xp', 'level', 'total_completed')
+LEADERBOARD_REFRESH_SECONDS = float(os.environ.get('LEADERBOARD_REFRESH_SECONDS', '5'))
+LEADERBOARD_RESYNC_SECONDS = float(os.environ.get('LEADERBOARD_RESYNC_SECONDS', '3600'))
+LEADERBOARD_CHANGES_OVERLAP_SECONDS = int(os.environ.get('LEADERBOARD_CHANGES_OVERLAP_SECONDS', '60'))
+LEADERBOARD_DEFAULT_LIMIT = 10
+LEADERBOARD_MAX_LIMIT = 100
+LEADERBOARD_DEFAULT_WINDOW = 5
+LEADERBOARD_MAX_WINDOW = 50
+
+class Leaderboard:
+    '''
+    Рейтинг по одной метрике: отсортированный список ключей (-значение, id) и значения по id.
+    Место пользователя и окно вокруг него ищутся бинарным поиском, равные значения делят место.
+    '''
+
+    def __init__(self, rows: List[Tuple[int, Optional[int]]]):
+        self.values = {user_id: value or 0 for user_id, value in rows}
+        self.keys = sorted((-value, user_id) for user_id, value in self.values.items())
+
+    def __len__(self) -> int:
+        return len(self.keys)
+
+    def rank_at(self, position: int) -> int:
+        return bisect.bisect_left(self.keys, (self.keys[position][0],)) + 1
+
+    def position_of(self, user_id: int) -> Optional[int]:
+        value = self.values.get(user_id)
+        if value is None:
+            return None
+        return bisect.bisect_left(self.keys, (-value, user_id))
+
+    def entries(self, start: int, stop: int) -> List[Tuple[int, int, int]]:
+        '''
+        Returns: список (место, id пользователя, значение) для позиций [start, stop)
+        '''
+        start = max(start, 0)
+        stop = min(stop, len(self.keys))
+        return [(self.rank_at(position), self.keys[position][1], -self.keys[position][0]) for position in range(start, stop)]
+
+    def update(self, user_id: int, value: Optional[int]) -> None:
+        position = self.position_of(user_id)
+        if position is not None:
+            del self.keys[position]
+        self.values[user_id] = value or 0
+        bisect.insort(self.keys, (-(value or 0), user_id))
+
+LEADERBOARD_SNAPSHOT_QUERY = '''
+    SELECT id, xp, level, total_completed, CURRENT_TIMESTAMP::TIMESTAMP AS polled_at FROM users
+'''
+
+# updated_at ставится временем начала пишущей транзакции, поэтому изменения читаются с запасом overlap:
+# транзакция, начатая до прошлого опроса и зафиксированная после него, не теряется
+LEADERBOARD_CHANGES_QUERY = '''
+    SELECT id, xp, level, total_completed, CURRENT_TIMESTAMP::TIMESTAMP AS polled_at
+    FROM users
+    WHERE updated_at > %(since)s::TIMESTAMP - make_interval(secs => %(overlap)s)
+'''
+
+class LeaderboardCache:
+    '''
+    Рейтинги экземпляра функции: снимок из покрывающего индекса users раз в resync_seconds, между снимками
+    раз в refresh_seconds - строки, измененные после прошлого опроса (XP из users, tasks и бота), которые
+    переносятся на новые места бинарным поиском. PUT этого экземпляра применяется сразу.
+    '''
+
+    def __init__(self, refresh_seconds: float, resync_seconds: float, overlap_seconds: int):
+        self.refresh_seconds = refresh_seconds
+        self.resync_seconds = resync_seconds
+        self.overlap_seconds = overlap_seconds
+        self.boards: Dict[str, Leaderboard] = {}
+        self.loaded_at: Optional[float] = None
+        self.polled_at: Optional[float] = None
+        self.polled_db_time = None
+        self.lock = threading.Lock()
+
+    def refresh(self, cursor) -> None:
+        now = time.monotonic()
+        if self.loaded_at is None or now - self.loaded_at >= self.resync_seconds:
+            cursor.execute(LEADERBOARD_SNAPSHOT_QUERY)
+            rows = cursor.fetchall()
+            self.boards = {metric: Leaderboard([(row['id'], row[metric]) for row in rows])
+                           for metric in LEADERBOARD_METRICS}
+            self.loaded_at = now
+        else:
+            cursor.execute(LEADERBOARD_CHANGES_QUERY, {'since': self.polled_db_time, 'overlap': self.overlap_seconds})
+            rows = cursor.fetchall()
+            for row in rows:
+                for metric, board in self.boards.items():
+                    board.update(row['id'], row[metric])
+        if rows:
+            self.polled_db_time = rows[0]['polled_at']
+        elif self.polled_db_time is None:
+            cursor.execute('SELECT CURRENT_TIMESTAMP::TIMESTAMP AS polled_at')
+            self.polled_db_time = cursor.fetchone()['polled_at']
+        self.polled_at = now
+
+    def lookup(self, cursor, metric: str, limit: int, user_id: Optional[int], window: int) -> Dict[str, Any]:
+        '''
+        Верх рейтинга и, если передан user_id, место пользователя с окном из window соседей с каждой стороны.
+        Пользователь, появившийся после снимка, добавляется в рейтинги точечным чтением по id.
+        Returns: dict с total, top и при наличии пользователя me (место или None) и around
+        '''
+        with self.lock:
+            if self.polled_at is None or time.monotonic() - self.polled_at >= self.refresh_seconds:
+                self.refresh(cursor)
+            board = self.boards[metric]
+            result: Dict[str, Any] = {'total': len(board), 'top': board.entries(0, limit)}
+            if user_id is not None:
+                position = board.position_of(user_id)
+                if position is None:
+                    cursor.execute('SELECT id, xp, level, total_completed FROM users WHERE id = %s', (user_id,))
+                    user = cursor.fetchone()
+                    if user is not None:
+                        for metric_name, metric_board in self.boards.items():
+                            metric_board.update(user['id'], user[metric_name])
+                        result['total'] = len(board)
+                        position = board.position_of(user_id)
+                result['me'] = board.rank_at(position) if position is not None else None
+                result['around'] = board.entries(position - window, position + window + 1) if position is not None else []
+            return result
+
+    def apply(self, user: Dict[str, Any]) -> None:
+        '''
+        Переносит пользователя на новое место во всех загруженных рейтингах
+        '''
+        with self.lock:
+            for metric, board in self.boards.items():
+                board.update(user['id'], user[metric])
+
+leaderboards = LeaderboardCache(LEADERBOARD_REFRESH_SECONDS, LEADERBOARD_RESYNC_SECONDS,
+                                LEADERBOARD_CHANGES_OVERLAP_SECONDS)
+
+serialize_leaderboard_user = row_serializer({
+    'userId': 'id',
+    'username': 'username',
+    'level': 'level',
+    'xp': 'xp',
+    'totalCompleted': 'total_completed'
+})
+
+def load_leaderboard_entries(cursor, ranked: List[Tuple[int, int, int]]) -> List[Dict[str, Any]]:
+    '''
+    Дополняет места из рейтинга данными пользователей, читая только нужные строки по первичному ключу
+    '''
+    if not ranked:
+        return []
+    cursor.execute(
+        'SELECT id, username, level, xp, total_completed FROM users WHERE id = ANY(%s)',
+        ([user_id for _, user_id, _ in ranked],)
+    )
+    users = {row['id']: row for row in cursor.fetchall()}
+    return [
+        {'rank': rank, **serialize_leaderboard_user(users[user_id]), 'value': value}
+        for rank, user_id, value in ranked if user_id in users
+    ]
+
+serialize_user = row_serializer({
+    'id': 'id',
+    'telegram_id': 'telegram_id',
+    'username': 'username',
+    'level': 'level',
+    'xp': 'xp',
+    'totalCompleted': 'total_completed',
+    'streak': 'streak',
+    'timezone': 'timezone',
+    'createdAt': 'created_at'
+})
+
+BOOTSTRAP_TASKS_LIMIT = int(os.environ.get('BOOTSTRAP_TASKS_LIMIT', '50'))
+BOOTSTRAP_STATS_DAYS = 7
+
+BOOTSTRAP_QUERY = 'SELECT user_bootstrap(%(telegram_id)s, %(limit)s, %(days)s) AS payload'
+
+def get_bootstrap(request: Request) -> Dict[str, Any]:
+    '''
+    Все данные для первого экрана WebApp за один вызов: пользователь по telegram_id, первая страница
+    активных заданий, достижения с прогрессом и сводка счетчиков. Функция user_bootstrap собирает готовый
+    JSON на стороне PostgreSQL за один запрос, поэтому ответ не сериализуется повторно
     '''
-    Создает подключение к базе данных PostgreSQL
-    Returns: соединение с БД
+    telegram_id = request.params.get('telegram_id')
+    if not telegram_id:
+        raise HttpError(400, 'telegram_id is required')
+    
+    request.cursor.execute(BOOTSTRAP_QUERY, {
+        'telegram_id': telegram_id, 'limit': BOOTSTRAP_TASKS_LIMIT, 'days': BOOTSTRAP_STATS_DAYS
+    })
+    payload = request.cursor.fetchone()['payload']
+    if payload is None:
+        raise HttpError(404, 'User not found')
+    
+    return request.respond(200, payload, {'Cache-Control': 'private, no-cache'})
+
+@route('GET')
+def get_user(request: Request) -> Dict[str, Any]:
+    params = request.params
+    cursor = request.cursor
+    
+    if params.get('view') == 'leaderboard':
+        return get_leaderboard(request)
+    if params.get('view') == 'bootstrap':
+        return get_bootstrap(request)
+    
+    telegram_id = params.get('telegram_id')
+    if not telegram_id:
+        raise HttpError(400, 'telegram_id is required')
+    
+    query = '''
+        SELECT id, telegram_id, username, level, xp, total_completed, streak, timezone, created_at, updated_at
+        FROM users 
+        WHERE telegram_id = %s
+    '''
+    cursor.execute(query, (telegram_id,))
+    user = cursor.fetchone()
+    
+    if not user:
+        raise HttpError(404, 'User not found')
+    
+    etag = make_etag(user['id'], user['updated_at'])
+    if etag_matches(request, etag):
+        return not_modified(request.headers, etag)
+    
+    return request.respond(200, {'user': serialize_user(user)}, {'ETag': etag, 'Cache-Control': 'private, no-cache'})
+
+def get_leaderboard(request: Request) -> Dict[str, Any]:
+    params = request.params
+    cursor = request.cursor
+    
+    metric = params.get('by') or 'xp'
+    if metric not in LEADERBOARD_METRICS:
+        raise HttpError(400, f'by must be one of: {", ".join(LEADERBOARD_METRICS)}')
+    try:
+        limit = min(max(int(params.get('limit') or LEADERBOARD_DEFAULT_LIMIT), 1), LEADERBOARD_MAX_LIMIT)
+        window = min(max(int(params.get('window') or LEADERBOARD_DEFAULT_WINDOW), 0), LEADERBOARD_MAX_WINDOW)
+        user_id = int(params['user_id']) if params.get('user_id') else None
+    except (TypeError, ValueError):
+        raise HttpError(400, 'limit, window and user_id must be integers')
+    
+    ranking = leaderboards.lookup(cursor, metric, limit, user_id, window)
+    if user_id is not None and ranking['me'] is None:
+        raise HttpError(404, 'User not found')
+    
+    leaderboard = {
+        'by': metric,
+        'total': ranking['total'],
+        'top': load_leaderboard_entries(cursor, ranking['top'])
+    }
+    if user_id is not None:
+        leaderboard['me'] = {'userId': user_id, 'rank': ranking['me']}
+        leaderboard['around'] = load_leaderboard_entries(cursor, ranking['around'])
+    
+    return request.respond(200, {'leaderboard': leaderboard})
+
+@route('POST')
+def create_user(request: Request) -> Dict[str, Any]:
+    body_data = request.json
+    cursor = request.cursor
+    
+    telegram_id = body_data.get('telegram_id')
+    username = body_data.get('username')
+    timezone = body_data.get('timezone')
+    
+    if not telegram_id:
+        raise HttpError(400, 'telegram_id is required')
+    
+    if timezone is not None and not is_valid_timezone(cursor, timezone):
+        raise HttpError(400, 'Unknown timezone')
+    
+    query = '''
+        INSERT INTO users (telegram_id, username, timezone)
+        VALUES (%s, %s, COALESCE(%s, 'UTC'))
+        ON CONFLICT (telegram_id) DO UPDATE 
+        SET username = EXCLUDED.username,
+            timezone = COALESCE(%s, users.timezone)
+        RETURNING id, telegram_id, username, level, xp, total_completed, streak, timezone, created_at
     '''
-    database_url = os.environ.get('DATABASE_URL')
-    return psycopg2.connect(database_url, cursor_factory=RealDictCursor)
+    cursor.execute(query, (telegram_id, username, timezone, timezone))
+    user = cursor.fetchone()
+    request.commit()
+    
+    return request.respond(201, {'user': serialize_user(user)})
+
+@route('PUT')
+def update_user(request: Request) -> Dict[str, Any]:
+    body_data = request.json
+    cursor = request.cursor
+    
+    user_id = body_data.get('user_id')
+    xp_increment = body_data.get('xp_increment', 0)
+    complete_task = body_data.get('complete_task', False)
+    
+    if not user_id:
+        raise HttpError(400, 'user_id is required')
+    
+    cursor.execute(APPLY_XP_QUERY, {'user_id': user_id, 'xp': xp_increment, 'complete_task': bool(complete_task)})
+    user = cursor.fetchone()
+    
+    if not user:
+        raise HttpError(404, 'User not found')
+    
+    unlocked_achievements = evaluate_achievements(cursor, [user['id']])
+    request.commit(lambda: invalidate_user_achievements(user['id']))
+    leaderboards.apply(user)
+    levels_gained = user.pop('levels_gained')
+    
+    return request.respond(200, {
+        'user': dict(user),
+        'levelsGained': levels_gained,
+        'unlockedAchievements': unlocked_achievements
+    })
 
 def handler(event: Dict[str, Any], context: Any) -> Dict[str, Any]:
     '''
@@ -20,194 +357,4 @@ def handler(event: Dict[str, Any], context: Any) -> Dict[str, Any]:
           context - объект с атрибутами request_id, function_name
     Returns: HTTP response dict с данными пользователя
     '''
-    method: str = event.get('httpMethod', 'GET')
-    
-    if method == 'OPTIONS':
-        return {
-            'statusCode': 200,
-            'headers': {
-                'Access-Control-Allow-Origin': '*',
-                'Access-Control-Allow-Methods': 'GET, POST, PUT, OPTIONS',
-                'Access-Control-Allow-Headers': 'Content-Type, X-User-Id',
-                'Access-Control-Max-Age': '86400'
-            },
-            'body': '',
-            'isBase64Encoded': False
-        }
-    
-    headers = {
-        'Content-Type': 'application/json',
-        'Access-Control-Allow-Origin': '*'
-    }
-    
-    try:
-        conn = get_db_connection()
-        cursor = conn.cursor()
-        
-        if method == 'GET':
-            params = event.get('queryStringParameters', {}) or {}
-            telegram_id = params.get('telegram_id')
-            
-            if not telegram_id:
-                return {
-                    'statusCode': 400,
-                    'headers': headers,
-                    'body': json.dumps({'error': 'telegram_id is required'}),
-                    'isBase64Encoded': False
-                }
-            
-            query = '''
-                SELECT id, telegram_id, username, level, xp, total_completed, streak, created_at
-                FROM users 
-                WHERE telegram_id = %s
-            '''
-            cursor.execute(query, (telegram_id,))
-            user = cursor.fetchone()
-            
-            if not user:
-                cursor.close()
-                conn.close()
-                return {
-                    'statusCode': 404,
-                    'headers': headers,
-                    'body': json.dumps({'error': 'User not found'}),
-                    'isBase64Encoded': False
-                }
-            
-            user_data = {
-                'id': user['id'],
-                'telegram_id': user['telegram_id'],
-                'username': user['username'],
-                'level': user['level'],
-                'xp': user['xp'],
-                'totalCompleted': user['total_completed'],
-                'streak': user['streak'],
-                'createdAt': user['created_at'].isoformat() if user['created_at'] else None
-            }
-            
-            cursor.close()
-            conn.close()
-            
-            return {
-                'statusCode': 200,
-                'headers': headers,
-                'body': json.dumps({'user': user_data}),
-                'isBase64Encoded': False
-            }
-        
-        elif method == 'POST':
-            body_data = json.loads(event.get('body', '{}'))
-            
-            telegram_id = body_data.get('telegram_id')
-            username = body_data.get('username')
-            
-            if not telegram_id:
-                return {
-                    'statusCode': 400,
-                    'headers': headers,
-                    'body': json.dumps({'error': 'telegram_id is required'}),
-                    'isBase64Encoded': False
-                }
-            
-            query = '''
-                INSERT INTO users (telegram_id, username)
-                VALUES (%s, %s)
-                ON CONFLICT (telegram_id) DO UPDATE 
-                SET username = EXCLUDED.username
-                RETURNING id, telegram_id, username, level, xp, total_completed, streak, created_at
-            '''
-            cursor.execute(query, (telegram_id, username))
-            user = cursor.fetchone()
-            conn.commit()
-            
-            user_data = {
-                'id': user['id'],
-                'telegram_id': user['telegram_id'],
-                'username': user['username'],
-                'level': user['level'],
-                'xp': user['xp'],
-                'totalCompleted': user['total_completed'],
-                'streak': user['streak'],
-                'createdAt': user['created_at'].isoformat()
-            }
-            
-            cursor.close()
-            conn.close()
-            
-            return {
-                'statusCode': 201,
-                'headers': headers,
-                'body': json.dumps({'user': user_data}),
-                'isBase64Encoded': False
-            }
-        
-        elif method == 'PUT':
-            body_data = json.loads(event.get('body', '{}'))
-            
-            user_id = body_data.get('user_id')
-            xp_increment = body_data.get('xp_increment', 0)
-            complete_task = body_data.get('complete_task', False)
-            
-            if not user_id:
-                return {
-                    'statusCode': 400,
-                    'headers': headers,
-                    'body': json.dumps({'error': 'user_id is required'}),
-                    'isBase64Encoded': False
-                }
-            
-            if complete_task:
-                query = '''
-                    UPDATE users 
-                    SET xp = xp + %s, 
-                        total_completed = total_completed + 1,
-                        level = CASE WHEN (xp + %s) >= (level * 100) THEN level + 1 ELSE level END
-                    WHERE id = %s
-                    RETURNING id, telegram_id, username, level, xp, total_completed, streak
-                '''
-                cursor.execute(query, (xp_increment, xp_increment, user_id))
-            else:
-                query = '''
-                    UPDATE users 
-                    SET xp = xp + %s,
-                        level = CASE WHEN (xp + %s) >= (level * 100) THEN level + 1 ELSE level END
-                    WHERE id = %s
-                    RETURNING id, telegram_id, username, level, xp, total_completed, streak
-                '''
-                cursor.execute(query, (xp_increment, xp_increment, user_id))
-            
-            user = cursor.fetchone()
-            conn.commit()
-            cursor.close()
-            conn.close()
-            
-            if not user:
-                return {
-                    'statusCode': 404,
-                    'headers': headers,
-                    'body': json.dumps({'error': 'User not found'}),
-                    'isBase64Encoded': False
-                }
-            
-            return {
-                'statusCode': 200,
-                'headers': headers,
-                'body': json.dumps({'user': dict(user)}),
-                'isBase64Encoded': False
-            }
-        
-        else:
-            return {
-                'statusCode': 405,
-                'headers': headers,
-                'body': json.dumps({'error': 'Method not allowed'}),
-                'isBase64Encoded': False
-            }
-    
-    except Exception as e:
-        return {
-            'statusCode': 500,
-            'headers': headers,
-            'body': json.dumps({'error': str(e)}),
-            'isBase64Encoded': False
-        }
+    return dispatch(event, context, ALLOWED_METHODS)
@@ -0,0 +1,99 @@
+'''
+Сравнение пакетного создания и обновления заданий с поштучным путем.
+После замеров проверяет, что пакетный и одиночный PUT одинаково отвечают на задание из tasks_archive.
+Нужна база с примененными миграциями в DATABASE_URL.
+
+Запуск: python bench/bulk_tasks.py --count 500
+'''
+import argparse
+import json
+import os
+import time
+
+import psycopg2
+
+from common import load_function
+
+class Context:
+    request_id = 'bench'
+    function_name = 'tasks'
+
+def request(function, method: str, body: dict = None, params: dict = None, headers: dict = None) -> dict:
+    return function.handler({
+        'httpMethod': method,
+        'body': json.dumps(body) if body is not None else None,
+        'queryStringParameters': params,
+        'headers': headers or {}
+    }, Context())
+
+def call(tasks, method: str, body: dict) -> dict:
+    response = request(tasks, method, body)
+    assert response['statusCode'] in (200, 201), response['body']
+    return json.loads(response['body'])
+
+def check_archived_parity(tasks, task_id: str) -> None:
+    '''
+    Завершает задание, переносит его в tasks_archive заданием планировщика archive_tasks
+    и сравнивает ответы одиночного и пакетного PUT на него
+    '''
+    call(tasks, 'PUT', {'task_id': task_id, 'status': 'completed'})
+    with psycopg2.connect(os.environ['DATABASE_URL']) as conn, conn.cursor() as cursor:
+        cursor.execute("UPDATE tasks SET completed_at = completed_at - INTERVAL '20 years' WHERE id = %s", (task_id,))
+    secret = os.environ.setdefault('SCHEDULER_SECRET', 'bench-secret')
+    scheduler = load_function('scheduler')
+    archived = request(scheduler, 'POST', params={'job': 'archive_tasks', 'after_days': '7300'},
+                       headers={'X-Scheduler-Secret': secret})
+    assert archived['statusCode'] == 200, archived['body']
+    
+    for status in ('completed', 'active'):
+        single = request(tasks, 'PUT', {'task_id': task_id, 'status': status})
+        batch = call(tasks, 'PUT', {'updates': [{'id': task_id, 'status': status}]})['results'][0]
+        assert single['statusCode'] == batch['statusCode'] == 409, (single, batch)
+        assert json.loads(single['body'])['error'] == batch['error'], (single, batch)
+
+def timed(fn) -> float:
+    started = time.perf_counter()
+    fn()
+    return time.perf_counter() - started
+
+def main(count: int) -> None:
+    tasks = load_function('tasks')
+    with psycopg2.connect(os.environ['DATABASE_URL']) as conn, conn.cursor() as cursor:
+        cursor.execute(
+            'INSERT INTO users (telegram_id, username) VALUES (%s, %s) RETURNING id',
+            (int(time.time() * 1000), 'bench_bulk')
+        )
+        user_id = cursor.fetchone()[0]
+    
+    items = [{'title': f'Пункт {i}', 'description': 'Импорт чек-листа', 'interval': '1hour'} for i in range(count)]
+    single_ids = []
+    batch_ids = []
+    
+    single_create = timed(lambda: single_ids.extend(
+        call(tasks, 'POST', {'user_id': user_id, **item})['task']['id'] for item in items
+    ))
+    batch_create = timed(lambda: batch_ids.extend(
+        result['task']['id'] for result in call(tasks, 'POST', {'user_id': user_id, 'tasks': items})['results']
+    ))
+    single_update = timed(lambda: [
+        call(tasks, 'PUT', {'task_id': task_id, 'status': 'archived'}) for task_id in single_ids
+    ])
+    batch_update = timed(lambda: call(tasks, 'PUT', {'updates': [
+        {'id': task_id, 'status': 'archived'} for task_id in batch_ids
+    ]}))
+    check_archived_parity(tasks, call(tasks, 'POST', {'user_id': user_id, **items[0]})['task']['id'])
+    
+    print(json.dumps({
+        'count': count,
+        'create_single_s': round(single_create, 3),
+        'create_batch_s': round(batch_create, 3),
+        'create_speedup': round(single_create / batch_create, 1),
+        'update_single_s': round(single_update, 3),
+        'update_batch_s': round(batch_update, 3),
+        'update_speedup': round(single_update / batch_update, 1)
+    }))
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--count', type=int, default=500)
+    main(parser.parse_args().count)
@@ -0,0 +1,86 @@
+'''
+Общие помощники для офлайн-бенчмарков функций из backend/
+'''
+import importlib.util
+import json
+import os
+import statistics
+import sys
+from typing import Any, Dict, List, Optional
+
+import psycopg2
+
+BACKEND_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'backend')
+
+def load_function(name: str, backend_dir: str = BACKEND_DIR):
+    '''
+    Загружает <backend_dir>/<name>/index.py как отдельный модуль, как это делает среда выполнения.
+    Модули из каталога функции (копии backend/shared) импортируются заново для каждой функции и не
+    остаются в sys.modules, чтобы функции одного процесса не делили пул и маршруты; они доступны
+    как атрибуты модуля функции, например module.request_layer
+    Returns: модуль функции
+    '''
+    function_dir = os.path.abspath(os.path.join(backend_dir, name))
+    spec = importlib.util.spec_from_file_location(f'backend_{name}', os.path.join(function_dir, 'index.py'))
+    module = importlib.util.module_from_spec(spec)
+    sys.path.insert(0, function_dir)
+    try:
+        spec.loader.exec_module(module)
+    finally:
+        sys.path.remove(function_dir)
+        for module_name, loaded in list(sys.modules.items()):
+            if os.path.dirname(os.path.abspath(getattr(loaded, '__file__', None) or '')) == function_dir:
+                del sys.modules[module_name]
+                if not hasattr(module, module_name):
+                    setattr(module, module_name, loaded)
+    return module
+
+# Строки пользователя, которые удаляются раньше самой строки users (задания, в том числе архивные, и счетчики)
+USER_DATA_TABLES = ('tasks', 'tasks_archive', 'user_task_stats', 'user_task_daily_stats', 'user_achievements')
+
+class Context:
+    '''
+    Контекст вызова функции, как его передает среда выполнения
+    '''
+
+    def __init__(self, request_id: str, function_name: Optional[str] = None):
+        self.request_id = request_id
+        self.function_name = function_name or request_id
+
+def make_event(method: str, params: Optional[Dict[str, Any]] = None, body: Optional[Dict[str, Any]] = None) -> Dict[str, Any]:
+    '''
+    Событие HTTP-вызова функции без заголовков; тело передается JSON-строкой
+    '''
+    event: Dict[str, Any] = {'httpMethod': method, 'headers': {}, 'queryStringParameters': params or {}}
+    if body is not None:
+        event['body'] = json.dumps(body)
+    return event
+
+def delete_users(user_ids: List[int]) -> None:
+    '''
+    Удаляет созданных проверкой пользователей вместе с их заданиями и счетчиками из базы DATABASE_URL
+    '''
+    with psycopg2.connect(os.environ['DATABASE_URL']) as conn, conn.cursor() as cursor:
+        for table in USER_DATA_TABLES:
+            cursor.execute(f'DELETE FROM {table} WHERE user_id = ANY(%s)', (user_ids,))
+        cursor.execute('DELETE FROM users WHERE id = ANY(%s)', (user_ids,))
+
+def percentile(samples: List[float], fraction: float) -> float:
+    if not samples:
+        return 0.0
+    ordered = sorted(samples)
+    index = min(len(ordered) - 1, max(0, int(round(fraction * (len(ordered) - 1)))))
+    return ordered[index]
+
+def summarize(samples: List[float]) -> Dict[str, Any]:
+    '''
+    Сводка по замерам в секундах
+    Returns: dict с количеством, средним, p50, p99 и максимумом в миллисекундах
+    '''
+    return {
+        'count': len(samples),
+        'mean_ms': round(statistics.fmean(samples) * 1000, 3) if samples else 0.0,
+        'p50_ms': round(percentile(samples, 0.50) * 1000, 3),
+        'p99_ms': round(percentile(samples, 0.99) * 1000, 3),
+        'max_ms': round(max(samples) * 1000, 3) if samples else 0.0
+    }
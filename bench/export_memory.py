@@ -0,0 +1,106 @@
+'''
+Проверка памяти выгрузки истории заданий (tasks GET view=export): для пользователя с небольшой и с большой
+историей выгрузка проходится целиком по X-Next-Cursor, пиковая память Python-аллокаций на вызов
+(tracemalloc) не должна расти вместе с числом заданий. Пользователи создаются на время проверки и удаляются.
+Ненулевой код выхода, если пик вырос больше допуска или выгружены не все строки.
+
+Запуск: python export_memory.py --small 20000 --large 200000 --format ndjson
+        python export_memory.py --small 50000 --large 250000 --format csv
+(у небольшого пользователя выгрузка должна занимать больше одного ответа, иначе сравнивать не с чем)
+'''
+import argparse
+import json
+import os
+import sys
+import time
+import tracemalloc
+from typing import Any, Dict
+
+import psycopg2
+
+from common import Context, delete_users, load_function
+
+SEED_TASKS_QUERY = '''
+    INSERT INTO tasks (user_id, title, description, interval, status, priority, created_at, completed_at)
+    SELECT %(user_id)s, 'Выгрузка ' || n, 'Описание задания для проверки выгрузки', 'daily',
+           CASE WHEN n %% 2 = 0 THEN 'completed' ELSE 'active' END,
+           (ARRAY['low', 'medium', 'high'])[1 + n %% 3],
+           (now() AT TIME ZONE 'UTC') - make_interval(secs => n),
+           CASE WHEN n %% 2 = 0 THEN (now() AT TIME ZONE 'UTC') - make_interval(secs => n) + INTERVAL '1 hour' END
+    FROM generate_series(1, %(count)s) AS n
+'''
+
+CONTEXT = Context('export-memory', 'tasks')
+
+def create_user(cursor, task_count: int) -> int:
+    cursor.execute('INSERT INTO users (telegram_id, username) VALUES (%s, %s) RETURNING id',
+                   (int(time.time() * 1000000) % 10 ** 15, 'bench_export'))
+    user_id = cursor.fetchone()[0]
+    cursor.execute(SEED_TASKS_QUERY, {'user_id': user_id, 'count': task_count})
+    return user_id
+
+def export_all(module, user_id: int, export_format: str) -> Dict[str, Any]:
+    '''
+    Проходит выгрузку пользователя целиком
+    Returns: dict с числом вызовов и строк, объемом, временем и максимальным пиком памяти за вызов
+    '''
+    params = {'user_id': str(user_id), 'view': 'export', 'format': export_format}
+    calls = rows = size = 0
+    peak = 0
+    started = time.perf_counter()
+    while True:
+        tracemalloc.start()
+        response = module.handler({'httpMethod': 'GET', 'headers': {}, 'queryStringParameters': params}, CONTEXT)
+        peak = max(peak, tracemalloc.get_traced_memory()[1])
+        tracemalloc.stop()
+        if response['statusCode'] != 200:
+            raise SystemExit(f'export failed: {response["body"]}')
+        calls += 1
+        rows += int(response['headers']['X-Export-Rows'])
+        size += len(response['body'].encode())
+        next_cursor = response['headers'].get('X-Next-Cursor')
+        if not next_cursor:
+            break
+        params = {**params, 'cursor': next_cursor}
+    return {
+        'calls': calls,
+        'rows': rows,
+        'bytes': size,
+        'elapsed_s': round(time.perf_counter() - started, 3),
+        'peak_per_call_bytes': peak
+    }
+
+def main(small: int, large: int, export_format: str, tolerance: float) -> None:
+    module = load_function('tasks')
+    with psycopg2.connect(os.environ['DATABASE_URL']) as conn, conn.cursor() as cursor:
+        users = {'small': (create_user(cursor, small), small), 'large': (create_user(cursor, large), large)}
+
+    try:
+        results = {}
+        for label, (user_id, task_count) in users.items():
+            results[label] = {'tasks': task_count, **export_all(module, user_id, export_format)}
+            print(json.dumps({'user': label, **results[label]}))
+    finally:
+        delete_users([user_id for user_id, _ in users.values()])
+
+    failures = [f'{label}: exported {result["rows"]} of {result["tasks"]} rows'
+                for label, result in results.items() if result['rows'] != result['tasks']]
+    if results['small']['calls'] < 2:
+        failures.append('small export fits in one response, pick a larger --small to compare full-size parts')
+    growth = results['large']['peak_per_call_bytes'] / results['small']['peak_per_call_bytes']
+    print(json.dumps({'peak_growth': round(growth, 3), 'tasks_growth': round(large / small, 1)}))
+    if growth > 1 + tolerance:
+        failures.append(f'peak memory per call grew {growth:.2f}x for {large / small:.0f}x more tasks')
+    for failure in failures:
+        print(f'FAIL {failure}', file=sys.stderr)
+    if failures:
+        sys.exit(1)
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--small', type=int, default=20000)
+    parser.add_argument('--large', type=int, default=200000)
+    parser.add_argument('--format', choices=('ndjson', 'csv'), default='ndjson')
+    parser.add_argument('--tolerance', type=float, default=0.25)
+    args = parser.parse_args()
+    main(args.small, args.large, args.format, args.tolerance)
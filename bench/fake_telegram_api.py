@@ -0,0 +1,66 @@
+'''
+Локальная подделка Telegram Bot API для офлайн-замеров доставки.
+Принимает sendMessage, соблюдает лимиты Telegram (общий и на чат)
+и отвечает 429 с retry_after при их превышении.
+
+Запуск: python bench/fake_telegram_api.py --port 8081
+'''
+import argparse
+import asyncio
+import time
+from collections import deque
+from typing import Any, Deque, Dict
+
+from aiohttp import web
+
+class FakeTelegramApi:
+    def __init__(self, global_limit: int = 30, chat_interval: float = 1.0, latency: float = 0.02):
+        self.global_limit = global_limit
+        self.chat_interval = chat_interval
+        self.latency = latency
+        self.recent: Deque[float] = deque()
+        self.last_by_chat: Dict[int, float] = {}
+        self.stats: Dict[str, int] = {'accepted': 0, 'rejected': 0}
+
+    def _too_many(self, retry_after: int) -> web.Response:
+        self.stats['rejected'] += 1
+        return web.json_response({
+            'ok': False,
+            'error_code': 429,
+            'description': f'Too Many Requests: retry after {retry_after}',
+            'parameters': {'retry_after': retry_after}
+        }, status=429)
+
+    async def send_message(self, request: web.Request) -> web.Response:
+        payload: Dict[str, Any] = await request.json()
+        chat_id = int(payload['chat_id'])
+        await asyncio.sleep(self.latency)
+        
+        now = time.monotonic()
+        while self.recent and now - self.recent[0] > 1.0:
+            self.recent.popleft()
+        if len(self.recent) >= self.global_limit:
+            return self._too_many(1)
+        if now - self.last_by_chat.get(chat_id, -self.chat_interval) < self.chat_interval:
+            return self._too_many(1)
+        
+        self.recent.append(now)
+        self.last_by_chat[chat_id] = now
+        self.stats['accepted'] += 1
+        return web.json_response({
+            'ok': True,
+            'result': {'message_id': self.stats['accepted'], 'chat': {'id': chat_id}, 'text': payload.get('text')}
+        })
+
+    def make_app(self) -> web.Application:
+        app = web.Application()
+        app.router.add_post('/bot{token}/sendMessage', self.send_message)
+        return app
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--port', type=int, default=8081)
+    parser.add_argument('--global-limit', type=int, default=30)
+    parser.add_argument('--latency', type=float, default=0.02)
+    args = parser.parse_args()
+    web.run_app(FakeTelegramApi(args.global_limit, latency=args.latency).make_app(), port=args.port)
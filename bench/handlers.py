@@ -0,0 +1,92 @@
+'''
+Задержка handler'ов users, tasks и achievements на синтетических событиях и время холодного импорта.
+Нужна база с примененными миграциями в DATABASE_URL.
+
+Запуск: python handlers.py --requests 500
+'''
+import argparse
+import json
+import os
+import subprocess
+import sys
+import time
+from typing import Any, Callable, Dict, List, Tuple
+
+import psycopg2
+
+from common import Context, load_function, make_event, summarize
+
+def seed(task_count: int) -> Tuple[int, int]:
+    '''
+    Создает пользователя с заданиями для замеров
+    Returns: id и telegram_id пользователя
+    '''
+    telegram_id = int(time.time() * 1000)
+    with psycopg2.connect(os.environ['DATABASE_URL']) as conn, conn.cursor() as cursor:
+        cursor.execute(
+            'INSERT INTO users (telegram_id, username) VALUES (%s, %s) RETURNING id',
+            (telegram_id, 'bench_handlers')
+        )
+        user_id = cursor.fetchone()[0]
+        cursor.execute('''
+            INSERT INTO tasks (user_id, title, description, interval, priority)
+            SELECT %s, 'Задание ' || n, 'Описание задания', 'daily', 'medium'
+            FROM generate_series(1, %s) AS n
+        ''', (user_id, task_count))
+        cursor.execute('SELECT COUNT(*) FROM evaluate_user_achievements(ARRAY[%s])', (user_id,))
+    return user_id, telegram_id
+
+def scenarios(user_id: int, telegram_id: int) -> List[Tuple[str, str, Callable[[], Dict[str, Any]]]]:
+    return [
+        ('users', 'GET user', lambda: make_event('GET', {'telegram_id': str(telegram_id)})),
+        ('users', 'GET leaderboard', lambda: make_event('GET', {'view': 'leaderboard', 'user_id': str(user_id)})),
+        ('users', 'PUT xp', lambda: make_event('PUT', body={'user_id': user_id, 'xp_increment': 1})),
+        ('users', 'OPTIONS', lambda: make_event('OPTIONS')),
+        ('tasks', 'GET page', lambda: make_event('GET', {'user_id': str(user_id), 'limit': '50'})),
+        ('tasks', 'GET stats', lambda: make_event('GET', {'user_id': str(user_id), 'view': 'stats'})),
+        ('tasks', 'POST task', lambda: make_event('POST', body={'user_id': user_id, 'title': 'Новое', 'interval': 'daily'})),
+        ('achievements', 'GET list', lambda: make_event('GET', {'user_id': str(user_id)})),
+        ('achievements', 'POST evaluate', lambda: make_event('POST', body={'user_id': user_id}))
+    ]
+
+def cold_import_seconds(name: str) -> float:
+    '''
+    Время импорта index.py функции в свежем процессе, как при холодном старте
+    '''
+    code = (
+        'import time; started = time.perf_counter(); '
+        'from common import load_function; '
+        f'load_function({name!r}); '
+        'print(time.perf_counter() - started)'
+    )
+    output = subprocess.run([sys.executable, '-c', code], capture_output=True, text=True, check=True,
+                            cwd=os.path.dirname(os.path.abspath(__file__)))
+    return float(output.stdout.strip())
+
+def main(requests: int, task_count: int) -> None:
+    functions = {name: load_function(name) for name in ('users', 'tasks', 'achievements')}
+    user_id, telegram_id = seed(task_count)
+
+    for name, label, build_event in scenarios(user_id, telegram_id):
+        module = functions[name]
+        context = Context('bench', name)
+        module.handler(build_event(), context)
+        samples = []
+        for _ in range(requests):
+            event = build_event()
+            started = time.perf_counter()
+            response = module.handler(event, context)
+            samples.append(time.perf_counter() - started)
+            assert response['statusCode'] < 400, response['body']
+        print(json.dumps({'function': name, 'scenario': label, **summarize(samples)}, ensure_ascii=False))
+
+    for name in functions:
+        imports = [cold_import_seconds(name) for _ in range(5)]
+        print(json.dumps({'function': name, 'scenario': 'cold import', **summarize(imports)}))
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--requests', type=int, default=500)
+    parser.add_argument('--tasks', type=int, default=200)
+    args = parser.parse_args()
+    main(args.requests, args.tasks)
@@ -0,0 +1,130 @@
+'''
+Проверка свойств кривой уровней level_for_xp и замер применения большого прироста xp.
+Нужна база с примененными миграциями в DATABASE_URL.
+
+Запуск: python level_curve.py --cases 2000 --rounds 200
+'''
+import argparse
+import json
+import os
+import random
+import time
+
+import psycopg2
+
+from common import load_function, summarize
+
+OLD_LEVEL_STEP_QUERY = '''
+    UPDATE users
+    SET xp = xp + %s,
+        level = CASE WHEN (xp + %s) >= (level * 100) THEN level + 1 ELSE level END
+    WHERE id = %s
+    RETURNING level, xp
+'''
+
+class Context:
+    request_id = 'bench'
+    function_name = 'users'
+
+def iterated_level(xp: int) -> int:
+    '''
+    Эталон: старое правило "не больше одного уровня за вызов", повторенное до остановки
+    '''
+    level = 1
+    while xp >= level * 100:
+        level += 1
+    return level
+
+def level_at_threshold(xp: int, level: int) -> bool:
+    return (level - 1) * 100 <= xp < level * 100
+
+def put_xp(users, user_id: int, xp_increment: int) -> dict:
+    response = users.handler({
+        'httpMethod': 'PUT',
+        'body': json.dumps({'user_id': user_id, 'xp_increment': xp_increment}),
+        'headers': {}
+    }, Context())
+    assert response['statusCode'] == 200, response['body']
+    return json.loads(response['body'])
+
+def create_user(cursor, name: str) -> int:
+    cursor.execute(
+        'INSERT INTO users (telegram_id, username) VALUES (%s, %s) RETURNING id',
+        (int(time.time() * 1000000) + random.randint(0, 999), name)
+    )
+    return cursor.fetchone()[0]
+
+def check_properties(conn, users, cases: int) -> None:
+    rng = random.Random(42)
+    samples = [0, 1, 99, 100, 101, 199, 200, 10 ** 6] + [rng.randint(0, 10 ** 5) for _ in range(cases)]
+    with conn.cursor() as cursor:
+        cursor.execute('SELECT x, level_for_xp(x) FROM unnest(%s::integer[]) AS x', (samples,))
+        for xp, level in cursor.fetchall():
+            assert level == iterated_level(xp), (xp, level)
+            assert level_at_threshold(xp, level), (xp, level)
+
+        cursor.execute('SELECT level_for_xp(-50), level_for_xp(NULL)')
+        assert cursor.fetchone() == (1, 1)
+
+        user_id = create_user(cursor, 'bench_level_split')
+        whole_id = create_user(cursor, 'bench_level_whole')
+    conn.commit()
+
+    deltas = [rng.randint(0, 900) for _ in range(20)]
+    gained = sum(put_xp(users, user_id, delta)['levelsGained'] for delta in deltas)
+    whole = put_xp(users, whole_id, sum(deltas))
+    assert gained == whole['levelsGained'] == whole['user']['level'] - 1, (gained, whole)
+    assert whole['user']['level'] == iterated_level(sum(deltas))
+
+def measure(conn, users, rounds: int, xp_increment: int) -> dict:
+    closed_form = []
+    looped = []
+    round_trips = []
+    for _ in range(rounds):
+        with conn.cursor() as cursor:
+            single_id = create_user(cursor, 'bench_level_single')
+            loop_id = create_user(cursor, 'bench_level_loop')
+        conn.commit()
+
+        started = time.perf_counter()
+        put_xp(users, single_id, xp_increment)
+        closed_form.append(time.perf_counter() - started)
+
+        started = time.perf_counter()
+        calls = 0
+        increment = xp_increment
+        previous_level = None
+        with conn.cursor() as cursor:
+            while True:
+                cursor.execute(OLD_LEVEL_STEP_QUERY, (increment, increment, loop_id))
+                level, _ = cursor.fetchone()
+                conn.commit()
+                calls += 1
+                if level == previous_level:
+                    break
+                previous_level = level
+                increment = 0
+        looped.append(time.perf_counter() - started)
+        round_trips.append(calls)
+
+    return {
+        'xp_increment': xp_increment,
+        'closed_form': summarize(closed_form),
+        'one_level_loop': summarize(looped),
+        'one_level_loop_calls': max(round_trips)
+    }
+
+def main(cases: int, rounds: int, xp_increment: int) -> None:
+    users = load_function('users')
+    with psycopg2.connect(os.environ['DATABASE_URL']) as conn:
+        check_properties(conn, users, cases)
+        print(json.dumps({'properties': 'ok', 'cases': cases}))
+        print(json.dumps(measure(conn, users, rounds, xp_increment)))
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--cases', type=int, default=2000)
+    parser.add_argument('--rounds', type=int, default=200)
+    parser.add_argument('--xp', type=int, default=5000)
+    args = parser.parse_args()
+    main(args.cases, args.rounds, args.xp)
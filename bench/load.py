@@ -0,0 +1,238 @@
+'''
+Нагрузочный прогон handler'ов users, tasks и achievements на базе, наполненной seed.py.
+Для каждого сценария считает пропускную способность, перцентили задержки, число SQL-запросов
+и новых соединений на запрос. Результат можно сохранить и сравнить с прошлым прогоном
+или с другим коммитом, регрессии дают ненулевой код выхода.
+
+Запуск: python load.py --requests 500 --concurrency 4 --output head.json
+        python load.py --baseline head.json
+        python load.py --ref HEAD~1
+'''
+import argparse
+import json
+import os
+import random
+import shutil
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from typing import Any, Callable, Dict, List, Tuple
+
+import psycopg2
+from psycopg2.extras import RealDictCursor
+
+from common import BACKEND_DIR, Context, load_function, make_event, percentile, summarize
+from seed import SEED_TELEGRAM_BASE
+
+FUNCTIONS = ('users', 'tasks', 'achievements')
+
+counters = threading.local()
+
+def counting_cursor(base):
+    class CountingCursor(base):
+        def execute(self, query, vars=None):
+            counters.queries = getattr(counters, 'queries', 0) + 1
+            return super().execute(query, vars)
+    return CountingCursor
+
+def instrument(module) -> None:
+    '''
+    Подменяет открытие соединений в пуле функции: курсоры считают запросы, пул - новые соединения.
+    Собственный курсор функции с замерами запросов сохраняется. Пул ищется в request_layer функции,
+    а у коммитов до его выноса - в самом index.py
+    '''
+    layer = getattr(module, 'request_layer', module)
+    pool = getattr(layer, 'db_pool', None)
+    if pool is None:
+        return
+    cursor_factory = counting_cursor(getattr(layer, 'TracedCursor', RealDictCursor))
+
+    def connect():
+        counters.connections = getattr(counters, 'connections', 0) + 1
+        conn = psycopg2.connect(pool.dsn, cursor_factory=cursor_factory)
+        pool._born[id(conn)] = time.monotonic()
+        return conn
+
+    pool._connect = connect
+
+class Workload:
+    '''
+    Выборка засеянных пользователей и их активных заданий, из которой строятся события
+    '''
+
+    def __init__(self, sample_size: int, seed_value: int):
+        self.rng = random.Random(seed_value)
+        self.lock = threading.Lock()
+        with psycopg2.connect(os.environ['DATABASE_URL']) as conn, conn.cursor() as cursor:
+            cursor.execute(
+                'SELECT id, telegram_id FROM users WHERE telegram_id > %s ORDER BY telegram_id LIMIT %s',
+                (SEED_TELEGRAM_BASE, sample_size)
+            )
+            self.users: List[Tuple[int, int]] = cursor.fetchall()
+            cursor.execute(
+                "SELECT id FROM tasks WHERE user_id = ANY(%s) AND status = 'active'",
+                ([user_id for user_id, _ in self.users],)
+            )
+            self.active_tasks = [row[0] for row in cursor.fetchall()]
+        if not self.users:
+            raise SystemExit('No seeded users, run seed.py first')
+        self.rng.shuffle(self.active_tasks)
+
+    def user(self) -> Tuple[int, int]:
+        with self.lock:
+            return self.rng.choice(self.users)
+
+    def active_task(self) -> int:
+        with self.lock:
+            if not self.active_tasks:
+                raise SystemExit('Out of active tasks, reseed or lower --requests')
+            return self.active_tasks.pop()
+
+def scenarios(workload: Workload) -> List[Tuple[str, str, Callable[[], Dict[str, Any]]]]:
+    def user_id() -> int:
+        return workload.user()[0]
+
+    return [
+        ('users', 'GET user', lambda: make_event('GET', {'telegram_id': str(workload.user()[1])})),
+        ('users', 'GET leaderboard', lambda: make_event('GET', {'view': 'leaderboard', 'user_id': str(user_id())})),
+        ('users', 'PUT xp', lambda: make_event('PUT', body={'user_id': user_id(), 'xp_increment': 10})),
+        ('tasks', 'GET active page', lambda: make_event('GET', {'user_id': str(user_id()), 'limit': '50'})),
+        ('tasks', 'GET completed page', lambda: make_event('GET', {'user_id': str(user_id()), 'status': 'completed', 'limit': '50'})),
+        ('tasks', 'GET stats', lambda: make_event('GET', {'user_id': str(user_id()), 'view': 'stats', 'days': '30'})),
+        ('tasks', 'POST task', lambda: make_event('POST', body={'user_id': user_id(), 'title': 'Нагрузка', 'interval': 'daily'})),
+        ('tasks', 'PUT complete', lambda: make_event('PUT', body={'task_id': workload.active_task(), 'status': 'completed'})),
+        ('achievements', 'GET list', lambda: make_event('GET', {'user_id': str(user_id())})),
+        ('achievements', 'POST evaluate', lambda: make_event('POST', body={'user_id': user_id()}))
+    ]
+
+def run_scenario(module, name: str, build_event: Callable[[], Dict[str, Any]], requests: int, concurrency: int) -> Dict[str, Any]:
+    context = Context('load', name)
+    events = [build_event() for _ in range(requests)]
+
+    def call(event: Dict[str, Any]) -> Tuple[float, int, int, int]:
+        counters.queries = 0
+        counters.connections = 0
+        started = time.perf_counter()
+        response = module.handler(event, context)
+        return time.perf_counter() - started, counters.queries, counters.connections, response['statusCode']
+
+    started = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=concurrency) as executor:
+        results = list(executor.map(call, events))
+    elapsed = time.perf_counter() - started
+
+    latencies = [result[0] for result in results]
+    summary = summarize(latencies)
+    return {
+        'requests': requests,
+        'concurrency': concurrency,
+        'throughput_rps': round(requests / elapsed, 1),
+        'p50_ms': summary['p50_ms'],
+        'p95_ms': round(percentile(latencies, 0.95) * 1000, 3),
+        'p99_ms': summary['p99_ms'],
+        'queries_per_request': round(sum(result[1] for result in results) / requests, 2),
+        'connections_per_request': round(sum(result[2] for result in results) / requests, 3),
+        'errors': sum(1 for result in results if result[3] >= 500)
+    }
+
+def run_suite(backend_dir: str, args) -> Dict[str, Dict[str, Any]]:
+    modules = {name: load_function(name, backend_dir) for name in FUNCTIONS}
+    for module in modules.values():
+        instrument(module)
+    workload = Workload(args.sample_users, args.seed)
+
+    results = {}
+    for function_name, label, build_event in scenarios(workload):
+        module = modules[function_name]
+        run_scenario(module, function_name, build_event, min(args.warmup, args.requests), args.concurrency)
+        result = run_scenario(module, function_name, build_event, args.requests, args.concurrency)
+        key = f'{function_name} {label}'
+        results[key] = result
+        print(json.dumps({'scenario': key, **result}, ensure_ascii=False), flush=True)
+    return results
+
+def run_at_ref(ref: str, args) -> Dict[str, Dict[str, Any]]:
+    '''
+    Прогоняет тот же набор сценариев на backend/ из другого коммита через временный git worktree
+    '''
+    repo_dir = os.path.dirname(os.path.abspath(BACKEND_DIR))
+    worktree = tempfile.mkdtemp(prefix='load-ref-')
+    shutil.rmtree(worktree)
+    subprocess.run(['git', '-C', repo_dir, 'worktree', 'add', '--detach', worktree, ref], check=True,
+                   stdout=subprocess.DEVNULL)
+    try:
+        return run_suite(os.path.join(worktree, 'backend'), args)
+    finally:
+        subprocess.run(['git', '-C', repo_dir, 'worktree', 'remove', '--force', worktree], check=True)
+
+def compare(baseline: Dict[str, Dict[str, Any]], current: Dict[str, Dict[str, Any]], threshold: float) -> List[str]:
+    '''
+    Сравнивает прогоны по сценариям: p50 и пропускная способность с допуском threshold, шумный p99 -
+    с двойным допуском, число запросов и соединений на запрос - без допуска
+    Returns: список найденных регрессий
+    '''
+    regressions = []
+    for key, now in current.items():
+        before = baseline.get(key)
+        if before is None:
+            continue
+        row = {'scenario': key}
+        for metric in ('throughput_rps', 'p50_ms', 'p99_ms', 'queries_per_request', 'connections_per_request'):
+            row[metric] = [before[metric], now[metric]]
+        print(json.dumps(row, ensure_ascii=False))
+
+        if now['p50_ms'] > before['p50_ms'] * (1 + threshold):
+            regressions.append(f'{key}: p50 {before["p50_ms"]} -> {now["p50_ms"]} ms')
+        if now['p99_ms'] > before['p99_ms'] * (1 + 2 * threshold):
+            regressions.append(f'{key}: p99 {before["p99_ms"]} -> {now["p99_ms"]} ms')
+        if now['throughput_rps'] < before['throughput_rps'] * (1 - threshold):
+            regressions.append(f'{key}: throughput {before["throughput_rps"]} -> {now["throughput_rps"]} rps')
+        if now['queries_per_request'] > before['queries_per_request']:
+            regressions.append(f'{key}: queries/request {before["queries_per_request"]} -> {now["queries_per_request"]}')
+        if now['connections_per_request'] > before['connections_per_request'] + 0.01:
+            regressions.append(f'{key}: connections/request {before["connections_per_request"]} -> {now["connections_per_request"]}')
+        if now['errors'] > before['errors']:
+            regressions.append(f'{key}: errors {before["errors"]} -> {now["errors"]}')
+    return regressions
+
+def main() -> None:
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--requests', type=int, default=500)
+    parser.add_argument('--warmup', type=int, default=50)
+    parser.add_argument('--concurrency', type=int, default=int(os.environ.get('DB_POOL_MAX_SIZE', '4')))
+    parser.add_argument('--sample-users', type=int, default=1000)
+    parser.add_argument('--seed', type=int, default=1)
+    parser.add_argument('--output', help='сохранить результаты в JSON')
+    parser.add_argument('--baseline', help='сравнить с сохраненным прогоном')
+    parser.add_argument('--ref', help='сравнить с backend/ из указанного коммита')
+    parser.add_argument('--threshold', type=float, default=0.2)
+    parser.add_argument('--log-sample-rate', default='0', help='REQUEST_LOG_SAMPLE_RATE для функций во время прогона')
+    args = parser.parse_args()
+    os.environ['REQUEST_LOG_SAMPLE_RATE'] = args.log_sample_rate
+
+    baseline = None
+    if args.baseline:
+        with open(args.baseline) as baseline_file:
+            baseline = json.load(baseline_file)
+    elif args.ref:
+        print(json.dumps({'run': args.ref}))
+        baseline = run_at_ref(args.ref, args)
+
+    print(json.dumps({'run': 'working tree'}))
+    results = run_suite(BACKEND_DIR, args)
+    if args.output:
+        with open(args.output, 'w') as output_file:
+            json.dump(results, output_file, ensure_ascii=False, indent=2)
+
+    if baseline is not None:
+        regressions = compare(baseline, results, args.threshold)
+        for regression in regressions:
+            print(f'REGRESSION {regression}', file=sys.stderr)
+        if regressions:
+            sys.exit(1)
+
+if __name__ == '__main__':
+    main()
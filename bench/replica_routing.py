@@ -0,0 +1,134 @@
+'''
+Проверка маршрутизации чтений на реплики на двух локальных экземплярах PostgreSQL: основной сервер
+в DATABASE_URL и потоковая реплика в DATABASE_REPLICA_URLS (например, pg_basebackup -R). К репликам
+добавляется заведомо недоступный адрес, чтобы проверить пропуск неисправной реплики. Для проверки
+отставания скрипт ставит проигрывание WAL на реплике на паузу (pg_wal_replay_pause, нужен суперпользователь).
+
+Проверяется: записи идут на основной сервер и отдают X-Db-Lsn; GET без позиции читает с реплики;
+GET с позицией записи, которую реплика еще не проиграла, читает с основного сервера и видит запись;
+реплика, отставшая больше DB_REPLICA_MAX_LAG_SECONDS, не используется; после догоняния чтение с той же
+позицией снова идет на реплику. Ненулевой код выхода, если что-то из этого не выполнилось.
+
+Запуск: DATABASE_REPLICA_URLS=postgresql://postgres@/app?host=/tmp/pgreplica python replica_routing.py
+'''
+import argparse
+import json
+import os
+import sys
+import time
+from typing import Any, Dict, List, Optional
+
+import psycopg2
+
+from common import Context, delete_users, load_function
+
+CONTEXT = Context('replica-routing')
+
+def call(module, method: str, params: Optional[Dict[str, str]] = None, body: Optional[Dict[str, Any]] = None,
+         lsn: Optional[str] = None) -> Dict[str, Any]:
+    event = {
+        'httpMethod': method,
+        'headers': {'X-Db-Lsn': lsn} if lsn else {},
+        'queryStringParameters': params or {},
+        'body': json.dumps(body) if body is not None else None
+    }
+    response = module.handler(event, CONTEXT)
+    response['route'] = response['headers'].get('X-Db-Route', '').split(' ')[0]
+    response['json'] = json.loads(response['body']) if response['body'] else {}
+    return response
+
+def wait_for_replay(replica_dsn: str, lsn: str, timeout: float = 10.0) -> None:
+    deadline = time.monotonic() + timeout
+    with psycopg2.connect(replica_dsn) as conn, conn.cursor() as cursor:
+        while time.monotonic() < deadline:
+            cursor.execute('SELECT pg_last_wal_replay_lsn() >= %s::pg_lsn', (lsn,))
+            if cursor.fetchone()[0]:
+                return
+            conn.rollback()
+            time.sleep(0.05)
+    raise SystemExit(f'replica did not replay {lsn} in {timeout}s')
+
+def set_replay_paused(replica_dsn: str, paused: bool) -> None:
+    conn = psycopg2.connect(replica_dsn)
+    try:
+        conn.autocommit = True
+        with conn.cursor() as cursor:
+            cursor.execute('SELECT pg_wal_replay_pause()' if paused else 'SELECT pg_wal_replay_resume()')
+    finally:
+        conn.close()
+
+def main(dead_replica: str, max_lag: float) -> None:
+    replica_dsns = [dsn.strip() for dsn in os.environ.get('DATABASE_REPLICA_URLS', '').split(',') if dsn.strip()]
+    if not replica_dsns:
+        raise SystemExit('DATABASE_REPLICA_URLS is required')
+    replica_dsn = replica_dsns[0]
+    os.environ['DATABASE_REPLICA_URLS'] = ','.join(replica_dsns + [dead_replica])
+    os.environ['DB_REPLICA_MAX_LAG_SECONDS'] = str(max_lag)
+    os.environ['DB_REPLICA_CHECK_SECONDS'] = '0'
+    users, tasks, achievements = (load_function(name) for name in ('users', 'tasks', 'achievements'))
+
+    results: List[Dict[str, Any]] = []
+
+    def expect(name: str, ok: bool, **details: Any) -> None:
+        results.append({'check': name, 'ok': ok, **details})
+
+    telegram_id = str(int(time.time() * 1000))
+    created = call(users, 'POST', body={'telegram_id': int(telegram_id), 'username': 'replica_check'})
+    user_id = created['json']['user']['id']
+    write_lsn = created['headers'].get('X-Db-Lsn')
+    expect('write returns X-Db-Lsn', created['statusCode'] == 201 and bool(write_lsn), lsn=write_lsn)
+
+    try:
+        wait_for_replay(replica_dsn, write_lsn)
+        reads = [
+            call(users, 'GET', {'telegram_id': telegram_id}),
+            call(tasks, 'GET', {'user_id': str(user_id)}),
+            call(achievements, 'GET', {'user_id': str(user_id)})
+        ] + [call(tasks, 'GET', {'user_id': str(user_id)}) for _ in range(4)]
+        expect('reads go to the live replica', all(r['statusCode'] == 200 and r['route'] == 'replica' for r in reads),
+               routes=[r['route'] for r in reads])
+        expect('unreachable replica is skipped', tasks.request_layer.replica_set.stats['down'] >= 1,
+               stats=tasks.request_layer.replica_set.stats)
+
+        set_replay_paused(replica_dsn, True)
+        try:
+            created_task = call(tasks, 'POST', body={'user_id': user_id, 'title': 'Проверка реплики',
+                                                      'description': '', 'interval': 'daily', 'priority': 'low'})
+            task_lsn = created_task['headers'].get('X-Db-Lsn')
+            expect('task write returns X-Db-Lsn', created_task['statusCode'] == 201 and bool(task_lsn), lsn=task_lsn)
+
+            fresh = call(tasks, 'GET', {'user_id': str(user_id)}, lsn=task_lsn)
+            expect('read with an unreplayed LSN goes to the primary and sees the write',
+                   fresh['route'] == 'primary' and len(fresh['json']['tasks']) == 1, route=fresh['route'])
+
+            time.sleep(max_lag + 0.5)
+            stale = call(tasks, 'GET', {'user_id': str(user_id)})
+            expect('replica lagging past DB_REPLICA_MAX_LAG_SECONDS is not used', stale['route'] == 'primary',
+                   route=stale['route'])
+        finally:
+            set_replay_paused(replica_dsn, False)
+
+        wait_for_replay(replica_dsn, task_lsn)
+        caught_up = call(tasks, 'GET', {'user_id': str(user_id)}, lsn=task_lsn)
+        expect('read with a replayed LSN goes back to the replica',
+               caught_up['route'] == 'replica' and len(caught_up['json']['tasks']) == 1, route=caught_up['route'])
+
+        invalid = call(tasks, 'GET', {'user_id': str(user_id)}, lsn='not-an-lsn')
+        expect('invalid X-Db-Lsn is rejected', invalid['statusCode'] == 400, status=invalid['statusCode'])
+    finally:
+        delete_users([user_id])
+
+    for result in results:
+        print(json.dumps(result, ensure_ascii=False))
+    failures = [result['check'] for result in results if not result['ok']]
+    for failure in failures:
+        print(f'FAIL {failure}', file=sys.stderr)
+    if failures:
+        sys.exit(1)
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--dead-replica', default='postgresql://postgres@127.0.0.1:1/app?connect_timeout=1')
+    parser.add_argument('--max-lag', type=float, default=1.0)
+    args = parser.parse_args()
+    main(args.dead_replica, args.max_lag)
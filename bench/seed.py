@@ -0,0 +1,94 @@
+'''
+Наполнение локальной базы объемами, близкими к боевым, для нагрузочных прогонов load.py.
+Пользователи создаются пачками, задания и user_achievements - одним INSERT ... SELECT на пачку.
+Повторный запуск досоздает недостающих пользователей и не трогает уже созданных.
+
+Запуск: python seed.py --users 100000 --tasks-per-user 100
+'''
+import argparse
+import json
+import os
+import time
+
+import psycopg2
+
+SEED_TELEGRAM_BASE = 9_000_000_000
+
+INSERT_USERS_QUERY = '''
+    INSERT INTO users (telegram_id, username, timezone)
+    SELECT %(base)s + n, 'seed_' || n,
+           (ARRAY['UTC', 'Europe/Moscow', 'Asia/Yekaterinburg', 'Asia/Novosibirsk'])[1 + n %% 4]
+    FROM generate_series(%(first)s, %(last)s) AS n
+    ON CONFLICT (telegram_id) DO NOTHING
+    RETURNING id
+'''
+
+INSERT_TASKS_QUERY = '''
+    INSERT INTO tasks (user_id, title, description, interval, assigned_to, status, priority, reminder_count,
+                       created_at, completed_at, remind_every_seconds, next_remind_at)
+    SELECT u.id,
+           'Задание ' || g,
+           'Сгенерировано для нагрузочного прогона',
+           spec.interval,
+           CASE WHEN g %% 10 = 0 THEN 'seed_helper' END,
+           spec.status,
+           (ARRAY['low', 'medium', 'high'])[1 + g %% 3],
+           (g * 7) %% 13,
+           spec.created_at,
+           CASE WHEN spec.status = 'completed' THEN spec.created_at + make_interval(hours => 1 + g %% 72) END,
+           spec.seconds,
+           CASE WHEN spec.status = 'active' THEN now() AT TIME ZONE 'UTC' + make_interval(secs => (g * 37) %% spec.seconds) END
+    FROM unnest(%(user_ids)s::integer[]) AS u(id)
+    CROSS JOIN generate_series(1, %(per_user)s) AS g
+    CROSS JOIN LATERAL (
+        SELECT CASE WHEN random() < 0.7 THEN 'completed' WHEN random() < 0.85 THEN 'active' ELSE 'archived' END AS status,
+               (now() AT TIME ZONE 'UTC') - make_interval(secs => random() * 180 * 86400) AS created_at,
+               (ARRAY['1hour', 'daily', 'weekly'])[1 + (u.id + g) %% 3] AS interval,
+               (ARRAY[3600, 86400, 604800])[1 + (u.id + g) %% 3] AS seconds
+    ) AS spec
+'''
+
+UPDATE_USER_TOTALS_QUERY = '''
+    UPDATE users u
+    SET total_completed = c.completed,
+        xp = c.completed * 25,
+        level = level_for_xp(c.completed * 25),
+        streak = COALESCE(s.streak, 0),
+        last_completed_on = s.last_completed_on
+    FROM (
+        SELECT user_id, COUNT(*)::INTEGER AS completed
+        FROM tasks
+        WHERE user_id = ANY(%(user_ids)s::integer[]) AND status = 'completed'
+        GROUP BY user_id
+    ) c
+    LEFT JOIN compute_user_streaks(%(user_ids)s::integer[]) s ON s.user_id = c.user_id
+    WHERE u.id = c.user_id
+'''
+
+def seed(users: int, tasks_per_user: int, chunk_size: int) -> None:
+    started = time.monotonic()
+    created_users = 0
+    with psycopg2.connect(os.environ['DATABASE_URL']) as conn, conn.cursor() as cursor:
+        for first in range(1, users + 1, chunk_size):
+            last = min(first + chunk_size - 1, users)
+            cursor.execute(INSERT_USERS_QUERY, {'base': SEED_TELEGRAM_BASE, 'first': first, 'last': last})
+            user_ids = [row[0] for row in cursor.fetchall()]
+            if user_ids:
+                cursor.execute(INSERT_TASKS_QUERY, {'user_ids': user_ids, 'per_user': tasks_per_user})
+                cursor.execute(UPDATE_USER_TOTALS_QUERY, {'user_ids': user_ids})
+                cursor.execute('SELECT COUNT(*) FROM evaluate_user_achievements(%s::integer[])', (user_ids,))
+            conn.commit()
+            created_users += len(user_ids)
+            print(json.dumps({'seeded_through': last, 'created_users': created_users,
+                              'elapsed_s': round(time.monotonic() - started, 1)}))
+
+        conn.autocommit = True
+        cursor.execute('ANALYZE users, tasks, user_achievements, user_task_stats, user_task_daily_stats')
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--users', type=int, default=2000)
+    parser.add_argument('--tasks-per-user', type=int, default=50)
+    parser.add_argument('--chunk-size', type=int, default=1000)
+    args = parser.parse_args()
+    seed(args.users, args.tasks_per_user, args.chunk_size)
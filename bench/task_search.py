@@ -0,0 +1,201 @@
+'''
+Задержка поиска заданий (tasks GET q=...) на большой таблице tasks. База доводится до --rows заданий
+у пользователей search_*: названия и описания собираются из словаря, число заданий на пользователя
+распределено неравномерно, так что есть и обычные, и "тяжелые" пользователи. Повторный запуск
+досоздает только недостающие строки.
+
+Запросы четырех видов - слово в другой словоформе, префикс, слово с опечаткой, фраза - идут через
+обработчик функции для пользователей с медианным числом заданий и из верхнего процента; печатаются
+задержки, доля запросов с результатом и доля ушедших в нечеткий поиск по видам, а также планы
+для самого тяжелого пользователя.
+
+Запуск: python task_search.py --rows 10000000 --users 100000 --queries 200
+'''
+import argparse
+import json
+import os
+import random
+import time
+from typing import Any, Dict, List, Tuple
+
+import psycopg2
+
+from common import load_function, percentile, summarize
+
+SEARCH_TELEGRAM_BASE = 8_000_000_000
+
+VERBS = ['Купить', 'Позвонить', 'Оплатить', 'Проверить', 'Забрать', 'Отправить', 'Подготовить',
+         'Записаться к', 'Починить', 'Прочитать', 'Заказать', 'Отменить']
+NOUNS = ['молоко', 'хлеб', 'квартплату', 'интернет', 'посылку', 'отчет', 'презентацию', 'стоматологу',
+         'велосипед', 'книгу', 'билеты', 'подарок', 'документы', 'счета', 'лекарства', 'машину', 'встречу',
+         'договор', 'резюме', 'страховку']
+DESCRIPTIONS = ['до пятницы', 'не забыть чек', 'срочно', 'в магазине у дома', 'после работы',
+                'через приложение банка', 'на почте', 'созвониться заранее', 'обсудить с командой', '']
+
+# Слово запроса в другой словоформе, чем в названии
+QUERY_WORDS = ['молока', 'квартплата', 'посылка', 'отчеты', 'презентации', 'стоматолог', 'велосипеды',
+               'книги', 'билет', 'подарки', 'документ', 'лекарство', 'договора', 'страховка']
+
+INSERT_USERS_QUERY = '''
+    INSERT INTO users (telegram_id, username)
+    SELECT %(base)s + n, 'search_' || n
+    FROM generate_series(1, %(users)s) AS n
+    ON CONFLICT (telegram_id) DO NOTHING
+'''
+
+INSERT_TASKS_QUERY = '''
+    INSERT INTO tasks (user_id, title, description, interval, status, priority, created_at, completed_at)
+    SELECT u.ids[1 + floor(cardinality(u.ids) * power(random(), 3))::INTEGER],
+           (%(verbs)s::TEXT[])[1 + floor(random() * cardinality(%(verbs)s::TEXT[]))::INTEGER] || ' ' ||
+           (%(nouns)s::TEXT[])[1 + floor(random() * cardinality(%(nouns)s::TEXT[]))::INTEGER] ||
+           CASE WHEN random() < 0.3
+                THEN ' и ' || (%(nouns)s::TEXT[])[1 + floor(random() * cardinality(%(nouns)s::TEXT[]))::INTEGER]
+                ELSE '' END,
+           (%(descriptions)s::TEXT[])[1 + floor(random() * cardinality(%(descriptions)s::TEXT[]))::INTEGER],
+           'daily',
+           spec.status,
+           'medium',
+           spec.created_at,
+           CASE WHEN spec.status = 'completed' THEN spec.created_at + INTERVAL '1 hour' END
+    FROM generate_series(1, %(count)s) AS g
+    CROSS JOIN (
+        SELECT array_agg(id ORDER BY id) AS ids FROM users WHERE telegram_id > %(base)s
+    ) AS u
+    CROSS JOIN LATERAL (
+        SELECT CASE WHEN random() < 0.5 THEN 'completed' ELSE 'active' END AS status,
+               (now() AT TIME ZONE 'UTC') - make_interval(secs => random() * 180 * 86400 + g %% 2) AS created_at
+    ) AS spec
+'''
+
+USER_TASK_COUNTS_QUERY = '''
+    SELECT t.user_id, COUNT(*) AS tasks
+    FROM tasks t
+    JOIN users u ON u.id = t.user_id
+    WHERE u.telegram_id > %s
+    GROUP BY t.user_id
+    ORDER BY tasks
+'''
+
+class Context:
+    request_id = 'task-search'
+    function_name = 'tasks'
+
+def seed(rows: int, users: int, chunk_size: int) -> None:
+    started = time.monotonic()
+    with psycopg2.connect(os.environ['DATABASE_URL']) as conn, conn.cursor() as cursor:
+        cursor.execute(INSERT_USERS_QUERY, {'base': SEARCH_TELEGRAM_BASE, 'users': users})
+        conn.commit()
+        cursor.execute('SELECT COUNT(*) FROM tasks')
+        existing = cursor.fetchone()[0]
+        while existing < rows:
+            count = min(chunk_size, rows - existing)
+            cursor.execute(INSERT_TASKS_QUERY, {
+                'base': SEARCH_TELEGRAM_BASE, 'count': count,
+                'verbs': VERBS, 'nouns': NOUNS, 'descriptions': DESCRIPTIONS
+            })
+            conn.commit()
+            existing += count
+            print(json.dumps({'tasks': existing, 'elapsed_s': round(time.monotonic() - started, 1)}))
+
+    # VACUUM не выполняется в транзакции, которую открывает with над соединением
+    conn = psycopg2.connect(os.environ['DATABASE_URL'])
+    try:
+        conn.autocommit = True
+        with conn.cursor() as cursor:
+            cursor.execute('VACUUM ANALYZE tasks')
+    finally:
+        conn.close()
+
+def make_queries(count: int, rng: random.Random) -> List[Tuple[str, str]]:
+    queries = []
+    for _ in range(count):
+        word = rng.choice(QUERY_WORDS)
+        position = rng.randint(1, len(word) - 2)
+        typo = word[:position] + rng.choice('аеиоу') + word[position + 1:]
+        queries.extend([
+            ('word', word),
+            ('prefix', word[:4]),
+            ('typo', typo),
+            ('phrase', f'{rng.choice(VERBS).split()[0].lower()} {word}')
+        ])
+    return queries
+
+def measure(module, user_ids: List[int], queries: List[Tuple[str, str]], rng: random.Random) -> Dict[str, Any]:
+    latencies: Dict[str, List[float]] = {}
+    found: Dict[str, int] = {}
+    fuzzy: Dict[str, int] = {}
+    for kind, text in queries:
+        params = {'user_id': str(rng.choice(user_ids)), 'q': text, 'limit': '20', 'fields': 'title'}
+        started = time.perf_counter()
+        response = module.handler({'httpMethod': 'GET', 'headers': {}, 'queryStringParameters': params}, Context())
+        latencies.setdefault(kind, []).append(time.perf_counter() - started)
+        if response['statusCode'] != 200:
+            raise SystemExit(f'search failed: {response["body"]}')
+        body = json.loads(response['body'])
+        found[kind] = found.get(kind, 0) + bool(body['tasks'])
+        fuzzy[kind] = fuzzy.get(kind, 0) + (body['match'] == 'fuzzy')
+    return {
+        kind: {**summarize(samples), 'p95_ms': round(percentile(samples, 0.95) * 1000, 3),
+               'hit_rate': round(found[kind] / len(samples), 2), 'fuzzy_rate': round(fuzzy[kind] / len(samples), 2)}
+        for kind, samples in latencies.items()
+    }
+
+def explain(cursor, module, mode: str, user_id: int, text: str) -> List[str]:
+    '''
+    План поискового запроса функции в режиме mode для пользователя и строки
+    Returns: строки EXPLAIN ANALYZE
+    '''
+    match, rank = module.TASK_SEARCH_MODES[mode]
+    query = f'''
+        SELECT id, {rank} AS rank
+        FROM all_tasks
+        WHERE user_id = %(user_id)s AND {match}
+        ORDER BY rank DESC, id DESC
+        LIMIT 21
+    '''
+    cursor.execute('SET work_mem = %s', (module.TASK_SEARCH_WORK_MEM,))
+    cursor.execute('SET pg_trgm.word_similarity_threshold = %s', (module.TASK_SEARCH_WORD_SIMILARITY,))
+    cursor.execute(f'EXPLAIN (ANALYZE, BUFFERS, COSTS OFF) {query}', {'user_id': user_id, 'q': text})
+    return [row[0] for row in cursor.fetchall()]
+
+def main() -> None:
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--rows', type=int, default=10_000_000)
+    parser.add_argument('--users', type=int, default=100_000)
+    parser.add_argument('--chunk-size', type=int, default=250_000)
+    parser.add_argument('--queries', type=int, default=200)
+    parser.add_argument('--seed', type=int, default=1)
+    args = parser.parse_args()
+
+    seed(args.rows, args.users, args.chunk_size)
+    rng = random.Random(args.seed)
+    module = load_function('tasks')
+
+    with psycopg2.connect(os.environ['DATABASE_URL']) as conn, conn.cursor() as cursor:
+        cursor.execute('SELECT COUNT(*) FROM tasks')
+        total = cursor.fetchone()[0]
+        cursor.execute(USER_TASK_COUNTS_QUERY, (SEARCH_TELEGRAM_BASE,))
+        counts = cursor.fetchall()
+        middle = len(counts) // 2
+        buckets = {
+            'typical': counts[max(0, middle - 50):middle + 50],
+            'heavy': counts[-max(1, len(counts) // 100):]
+        }
+
+        report: Dict[str, Any] = {'tasks': total, 'search_users': len(counts)}
+        queries = make_queries(args.queries // 4 or 1, rng)
+        for bucket, rows in buckets.items():
+            user_ids = [user_id for user_id, _ in rows]
+            report[bucket] = {
+                'tasks_per_user': round(sum(tasks for _, tasks in rows) / len(rows)),
+                'latency': measure(module, user_ids, queries, rng)
+            }
+        print(json.dumps(report, ensure_ascii=False))
+
+        heaviest = counts[-1][0]
+        for mode, text in (('fulltext', QUERY_WORDS[0]), ('fulltext', QUERY_WORDS[0][:4]), ('fuzzy', 'малака')):
+            print(f'-- user {heaviest}, {mode}, q={text}')
+            print('\n'.join(explain(cursor, module, mode, heaviest, text)))
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,57 @@
+'''
+Замер пропускной способности доставки напоминаний через поддельный Bot API.
+
+Запуск: python bench/telegram_delivery.py --reminders 2000 --users 500
+'''
+import argparse
+import asyncio
+import json
+import time
+
+import aiohttp
+from aiohttp import web
+
+from common import load_function
+from fake_telegram_api import FakeTelegramApi
+
+async def run(reminders_count: int, users: int, global_rate: float, concurrency: int) -> dict:
+    scheduler = load_function('scheduler')
+    fake = FakeTelegramApi()
+    runner = web.AppRunner(fake.make_app())
+    await runner.setup()
+    site = web.TCPSite(runner, '127.0.0.1', 0)
+    await site.start()
+    port = site._server.sockets[0].getsockname()[1]
+    
+    reminders = [
+        {'id': i, 'user_id': i % users, 'telegram_id': 1000 + i % users, 'title': f'Задание {i}'}
+        for i in range(reminders_count)
+    ]
+    
+    started = time.perf_counter()
+    async with aiohttp.ClientSession() as session:
+        sender = scheduler.TelegramSender(session, 'TEST', f'http://127.0.0.1:{port}', global_rate,
+                                          1.0, concurrency, scheduler.TELEGRAM_MAX_ATTEMPTS)
+        _, failed = await scheduler.dispatch_reminders(sender, reminders)
+    sent = sender.stats['sent']
+    elapsed = time.perf_counter() - started
+    await runner.cleanup()
+    
+    return {
+        'reminders': reminders_count,
+        'messages': sent,
+        'requeued_reminders': len(failed),
+        'elapsed_s': round(elapsed, 3),
+        'messages_per_s': round(sent / elapsed, 1) if elapsed else None,
+        'sender': sender.stats,
+        'server': fake.stats
+    }
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--reminders', type=int, default=2000)
+    parser.add_argument('--users', type=int, default=500)
+    parser.add_argument('--global-rate', type=float, default=25)
+    parser.add_argument('--concurrency', type=int, default=16)
+    args = parser.parse_args()
+    print(json.dumps(asyncio.run(run(args.reminders, args.users, args.global_rate, args.concurrency)), ensure_ascii=False))
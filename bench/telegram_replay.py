@@ -0,0 +1,131 @@
+'''
+Прогон потока обновлений Telegram через вебхук backend/telegram на базе, наполненной seed.py.
+Поток читается из NDJSON (одно Update на строку, например записанное из getUpdates) или
+генерируется по засеянным пользователям с долей повторных доставок. Обновления подаются пачками
+по --delivery-size (1 - как шлет Telegram) в --concurrency потоков; считаются пропускная способность,
+задержка доставки, отброшенные повторы и SQL-запросы на обновление.
+
+Запуск: python telegram_replay.py --generate 5000 --output updates.ndjson
+        python telegram_replay.py --input updates.ndjson --delivery-size 20 --concurrency 4
+'''
+import argparse
+import json
+import os
+import time
+from concurrent.futures import ThreadPoolExecutor
+from typing import Any, Dict, List, Tuple
+
+from common import load_function, percentile, summarize
+from load import Workload, counters, instrument
+
+def generate_updates(count: int, duplicate_rate: float, sample_users: int, seed_value: int) -> List[Dict[str, Any]]:
+    '''
+    Синтетический поток: /new, /done и /snooze по активным заданиям засеянных пользователей и /list;
+    часть обновлений доставляется повторно чуть позже, как при таймауте вебхука
+    '''
+    workload = Workload(sample_users, seed_value)
+    rng = workload.rng
+    first_update_id = int(time.time() * 1000)
+    updates = []
+    redeliveries: Dict[int, List[Dict[str, Any]]] = {}
+    for offset in range(count):
+        updates.extend(redeliveries.pop(offset, []))
+        _, telegram_id = workload.user()
+        kind = rng.random()
+        if kind < 0.4:
+            text = f'/done {workload.active_task()}'
+        elif kind < 0.6:
+            text = f'/snooze {workload.active_task()} 2hours'
+        elif kind < 0.9:
+            text = f'/new Повтор {offset} | daily'
+        else:
+            text = '/list'
+        update = {
+            'update_id': first_update_id + offset,
+            'message': {
+                'message_id': offset + 1,
+                'from': {'id': telegram_id, 'is_bot': False},
+                'chat': {'id': telegram_id, 'type': 'private'},
+                'date': int(time.time()),
+                'text': text
+            }
+        }
+        updates.append(update)
+        if rng.random() < duplicate_rate:
+            redeliveries.setdefault(offset + rng.randint(1, 50), []).append(update)
+    for offset in sorted(redeliveries):
+        updates.extend(redeliveries[offset])
+    return updates
+
+def replay(updates: List[Dict[str, Any]], delivery_size: int, concurrency: int) -> Dict[str, Any]:
+    # Вебхук без секрета отвечает 401, поэтому прогон задает его сам, если он не задан в окружении
+    secret = os.environ.setdefault('TELEGRAM_WEBHOOK_SECRET', 'replay-secret')
+    module = load_function('telegram')
+    instrument(module)
+
+    class Context:
+        request_id = 'replay'
+        function_name = 'telegram'
+
+    deliveries = [updates[start:start + delivery_size] for start in range(0, len(updates), delivery_size)]
+
+    def deliver(batch: List[Dict[str, Any]]) -> Tuple[float, int, Dict[str, Any], int]:
+        counters.queries = 0
+        counters.connections = 0
+        body = json.dumps(batch[0] if delivery_size == 1 else batch)
+        started = time.perf_counter()
+        response = module.handler({'httpMethod': 'POST', 'headers': {'X-Telegram-Bot-Api-Secret-Token': secret},
+                                   'body': body}, Context())
+        return time.perf_counter() - started, counters.queries, json.loads(response['body']), response['statusCode']
+
+    started = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=concurrency) as executor:
+        results = list(executor.map(deliver, deliveries))
+    elapsed = time.perf_counter() - started
+
+    latencies = [result[0] for result in results]
+    totals = {key: sum(result[2].get(key, 0) for result in results)
+              for key in ('received', 'duplicates', 'processed', 'ignored', 'replies', 'failedUsers')}
+    return {
+        'updates': len(updates),
+        'deliveries': len(deliveries),
+        'delivery_size': delivery_size,
+        'concurrency': concurrency,
+        'updates_per_s': round(len(updates) / elapsed, 1),
+        'delivery': {**summarize(latencies), 'p95_ms': round(percentile(latencies, 0.95) * 1000, 3)},
+        'queries_per_update': round(sum(result[1] for result in results) / len(updates), 2),
+        'errors': sum(1 for result in results if result[3] >= 500),
+        **totals
+    }
+
+def main() -> None:
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--input', help='NDJSON с обновлениями Telegram')
+    parser.add_argument('--generate', type=int, help='сгенерировать столько обновлений по засеянным пользователям')
+    parser.add_argument('--output', help='сохранить сгенерированный поток в NDJSON вместо прогона')
+    parser.add_argument('--duplicate-rate', type=float, default=0.05)
+    parser.add_argument('--sample-users', type=int, default=1000)
+    parser.add_argument('--seed', type=int, default=1)
+    parser.add_argument('--delivery-size', type=int, default=1)
+    parser.add_argument('--concurrency', type=int, default=int(os.environ.get('DB_POOL_MAX_SIZE', '4')))
+    args = parser.parse_args()
+
+    if args.input:
+        with open(args.input) as input_file:
+            updates = [json.loads(line) for line in input_file if line.strip()]
+    elif args.generate:
+        updates = generate_updates(args.generate, args.duplicate_rate, args.sample_users, args.seed)
+    else:
+        parser.error('--input or --generate is required')
+
+    if args.output:
+        with open(args.output, 'w') as output_file:
+            for update in updates:
+                output_file.write(json.dumps(update, ensure_ascii=False) + '\n')
+        print(json.dumps({'written': len(updates), 'output': args.output}))
+        return
+
+    print(json.dumps(replay(updates, args.delivery_size, args.concurrency), ensure_ascii=False))
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,21 @@
+-- Длительность интервала напоминаний в секундах и время следующего напоминания
+ALTER TABLE tasks ADD COLUMN IF NOT EXISTS remind_every_seconds INTEGER;
+ALTER TABLE tasks ADD COLUMN IF NOT EXISTS next_remind_at TIMESTAMP;
+
+-- Заполнение расписания для уже созданных заданий
+UPDATE tasks
+SET remind_every_seconds = CASE interval
+        WHEN '30min' THEN 1800
+        WHEN '1hour' THEN 3600
+        WHEN '2hours' THEN 7200
+        WHEN 'daily' THEN 86400
+    END
+WHERE remind_every_seconds IS NULL;
+
+UPDATE tasks
+SET next_remind_at = CURRENT_TIMESTAMP + make_interval(secs => remind_every_seconds)
+WHERE status = 'active' AND remind_every_seconds IS NOT NULL AND next_remind_at IS NULL;
+
+-- Частичный индекс для выборки созревших напоминаний по активным заданиям
+CREATE INDEX IF NOT EXISTS idx_tasks_next_remind_at ON tasks(next_remind_at)
+    WHERE status = 'active' AND next_remind_at IS NOT NULL;
@@ -0,0 +1,8 @@
+-- Метрика, по которой считается прогресс достижения
+ALTER TABLE achievements ADD COLUMN IF NOT EXISTS metric VARCHAR(50);
+
+UPDATE achievements SET metric = 'tasks_created' WHERE title = 'Первые шаги' AND metric IS NULL;
+UPDATE achievements SET metric = 'tasks_completed' WHERE title IN ('Мастер продуктивности', 'Непобедимый') AND metric IS NULL;
+UPDATE achievements SET metric = 'tasks_assigned' WHERE title = 'Командный игрок' AND metric IS NULL;
+UPDATE achievements SET metric = 'streak' WHERE title = 'Марафонец' AND metric IS NULL;
+UPDATE achievements SET metric = 'level' WHERE title = 'Легенда' AND metric IS NULL;
@@ -0,0 +1,53 @@
+-- Пересчет достижений пользователей по фактическим метрикам одним запросом.
+-- Возвращает измененные строки user_achievements и признак нового открытия.
+CREATE OR REPLACE FUNCTION evaluate_user_achievements(p_user_ids INTEGER[])
+RETURNS TABLE (user_id INTEGER, achievement_id INTEGER, progress INTEGER, unlocked BOOLEAN, newly_unlocked BOOLEAN)
+LANGUAGE sql
+AS $$
+    WITH task_counts AS (
+        SELECT t.user_id,
+               COUNT(*) AS tasks_created,
+               COUNT(*) FILTER (WHERE t.assigned_to IS NOT NULL AND t.assigned_to <> '') AS tasks_assigned
+        FROM tasks t
+        WHERE t.user_id = ANY(p_user_ids)
+        GROUP BY t.user_id
+    ),
+    metric_values AS (
+        SELECT u.id AS user_id, m.metric, COALESCE(m.value, 0) AS value
+        FROM users u
+        LEFT JOIN task_counts tc ON tc.user_id = u.id
+        CROSS JOIN LATERAL (VALUES
+            ('tasks_created', tc.tasks_created::INTEGER),
+            ('tasks_completed', u.total_completed),
+            ('tasks_assigned', tc.tasks_assigned::INTEGER),
+            ('streak', u.streak),
+            ('level', u.level)
+        ) AS m(metric, value)
+        WHERE u.id = ANY(p_user_ids)
+    ),
+    previous AS (
+        SELECT ua.user_id, ua.achievement_id, ua.unlocked
+        FROM user_achievements ua
+        WHERE ua.user_id = ANY(p_user_ids)
+    ),
+    evaluated AS (
+        INSERT INTO user_achievements AS ua (user_id, achievement_id, progress, unlocked, unlocked_at)
+        SELECT mv.user_id, a.id, mv.value, mv.value >= a.required_count,
+               CASE WHEN mv.value >= a.required_count THEN CURRENT_TIMESTAMP END
+        FROM metric_values mv
+        JOIN achievements a ON a.metric = mv.metric
+        ON CONFLICT (user_id, achievement_id) DO UPDATE SET
+            progress = CASE WHEN ua.unlocked OR EXCLUDED.unlocked
+                            THEN GREATEST(ua.progress, EXCLUDED.progress)
+                            ELSE EXCLUDED.progress END,
+            unlocked = ua.unlocked OR EXCLUDED.unlocked,
+            unlocked_at = COALESCE(ua.unlocked_at, EXCLUDED.unlocked_at)
+        WHERE ua.progress IS DISTINCT FROM EXCLUDED.progress
+           OR (EXCLUDED.unlocked AND NOT COALESCE(ua.unlocked, false))
+        RETURNING ua.user_id, ua.achievement_id, ua.progress, ua.unlocked
+    )
+    SELECT e.user_id, e.achievement_id, e.progress, e.unlocked,
+           e.unlocked AND NOT COALESCE(p.unlocked, false) AS newly_unlocked
+    FROM evaluated e
+    LEFT JOIN previous p ON p.user_id = e.user_id AND p.achievement_id = e.achievement_id
+$$;
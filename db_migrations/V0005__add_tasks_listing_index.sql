@@ -0,0 +1,2 @@
+-- Составной индекс для постраничного списка заданий пользователя по курсору (created_at, id)
+CREATE INDEX IF NOT EXISTS idx_tasks_user_status_created ON tasks(user_id, status, created_at DESC, id DESC);
@@ -0,0 +1,25 @@
+-- Версии редко меняющихся справочников для инвалидации кэшей в функциях
+CREATE TABLE IF NOT EXISTS cache_versions (
+    name VARCHAR(100) PRIMARY KEY,
+    version BIGINT NOT NULL DEFAULT 1,
+    updated_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+);
+
+INSERT INTO cache_versions (name) VALUES ('achievements') ON CONFLICT DO NOTHING;
+
+-- Любое изменение каталога достижений увеличивает его версию
+CREATE OR REPLACE FUNCTION bump_achievements_version() RETURNS TRIGGER
+LANGUAGE plpgsql
+AS $$
+BEGIN
+    UPDATE cache_versions
+    SET version = version + 1, updated_at = CURRENT_TIMESTAMP
+    WHERE name = 'achievements';
+    RETURN NULL;
+END;
+$$;
+
+DROP TRIGGER IF EXISTS trg_achievements_version ON achievements;
+CREATE TRIGGER trg_achievements_version
+    AFTER INSERT OR UPDATE OR DELETE OR TRUNCATE ON achievements
+    FOR EACH STATEMENT EXECUTE FUNCTION bump_achievements_version();
@@ -0,0 +1,69 @@
+-- Счетчики изменений заданий и достижений пользователя для ETag
+ALTER TABLE users ADD COLUMN IF NOT EXISTS tasks_version BIGINT NOT NULL DEFAULT 0;
+ALTER TABLE users ADD COLUMN IF NOT EXISTS achievements_version BIGINT NOT NULL DEFAULT 0;
+
+-- Поддержание updated_at при изменении строк
+CREATE OR REPLACE FUNCTION set_updated_at() RETURNS TRIGGER
+LANGUAGE plpgsql
+AS $$
+BEGIN
+    NEW.updated_at = CURRENT_TIMESTAMP;
+    RETURN NEW;
+END;
+$$;
+
+DROP TRIGGER IF EXISTS trg_users_updated_at ON users;
+CREATE TRIGGER trg_users_updated_at
+    BEFORE UPDATE OF username, level, xp, total_completed, streak ON users
+    FOR EACH ROW EXECUTE FUNCTION set_updated_at();
+
+DROP TRIGGER IF EXISTS trg_tasks_updated_at ON tasks;
+CREATE TRIGGER trg_tasks_updated_at
+    BEFORE UPDATE ON tasks
+    FOR EACH ROW EXECUTE FUNCTION set_updated_at();
+
+-- Один UPDATE users на оператор, а не на каждую измененную строку
+CREATE OR REPLACE FUNCTION bump_user_tasks_version() RETURNS TRIGGER
+LANGUAGE plpgsql
+AS $$
+BEGIN
+    UPDATE users SET tasks_version = tasks_version + 1
+    WHERE id IN (SELECT DISTINCT user_id FROM changed_rows);
+    RETURN NULL;
+END;
+$$;
+
+CREATE OR REPLACE FUNCTION bump_user_achievements_version() RETURNS TRIGGER
+LANGUAGE plpgsql
+AS $$
+BEGIN
+    UPDATE users SET achievements_version = achievements_version + 1
+    WHERE id IN (SELECT DISTINCT user_id FROM changed_rows);
+    RETURN NULL;
+END;
+$$;
+
+DROP TRIGGER IF EXISTS trg_tasks_version_insert ON tasks;
+CREATE TRIGGER trg_tasks_version_insert
+    AFTER INSERT ON tasks REFERENCING NEW TABLE AS changed_rows
+    FOR EACH STATEMENT EXECUTE FUNCTION bump_user_tasks_version();
+
+DROP TRIGGER IF EXISTS trg_tasks_version_update ON tasks;
+CREATE TRIGGER trg_tasks_version_update
+    AFTER UPDATE ON tasks REFERENCING NEW TABLE AS changed_rows
+    FOR EACH STATEMENT EXECUTE FUNCTION bump_user_tasks_version();
+
+DROP TRIGGER IF EXISTS trg_tasks_version_delete ON tasks;
+CREATE TRIGGER trg_tasks_version_delete
+    AFTER DELETE ON tasks REFERENCING OLD TABLE AS changed_rows
+    FOR EACH STATEMENT EXECUTE FUNCTION bump_user_tasks_version();
+
+DROP TRIGGER IF EXISTS trg_user_achievements_version_insert ON user_achievements;
+CREATE TRIGGER trg_user_achievements_version_insert
+    AFTER INSERT ON user_achievements REFERENCING NEW TABLE AS changed_rows
+    FOR EACH STATEMENT EXECUTE FUNCTION bump_user_achievements_version();
+
+DROP TRIGGER IF EXISTS trg_user_achievements_version_update ON user_achievements;
+CREATE TRIGGER trg_user_achievements_version_update
+    AFTER UPDATE ON user_achievements REFERENCING NEW TABLE AS changed_rows
+    FOR EACH STATEMENT EXECUTE FUNCTION bump_user_achievements_version();
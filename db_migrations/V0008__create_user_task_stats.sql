@@ -0,0 +1,159 @@
+-- Денормализованные счетчики заданий пользователя по статусу и приоритету
+CREATE TABLE IF NOT EXISTS user_task_stats (
+    user_id INTEGER NOT NULL REFERENCES users(id),
+    priority VARCHAR(50) NOT NULL,
+    status VARCHAR(50) NOT NULL,
+    task_count INTEGER NOT NULL DEFAULT 0,
+    PRIMARY KEY (user_id, priority, status)
+);
+
+-- Счетчики созданных и выполненных заданий по дням
+CREATE TABLE IF NOT EXISTS user_task_daily_stats (
+    user_id INTEGER NOT NULL REFERENCES users(id),
+    day DATE NOT NULL,
+    created_count INTEGER NOT NULL DEFAULT 0,
+    completed_count INTEGER NOT NULL DEFAULT 0,
+    PRIMARY KEY (user_id, day)
+);
+
+-- Заполнение счетчиков по уже существующим заданиям
+INSERT INTO user_task_stats (user_id, priority, status, task_count)
+SELECT user_id, COALESCE(priority, 'medium'), COALESCE(status, 'active'), COUNT(*)
+FROM tasks
+WHERE user_id IS NOT NULL
+GROUP BY 1, 2, 3
+ON CONFLICT (user_id, priority, status) DO UPDATE SET task_count = EXCLUDED.task_count;
+
+INSERT INTO user_task_daily_stats (user_id, day, created_count, completed_count)
+SELECT user_id, day, SUM(created), SUM(completed)
+FROM (
+    SELECT user_id, created_at::date AS day, 1 AS created, 0 AS completed
+    FROM tasks WHERE user_id IS NOT NULL AND created_at IS NOT NULL
+    UNION ALL
+    SELECT user_id, completed_at::date, 0, 1
+    FROM tasks WHERE user_id IS NOT NULL AND status = 'completed' AND completed_at IS NOT NULL
+) events
+GROUP BY user_id, day
+ON CONFLICT (user_id, day) DO UPDATE SET
+    created_count = EXCLUDED.created_count,
+    completed_count = EXCLUDED.completed_count;
+
+-- Инкрементальное обновление счетчиков: по одному upsert на оператор
+CREATE OR REPLACE FUNCTION task_stats_on_insert() RETURNS TRIGGER
+LANGUAGE plpgsql
+AS $$
+BEGIN
+    INSERT INTO user_task_stats AS s (user_id, priority, status, task_count)
+    SELECT user_id, COALESCE(priority, 'medium'), COALESCE(status, 'active'), COUNT(*)
+    FROM new_rows
+    WHERE user_id IS NOT NULL
+    GROUP BY 1, 2, 3
+    ON CONFLICT (user_id, priority, status) DO UPDATE SET task_count = s.task_count + EXCLUDED.task_count;
+
+    INSERT INTO user_task_daily_stats AS d (user_id, day, created_count, completed_count)
+    SELECT user_id, day, SUM(created), SUM(completed)
+    FROM (
+        SELECT user_id, created_at::date AS day, 1 AS created, 0 AS completed
+        FROM new_rows WHERE user_id IS NOT NULL AND created_at IS NOT NULL
+        UNION ALL
+        SELECT user_id, completed_at::date, 0, 1
+        FROM new_rows WHERE user_id IS NOT NULL AND status = 'completed' AND completed_at IS NOT NULL
+    ) events
+    GROUP BY user_id, day
+    ON CONFLICT (user_id, day) DO UPDATE SET
+        created_count = d.created_count + EXCLUDED.created_count,
+        completed_count = d.completed_count + EXCLUDED.completed_count;
+    RETURN NULL;
+END;
+$$;
+
+CREATE OR REPLACE FUNCTION task_stats_on_update() RETURNS TRIGGER
+LANGUAGE plpgsql
+AS $$
+BEGIN
+    INSERT INTO user_task_stats AS s (user_id, priority, status, task_count)
+    SELECT user_id, priority, status, SUM(delta)
+    FROM (
+        SELECT o.user_id, COALESCE(o.priority, 'medium') AS priority, COALESCE(o.status, 'active') AS status, -1 AS delta
+        FROM old_rows o JOIN new_rows n ON n.id = o.id
+        WHERE o.user_id IS NOT NULL
+          AND (o.status IS DISTINCT FROM n.status OR o.priority IS DISTINCT FROM n.priority
+               OR o.user_id IS DISTINCT FROM n.user_id)
+        UNION ALL
+        SELECT n.user_id, COALESCE(n.priority, 'medium'), COALESCE(n.status, 'active'), 1
+        FROM old_rows o JOIN new_rows n ON n.id = o.id
+        WHERE n.user_id IS NOT NULL
+          AND (o.status IS DISTINCT FROM n.status OR o.priority IS DISTINCT FROM n.priority
+               OR o.user_id IS DISTINCT FROM n.user_id)
+    ) deltas
+    GROUP BY user_id, priority, status
+    HAVING SUM(delta) <> 0
+    ON CONFLICT (user_id, priority, status) DO UPDATE SET task_count = s.task_count + EXCLUDED.task_count;
+
+    INSERT INTO user_task_daily_stats AS d (user_id, day, completed_count)
+    SELECT user_id, day, SUM(delta)
+    FROM (
+        SELECT n.user_id, n.completed_at::date AS day, 1 AS delta
+        FROM old_rows o JOIN new_rows n ON n.id = o.id
+        WHERE n.user_id IS NOT NULL AND n.status = 'completed' AND n.completed_at IS NOT NULL
+          AND (o.status IS DISTINCT FROM 'completed' OR o.completed_at IS NULL)
+        UNION ALL
+        SELECT o.user_id, o.completed_at::date, -1
+        FROM old_rows o JOIN new_rows n ON n.id = o.id
+        WHERE o.user_id IS NOT NULL AND o.status = 'completed' AND o.completed_at IS NOT NULL
+          AND (n.status IS DISTINCT FROM 'completed' OR n.completed_at IS NULL)
+    ) deltas
+    GROUP BY user_id, day
+    HAVING SUM(delta) <> 0
+    ON CONFLICT (user_id, day) DO UPDATE SET completed_count = d.completed_count + EXCLUDED.completed_count;
+    RETURN NULL;
+END;
+$$;
+
+CREATE OR REPLACE FUNCTION task_stats_on_delete() RETURNS TRIGGER
+LANGUAGE plpgsql
+AS $$
+BEGIN
+    UPDATE user_task_stats s
+    SET task_count = s.task_count - d.removed
+    FROM (
+        SELECT user_id, COALESCE(priority, 'medium') AS priority, COALESCE(status, 'active') AS status, COUNT(*) AS removed
+        FROM old_rows
+        WHERE user_id IS NOT NULL
+        GROUP BY 1, 2, 3
+    ) d
+    WHERE s.user_id = d.user_id AND s.priority = d.priority AND s.status = d.status;
+
+    UPDATE user_task_daily_stats s
+    SET created_count = s.created_count - d.created,
+        completed_count = s.completed_count - d.completed
+    FROM (
+        SELECT user_id, day, SUM(created) AS created, SUM(completed) AS completed
+        FROM (
+            SELECT user_id, created_at::date AS day, 1 AS created, 0 AS completed
+            FROM old_rows WHERE user_id IS NOT NULL AND created_at IS NOT NULL
+            UNION ALL
+            SELECT user_id, completed_at::date, 0, 1
+            FROM old_rows WHERE user_id IS NOT NULL AND status = 'completed' AND completed_at IS NOT NULL
+        ) events
+        GROUP BY user_id, day
+    ) d
+    WHERE s.user_id = d.user_id AND s.day = d.day;
+    RETURN NULL;
+END;
+$$;
+
+DROP TRIGGER IF EXISTS trg_task_stats_insert ON tasks;
+CREATE TRIGGER trg_task_stats_insert
+    AFTER INSERT ON tasks REFERENCING NEW TABLE AS new_rows
+    FOR EACH STATEMENT EXECUTE FUNCTION task_stats_on_insert();
+
+DROP TRIGGER IF EXISTS trg_task_stats_update ON tasks;
+CREATE TRIGGER trg_task_stats_update
+    AFTER UPDATE ON tasks REFERENCING OLD TABLE AS old_rows NEW TABLE AS new_rows
+    FOR EACH STATEMENT EXECUTE FUNCTION task_stats_on_update();
+
+DROP TRIGGER IF EXISTS trg_task_stats_delete ON tasks;
+CREATE TRIGGER trg_task_stats_delete
+    AFTER DELETE ON tasks REFERENCING OLD TABLE AS old_rows
+    FOR EACH STATEMENT EXECUTE FUNCTION task_stats_on_delete();
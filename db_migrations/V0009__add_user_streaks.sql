@@ -0,0 +1,74 @@
+-- Часовой пояс пользователя и дата последнего выполнения для инкрементального расчета серии
+ALTER TABLE users ADD COLUMN IF NOT EXISTS timezone VARCHAR(64) NOT NULL DEFAULT 'UTC';
+ALTER TABLE users ADD COLUMN IF NOT EXISTS last_completed_on DATE;
+
+-- Выполненные задания пользователя по времени выполнения для пересчета серий
+CREATE INDEX IF NOT EXISTS idx_tasks_user_completed_at
+    ON tasks (user_id, completed_at DESC)
+    WHERE status = 'completed' AND completed_at IS NOT NULL;
+
+-- Изменение часового пояса тоже меняет представление пользователя
+DROP TRIGGER IF EXISTS trg_users_updated_at ON users;
+CREATE TRIGGER trg_users_updated_at
+    BEFORE UPDATE OF username, level, xp, total_completed, streak, timezone ON users
+    FOR EACH ROW EXECUTE FUNCTION set_updated_at();
+
+-- Локальная дата пользователя для момента времени, сохраненного в UTC
+CREATE OR REPLACE FUNCTION user_local_date(p_at TIMESTAMP, p_timezone TEXT)
+RETURNS DATE
+LANGUAGE sql STABLE
+AS $$
+    SELECT ((p_at AT TIME ZONE 'UTC') AT TIME ZONE COALESCE(p_timezone, 'UTC'))::date
+$$;
+
+-- Новое значение серии после выполнения задания в локальный день p_day
+CREATE OR REPLACE FUNCTION next_streak(p_streak INTEGER, p_last_completed_on DATE, p_day DATE)
+RETURNS INTEGER
+LANGUAGE sql IMMUTABLE
+AS $$
+    SELECT CASE
+        WHEN p_last_completed_on IS NULL OR p_day > p_last_completed_on + 1 THEN 1
+        WHEN p_day = p_last_completed_on + 1 THEN COALESCE(p_streak, 0) + 1
+        ELSE GREATEST(COALESCE(p_streak, 0), 1)
+    END
+$$;
+
+-- Полный пересчет серий по истории выполнений: подряд идущие локальные дни образуют остров,
+-- текущая серия - последний остров, если он заканчивается сегодня или вчера
+CREATE OR REPLACE FUNCTION compute_user_streaks(p_user_ids INTEGER[])
+RETURNS TABLE (user_id INTEGER, streak INTEGER, last_completed_on DATE)
+LANGUAGE sql STABLE
+AS $$
+    WITH days AS (
+        SELECT DISTINCT t.user_id, user_local_date(t.completed_at, u.timezone) AS day
+        FROM tasks t
+        JOIN users u ON u.id = t.user_id
+        WHERE t.user_id = ANY(p_user_ids) AND t.status = 'completed' AND t.completed_at IS NOT NULL
+    ),
+    islands AS (
+        SELECT d.user_id, d.day,
+               d.day - (ROW_NUMBER() OVER (PARTITION BY d.user_id ORDER BY d.day))::INTEGER AS island
+        FROM days d
+    ),
+    runs AS (
+        SELECT i.user_id, COUNT(*)::INTEGER AS length, MAX(i.day) AS last_day
+        FROM islands i
+        GROUP BY i.user_id, i.island
+    )
+    SELECT u.id,
+           CASE WHEN r.last_day >= user_local_date((now() AT TIME ZONE 'UTC'), u.timezone) - 1
+                THEN r.length ELSE 0 END,
+           r.last_day
+    FROM users u
+    LEFT JOIN LATERAL (
+        SELECT r.length, r.last_day FROM runs r WHERE r.user_id = u.id ORDER BY r.last_day DESC LIMIT 1
+    ) r ON true
+    WHERE u.id = ANY(p_user_ids)
+$$;
+
+-- Заполнение серий по уже выполненным заданиям
+UPDATE users u
+SET streak = COALESCE(s.streak, 0), last_completed_on = s.last_completed_on
+FROM compute_user_streaks(ARRAY(SELECT id FROM users)) s
+WHERE s.user_id = u.id
+  AND (u.streak IS DISTINCT FROM COALESCE(s.streak, 0) OR u.last_completed_on IS DISTINCT FROM s.last_completed_on);
@@ -0,0 +1,4 @@
+-- Покрывающий индекс рейтинга: снимок (id, xp, level, total_completed) читается index-only scan,
+-- верх рейтинга по xp - без сортировки
+CREATE INDEX IF NOT EXISTS idx_users_leaderboard
+    ON users (xp DESC, id) INCLUDE (level, total_completed);
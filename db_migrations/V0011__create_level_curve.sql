@@ -0,0 +1,11 @@
+-- Кривая уровней в замкнутой форме: уровень L + 1 открывается при накопленном xp >= L * 100,
+-- поэтому любой прирост xp применяется одним UPDATE без повторных вызовов
+CREATE OR REPLACE FUNCTION level_for_xp(p_xp INTEGER)
+RETURNS INTEGER
+LANGUAGE sql IMMUTABLE PARALLEL SAFE
+AS $$
+    SELECT GREATEST(COALESCE(p_xp, 0), 0) / 100 + 1
+$$;
+
+-- Подтягивание уровней, отставших из-за прежнего повышения не более чем на один уровень за вызов
+UPDATE users SET level = level_for_xp(xp) WHERE level < level_for_xp(xp);
@@ -0,0 +1,152 @@
+-- Архив давно выполненных заданий, секционированный по месяцу completed_at.
+-- Строки переносятся из tasks фоновой задачей планировщика (job=archive_tasks) с теми же id;
+-- колонки совпадают с tasks по составу и порядку, новые колонки tasks нужно добавлять и сюда
+CREATE TABLE IF NOT EXISTS tasks_archive (
+    LIKE tasks,
+    PRIMARY KEY (id, completed_at)
+) PARTITION BY RANGE (completed_at);
+
+-- Листинг выполненных заданий пользователя по архиву в том же порядке, что и по tasks
+CREATE INDEX IF NOT EXISTS idx_tasks_archive_user_created
+    ON tasks_archive (user_id, created_at DESC, id DESC);
+
+-- Секция архива за месяц, в который попадает p_month; создается планировщиком перед переносом.
+-- Возвращает имя созданной секции или NULL, если она уже есть
+CREATE OR REPLACE FUNCTION create_tasks_archive_partition(p_month DATE)
+RETURNS TEXT
+LANGUAGE plpgsql
+AS $$
+DECLARE
+    month_start DATE := date_trunc('month', p_month)::DATE;
+    partition_name TEXT := 'tasks_archive_' || to_char(month_start, 'YYYY_MM');
+BEGIN
+    IF to_regclass(partition_name) IS NOT NULL THEN
+        RETURN NULL;
+    END IF;
+    EXECUTE format(
+        'CREATE TABLE %I PARTITION OF tasks_archive FOR VALUES FROM (%L) TO (%L)',
+        partition_name, month_start, (month_start + INTERVAL '1 month')::DATE
+    );
+    RETURN partition_name;
+END;
+$$;
+
+-- Все задания пользователя: оперативные и архивные
+CREATE OR REPLACE VIEW all_tasks AS
+SELECT * FROM tasks
+UNION ALL
+SELECT * FROM tasks_archive;
+
+-- Перенос в архив удаляет строки из tasks, но задания остаются: счетчики и версия листинга
+-- при этом не меняются. Планировщик выставляет app.archiving на время транзакции переноса
+DROP TRIGGER IF EXISTS trg_task_stats_delete ON tasks;
+CREATE TRIGGER trg_task_stats_delete
+    AFTER DELETE ON tasks REFERENCING OLD TABLE AS old_rows
+    FOR EACH STATEMENT
+    WHEN (current_setting('app.archiving', true) IS DISTINCT FROM 'on')
+    EXECUTE FUNCTION task_stats_on_delete();
+
+DROP TRIGGER IF EXISTS trg_tasks_version_delete ON tasks;
+CREATE TRIGGER trg_tasks_version_delete
+    AFTER DELETE ON tasks REFERENCING OLD TABLE AS changed_rows
+    FOR EACH STATEMENT
+    WHEN (current_setting('app.archiving', true) IS DISTINCT FROM 'on')
+    EXECUTE FUNCTION bump_user_tasks_version();
+
+-- Кандидаты на перенос в архив по времени выполнения
+CREATE INDEX IF NOT EXISTS idx_tasks_completed_at
+    ON tasks (completed_at)
+    WHERE status = 'completed' AND completed_at IS NOT NULL;
+
+-- Частичный индекс листинга активных заданий: не растет вместе с историей выполненных
+CREATE INDEX IF NOT EXISTS idx_tasks_active_user_created
+    ON tasks (user_id, created_at DESC, id DESC)
+    WHERE status = 'active';
+
+-- Оба индекса покрываются idx_tasks_user_status_created и частичными индексами выше
+DROP INDEX IF EXISTS idx_tasks_user_id;
+DROP INDEX IF EXISTS idx_tasks_status;
+
+-- Метрики достижений и серии считаются по всей истории, включая архив
+CREATE OR REPLACE FUNCTION evaluate_user_achievements(p_user_ids INTEGER[])
+RETURNS TABLE (user_id INTEGER, achievement_id INTEGER, progress INTEGER, unlocked BOOLEAN, newly_unlocked BOOLEAN)
+LANGUAGE sql
+AS $$
+    WITH task_counts AS (
+        SELECT t.user_id,
+               COUNT(*) AS tasks_created,
+               COUNT(*) FILTER (WHERE t.assigned_to IS NOT NULL AND t.assigned_to <> '') AS tasks_assigned
+        FROM all_tasks t
+        WHERE t.user_id = ANY(p_user_ids)
+        GROUP BY t.user_id
+    ),
+    metric_values AS (
+        SELECT u.id AS user_id, m.metric, COALESCE(m.value, 0) AS value
+        FROM users u
+        LEFT JOIN task_counts tc ON tc.user_id = u.id
+        CROSS JOIN LATERAL (VALUES
+            ('tasks_created', tc.tasks_created::INTEGER),
+            ('tasks_completed', u.total_completed),
+            ('tasks_assigned', tc.tasks_assigned::INTEGER),
+            ('streak', u.streak),
+            ('level', u.level)
+        ) AS m(metric, value)
+        WHERE u.id = ANY(p_user_ids)
+    ),
+    previous AS (
+        SELECT ua.user_id, ua.achievement_id, ua.unlocked
+        FROM user_achievements ua
+        WHERE ua.user_id = ANY(p_user_ids)
+    ),
+    evaluated AS (
+        INSERT INTO user_achievements AS ua (user_id, achievement_id, progress, unlocked, unlocked_at)
+        SELECT mv.user_id, a.id, mv.value, mv.value >= a.required_count,
+               CASE WHEN mv.value >= a.required_count THEN CURRENT_TIMESTAMP END
+        FROM metric_values mv
+        JOIN achievements a ON a.metric = mv.metric
+        ON CONFLICT (user_id, achievement_id) DO UPDATE SET
+            progress = CASE WHEN ua.unlocked OR EXCLUDED.unlocked
+                            THEN GREATEST(ua.progress, EXCLUDED.progress)
+                            ELSE EXCLUDED.progress END,
+            unlocked = ua.unlocked OR EXCLUDED.unlocked,
+            unlocked_at = COALESCE(ua.unlocked_at, EXCLUDED.unlocked_at)
+        WHERE ua.progress IS DISTINCT FROM EXCLUDED.progress
+           OR (EXCLUDED.unlocked AND NOT COALESCE(ua.unlocked, false))
+        RETURNING ua.user_id, ua.achievement_id, ua.progress, ua.unlocked
+    )
+    SELECT e.user_id, e.achievement_id, e.progress, e.unlocked,
+           e.unlocked AND NOT COALESCE(p.unlocked, false) AS newly_unlocked
+    FROM evaluated e
+    LEFT JOIN previous p ON p.user_id = e.user_id AND p.achievement_id = e.achievement_id
+$$;
+
+CREATE OR REPLACE FUNCTION compute_user_streaks(p_user_ids INTEGER[])
+RETURNS TABLE (user_id INTEGER, streak INTEGER, last_completed_on DATE)
+LANGUAGE sql STABLE
+AS $$
+    WITH days AS (
+        SELECT DISTINCT t.user_id, user_local_date(t.completed_at, u.timezone) AS day
+        FROM all_tasks t
+        JOIN users u ON u.id = t.user_id
+        WHERE t.user_id = ANY(p_user_ids) AND t.status = 'completed' AND t.completed_at IS NOT NULL
+    ),
+    islands AS (
+        SELECT d.user_id, d.day,
+               d.day - (ROW_NUMBER() OVER (PARTITION BY d.user_id ORDER BY d.day))::INTEGER AS island
+        FROM days d
+    ),
+    runs AS (
+        SELECT i.user_id, COUNT(*)::INTEGER AS length, MAX(i.day) AS last_day
+        FROM islands i
+        GROUP BY i.user_id, i.island
+    )
+    SELECT u.id,
+           CASE WHEN r.last_day >= user_local_date((now() AT TIME ZONE 'UTC'), u.timezone) - 1
+                THEN r.length ELSE 0 END,
+           r.last_day
+    FROM users u
+    LEFT JOIN LATERAL (
+        SELECT r.length, r.last_day FROM runs r WHERE r.user_id = u.id ORDER BY r.last_day DESC LIMIT 1
+    ) r ON true
+    WHERE u.id = ANY(p_user_ids)
+$$;
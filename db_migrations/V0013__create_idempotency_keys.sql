@@ -0,0 +1,15 @@
+-- Ключи идемпотентности записей: повтор запроса с тем же Idempotency-Key получает сохраненный ответ.
+-- scope - имя обработчика маршрута, request_hash - md5 метода, параметров и тела запроса
+CREATE TABLE IF NOT EXISTS idempotency_keys (
+    scope VARCHAR(64) NOT NULL,
+    idempotency_key VARCHAR(255) NOT NULL,
+    request_hash CHAR(32) NOT NULL,
+    status_code SMALLINT,
+    response_body TEXT,
+    created_at TIMESTAMP NOT NULL DEFAULT CURRENT_TIMESTAMP,
+    expires_at TIMESTAMP NOT NULL,
+    PRIMARY KEY (scope, idempotency_key)
+);
+
+-- Очистка просроченных ключей планировщиком пачками
+CREATE INDEX IF NOT EXISTS idx_idempotency_keys_expires_at ON idempotency_keys (expires_at);
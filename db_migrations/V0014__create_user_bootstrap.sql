@@ -0,0 +1,87 @@
+-- Данные первого экрана WebApp одним вызовом: пользователь, первая страница активных заданий
+-- (nextCursor кодируется так же, как курсор tasks GET), достижения с прогрессом и сводка счетчиков.
+-- Собирает готовый JSON; plpgsql кэширует план в сессии, поэтому повторные вызовы не планируются заново.
+-- Возвращает NULL, если пользователя нет
+CREATE OR REPLACE FUNCTION user_bootstrap(p_telegram_id BIGINT, p_tasks_limit INTEGER, p_stats_days INTEGER)
+RETURNS TEXT
+LANGUAGE plpgsql STABLE
+AS $$
+BEGIN
+    RETURN (
+        WITH u AS (
+            SELECT id, telegram_id, username, level, xp, total_completed, streak, timezone, created_at
+            FROM users
+            WHERE telegram_id = p_telegram_id
+        ),
+        page AS (
+            SELECT t.id, t.title, t.description, t.interval, t.assigned_to, t.status, t.priority,
+                   t.reminder_count, t.created_at, t.completed_at, t.next_remind_at,
+                   ROW_NUMBER() OVER (ORDER BY t.created_at DESC, t.id DESC) AS position
+            FROM u
+            CROSS JOIN LATERAL (
+                SELECT *
+                FROM tasks
+                WHERE user_id = u.id AND status = 'active'
+                ORDER BY created_at DESC, id DESC
+                LIMIT p_tasks_limit + 1
+            ) t
+        ),
+        stats AS (
+            SELECT s.priority, s.status, s.task_count
+            FROM u
+            JOIN user_task_stats s ON s.user_id = u.id
+            WHERE s.task_count <> 0
+        )
+        SELECT json_build_object(
+            'user', json_build_object(
+                'id', u.id, 'telegram_id', u.telegram_id, 'username', u.username, 'level', u.level, 'xp', u.xp,
+                'totalCompleted', u.total_completed, 'streak', u.streak, 'timezone', u.timezone, 'createdAt', u.created_at
+            ),
+            'tasks', COALESCE((
+                SELECT json_agg(json_build_object(
+                    'id', p.id::text, 'title', p.title, 'description', p.description, 'interval', p.interval,
+                    'assignedTo', p.assigned_to, 'status', p.status, 'priority', p.priority,
+                    'reminderCount', p.reminder_count, 'createdAt', p.created_at, 'completedAt', p.completed_at,
+                    'nextRemindAt', p.next_remind_at
+                ) ORDER BY p.position)
+                FROM page p
+                WHERE p.position <= p_tasks_limit
+            ), '[]'),
+            'nextCursor', (
+                SELECT translate(encode(convert_to(
+                           to_char(p.created_at, 'YYYY-MM-DD"T"HH24:MI:SS.US') || '|' || p.id, 'UTF8'), 'base64'),
+                       E'+/\n', '-_')
+                FROM page p
+                WHERE p.position = p_tasks_limit AND EXISTS (SELECT 1 FROM page WHERE position > p_tasks_limit)
+            ),
+            'achievements', COALESCE((
+                SELECT json_agg(json_build_object(
+                    'id', a.id::text, 'title', a.title, 'description', a.description, 'icon', a.icon,
+                    'progress', LEAST(100, COALESCE(ua.progress, 0) * 100 / GREATEST(COALESCE(a.required_count, 1), 1)),
+                    'unlocked', COALESCE(ua.unlocked, false),
+                    'unlockedAt', ua.unlocked_at
+                ) ORDER BY a.id)
+                FROM achievements a
+                LEFT JOIN user_achievements ua ON ua.achievement_id = a.id AND ua.user_id = u.id
+            ), '[]'),
+            'stats', json_build_object(
+                'byStatus', COALESCE((
+                    SELECT json_object_agg(status, task_count)
+                    FROM (SELECT status, SUM(task_count) AS task_count FROM stats GROUP BY status) by_status
+                ), '{}'),
+                'byPriority', COALESCE((
+                    SELECT json_object_agg(priority, statuses)
+                    FROM (SELECT priority, json_object_agg(status, task_count) AS statuses FROM stats GROUP BY priority) by_priority
+                ), '{}'),
+                'daily', COALESCE((
+                    SELECT json_agg(json_build_object('day', d.day, 'created', d.created_count, 'completed', d.completed_count)
+                                    ORDER BY d.day)
+                    FROM user_task_daily_stats d
+                    WHERE d.user_id = u.id AND d.day > CURRENT_DATE - p_stats_days
+                ), '[]')
+            )
+        )::text
+        FROM u
+    );
+END;
+$$;
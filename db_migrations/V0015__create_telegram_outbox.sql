@@ -0,0 +1,14 @@
+-- Очередь исходящих сообщений бота. Вебхук (backend/telegram) кладет ответы в той же транзакции,
+-- что и изменения пользователя, планировщик (job=telegram_outbox) отправляет их в Bot API.
+-- Забранная строка получает next_attempt_at в будущем и после отправки удаляется;
+-- если отправка не удалась, строка снова станет доступна в next_attempt_at
+CREATE TABLE IF NOT EXISTS telegram_outbox (
+    id BIGSERIAL PRIMARY KEY,
+    chat_id BIGINT NOT NULL,
+    text TEXT NOT NULL,
+    attempts SMALLINT NOT NULL DEFAULT 0,
+    created_at TIMESTAMP NOT NULL DEFAULT CURRENT_TIMESTAMP,
+    next_attempt_at TIMESTAMP NOT NULL DEFAULT CURRENT_TIMESTAMP
+);
+
+CREATE INDEX IF NOT EXISTS idx_telegram_outbox_next_attempt ON telegram_outbox (next_attempt_at);
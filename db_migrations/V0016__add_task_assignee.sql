@@ -0,0 +1,229 @@
+-- Исполнитель задания ссылкой на пользователя. assigned_to остается как введенный текст,
+-- assignee_id заполняется триггером при записи, если текст узнается как @username или telegram_id.
+-- Столбец без значения по умолчанию и ограничение NOT VALID добавляются без перезаписи и проверки таблицы
+ALTER TABLE tasks ADD COLUMN IF NOT EXISTS assignee_id INTEGER;
+ALTER TABLE tasks_archive ADD COLUMN IF NOT EXISTS assignee_id INTEGER;
+
+DO $$
+BEGIN
+    IF NOT EXISTS (SELECT 1 FROM pg_constraint WHERE conname = 'fk_tasks_assignee') THEN
+        ALTER TABLE tasks ADD CONSTRAINT fk_tasks_assignee
+            FOREIGN KEY (assignee_id) REFERENCES users(id) ON DELETE SET NULL NOT VALID;
+    END IF;
+END;
+$$;
+
+-- Новые колонки tasks и tasks_archive попадают в представление только при его пересоздании
+CREATE OR REPLACE VIEW all_tasks AS
+SELECT * FROM tasks
+UNION ALL
+SELECT * FROM tasks_archive;
+
+-- Поиск исполнителя по имени без учета регистра
+CREATE INDEX IF NOT EXISTS idx_users_username_lower ON users (lower(username));
+
+-- Выполненные задания "назначено мне" в архиве; индекс по tasks создается в V0017 без блокировки записи
+CREATE INDEX IF NOT EXISTS idx_tasks_archive_assignee_created
+    ON tasks_archive (assignee_id, created_at DESC, id DESC)
+    WHERE assignee_id IS NOT NULL;
+
+-- Пользователь по тексту assigned_to: "@name" или "name" - по username, число - по telegram_id.
+-- Неоднозначное или неизвестное имя дает NULL
+CREATE OR REPLACE FUNCTION resolve_assignee(p_assigned_to TEXT)
+RETURNS INTEGER
+LANGUAGE sql STABLE
+AS $$
+    WITH handle AS (
+        SELECT lower(ltrim(btrim(p_assigned_to), '@')) AS value
+    ),
+    matches AS (
+        SELECT u.id FROM users u, handle h
+        WHERE h.value ~ '^[0-9]{1,18}$' AND u.telegram_id = h.value::BIGINT
+        UNION ALL
+        SELECT u.id FROM users u, handle h
+        WHERE h.value <> '' AND h.value !~ '^[0-9]+$' AND lower(u.username) = h.value
+        LIMIT 2
+    )
+    SELECT CASE WHEN COUNT(*) = 1 THEN MIN(id) END FROM matches
+$$;
+
+CREATE OR REPLACE FUNCTION set_task_assignee() RETURNS TRIGGER
+LANGUAGE plpgsql
+AS $$
+BEGIN
+    NEW.assignee_id = resolve_assignee(NEW.assigned_to);
+    RETURN NEW;
+END;
+$$;
+
+DROP TRIGGER IF EXISTS trg_tasks_assignee_insert ON tasks;
+CREATE TRIGGER trg_tasks_assignee_insert
+    BEFORE INSERT ON tasks
+    FOR EACH ROW
+    WHEN (NEW.assigned_to IS NOT NULL)
+    EXECUTE FUNCTION set_task_assignee();
+
+DROP TRIGGER IF EXISTS trg_tasks_assignee_update ON tasks;
+CREATE TRIGGER trg_tasks_assignee_update
+    BEFORE UPDATE OF assigned_to ON tasks
+    FOR EACH ROW
+    WHEN (NEW.assigned_to IS DISTINCT FROM OLD.assigned_to)
+    EXECUTE FUNCTION set_task_assignee();
+
+CREATE OR REPLACE FUNCTION assignment_message(p_titles TEXT[])
+RETURNS TEXT
+LANGUAGE sql IMMUTABLE
+AS $$
+    SELECT CASE WHEN cardinality(p_titles) = 1 THEN '📌 Вам назначено задание: ' || p_titles[1]
+                ELSE '📌 Вам назначены задания:' || E'\n• ' || array_to_string(p_titles, E'\n• ') END
+$$;
+
+-- Уведомление исполнителям в очередь бота: одно сообщение на исполнителя за оператор.
+-- Свои задания и перенос старых назначений (app.assignee_backfill) не уведомляются
+CREATE OR REPLACE FUNCTION notify_task_assignees() RETURNS TRIGGER
+LANGUAGE plpgsql
+AS $$
+BEGIN
+    IF TG_OP = 'UPDATE' THEN
+        INSERT INTO telegram_outbox (chat_id, text)
+        SELECT a.telegram_id, assignment_message(array_agg(n.title ORDER BY n.id))
+        FROM changed_rows n
+        JOIN old_rows o ON o.id = n.id
+        JOIN users a ON a.id = n.assignee_id
+        WHERE n.assignee_id <> n.user_id AND n.status = 'active'
+          AND o.assignee_id IS DISTINCT FROM n.assignee_id
+        GROUP BY a.telegram_id;
+    ELSE
+        INSERT INTO telegram_outbox (chat_id, text)
+        SELECT a.telegram_id, assignment_message(array_agg(n.title ORDER BY n.id))
+        FROM changed_rows n
+        JOIN users a ON a.id = n.assignee_id
+        WHERE n.assignee_id <> n.user_id AND n.status = 'active'
+        GROUP BY a.telegram_id;
+    END IF;
+    RETURN NULL;
+END;
+$$;
+
+DROP TRIGGER IF EXISTS trg_tasks_assignee_notify_insert ON tasks;
+CREATE TRIGGER trg_tasks_assignee_notify_insert
+    AFTER INSERT ON tasks REFERENCING NEW TABLE AS changed_rows
+    FOR EACH STATEMENT EXECUTE FUNCTION notify_task_assignees();
+
+DROP TRIGGER IF EXISTS trg_tasks_assignee_notify_update ON tasks;
+CREATE TRIGGER trg_tasks_assignee_notify_update
+    AFTER UPDATE ON tasks REFERENCING OLD TABLE AS old_rows NEW TABLE AS changed_rows
+    FOR EACH STATEMENT
+    WHEN (current_setting('app.assignee_backfill', true) IS DISTINCT FROM 'on')
+    EXECUTE FUNCTION notify_task_assignees();
+
+-- Версия листинга меняется и у исполнителей, в том числе у прежнего исполнителя при переназначении
+CREATE OR REPLACE FUNCTION bump_user_tasks_version() RETURNS TRIGGER
+LANGUAGE plpgsql
+AS $$
+BEGIN
+    IF TG_OP = 'UPDATE' THEN
+        UPDATE users SET tasks_version = tasks_version + 1
+        WHERE id IN (
+            SELECT user_id FROM changed_rows
+            UNION SELECT assignee_id FROM changed_rows
+            UNION SELECT assignee_id FROM old_rows
+        );
+    ELSE
+        UPDATE users SET tasks_version = tasks_version + 1
+        WHERE id IN (SELECT user_id FROM changed_rows UNION SELECT assignee_id FROM changed_rows);
+    END IF;
+    RETURN NULL;
+END;
+$$;
+
+DROP TRIGGER IF EXISTS trg_tasks_version_update ON tasks;
+CREATE TRIGGER trg_tasks_version_update
+    AFTER UPDATE ON tasks REFERENCING OLD TABLE AS old_rows NEW TABLE AS changed_rows
+    FOR EACH STATEMENT EXECUTE FUNCTION bump_user_tasks_version();
+
+-- Перенос старых значений assigned_to пачкой по id в p_table (tasks или tasks_archive).
+-- Вызывается планировщиком (job=assignees), каждая пачка - отдельная короткая транзакция,
+-- блокируются только измененные строки. Возвращает последний просмотренный id или NULL в конце таблицы
+CREATE OR REPLACE FUNCTION backfill_task_assignees(p_table TEXT, p_after_id INTEGER, p_batch_size INTEGER)
+RETURNS TABLE (last_id INTEGER, resolved INTEGER)
+LANGUAGE plpgsql
+AS $$
+BEGIN
+    IF p_table NOT IN ('tasks', 'tasks_archive') THEN
+        RAISE EXCEPTION 'Unknown table %', p_table;
+    END IF;
+    PERFORM set_config('app.assignee_backfill', 'on', true);
+    RETURN QUERY EXECUTE format(
+        'WITH batch AS (
+             SELECT id, assigned_to FROM %1$I WHERE id > $1 ORDER BY id LIMIT $2
+         ),
+         resolved AS (
+             SELECT b.id, resolve_assignee(b.assigned_to) AS assignee_id
+             FROM batch b
+             WHERE b.assigned_to <> ''''
+         ),
+         updated AS (
+             UPDATE %1$I t SET assignee_id = r.assignee_id
+             FROM resolved r
+             WHERE t.id = r.id AND r.assignee_id IS NOT NULL AND t.assignee_id IS DISTINCT FROM r.assignee_id
+             RETURNING t.id
+         )
+         SELECT (SELECT MAX(id) FROM batch), (SELECT COUNT(*)::INTEGER FROM updated)',
+        p_table
+    ) USING p_after_id, p_batch_size;
+END;
+$$;
+
+-- "Назначьте 5 заданий другим": считаются задания, исполнитель которых узнан и не совпадает с автором
+CREATE OR REPLACE FUNCTION evaluate_user_achievements(p_user_ids INTEGER[])
+RETURNS TABLE (user_id INTEGER, achievement_id INTEGER, progress INTEGER, unlocked BOOLEAN, newly_unlocked BOOLEAN)
+LANGUAGE sql
+AS $$
+    WITH task_counts AS (
+        SELECT t.user_id,
+               COUNT(*) AS tasks_created,
+               COUNT(*) FILTER (WHERE t.assignee_id IS NOT NULL AND t.assignee_id <> t.user_id) AS tasks_assigned
+        FROM all_tasks t
+        WHERE t.user_id = ANY(p_user_ids)
+        GROUP BY t.user_id
+    ),
+    metric_values AS (
+        SELECT u.id AS user_id, m.metric, COALESCE(m.value, 0) AS value
+        FROM users u
+        LEFT JOIN task_counts tc ON tc.user_id = u.id
+        CROSS JOIN LATERAL (VALUES
+            ('tasks_created', tc.tasks_created::INTEGER),
+            ('tasks_completed', u.total_completed),
+            ('tasks_assigned', tc.tasks_assigned::INTEGER),
+            ('streak', u.streak),
+            ('level', u.level)
+        ) AS m(metric, value)
+        WHERE u.id = ANY(p_user_ids)
+    ),
+    previous AS (
+        SELECT ua.user_id, ua.achievement_id, ua.unlocked
+        FROM user_achievements ua
+        WHERE ua.user_id = ANY(p_user_ids)
+    ),
+    evaluated AS (
+        INSERT INTO user_achievements AS ua (user_id, achievement_id, progress, unlocked, unlocked_at)
+        SELECT mv.user_id, a.id, mv.value, mv.value >= a.required_count,
+               CASE WHEN mv.value >= a.required_count THEN CURRENT_TIMESTAMP END
+        FROM metric_values mv
+        JOIN achievements a ON a.metric = mv.metric
+        ON CONFLICT (user_id, achievement_id) DO UPDATE SET
+            progress = CASE WHEN ua.unlocked OR EXCLUDED.unlocked
+                            THEN GREATEST(ua.progress, EXCLUDED.progress)
+                            ELSE EXCLUDED.progress END,
+            unlocked = ua.unlocked OR EXCLUDED.unlocked,
+            unlocked_at = COALESCE(ua.unlocked_at, EXCLUDED.unlocked_at)
+        WHERE ua.progress IS DISTINCT FROM EXCLUDED.progress
+           OR (EXCLUDED.unlocked AND NOT COALESCE(ua.unlocked, false))
+        RETURNING ua.user_id, ua.achievement_id, ua.progress, ua.unlocked
+    )
+    SELECT e.user_id, e.achievement_id, e.progress, e.unlocked,
+           e.unlocked AND NOT COALESCE(p.unlocked, false) AS newly_unlocked
+    FROM evaluated e
+    LEFT JOIN previous p ON p.user_id = e.user_id AND p.achievement_id = e.achievement_id
+$$;
@@ -0,0 +1,6 @@
+-- Листинг "назначено мне" (tasks GET assigned=me) по исполнителю и статусу в порядке страниц.
+-- CONCURRENTLY не блокирует запись в tasks на время построения, поэтому индекс в отдельной миграции:
+-- такой оператор выполняется вне транзакции
+CREATE INDEX CONCURRENTLY IF NOT EXISTS idx_tasks_assignee_status_created
+    ON tasks (assignee_id, status, created_at DESC, id DESC)
+    WHERE assignee_id IS NOT NULL;
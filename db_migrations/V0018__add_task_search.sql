@@ -0,0 +1,40 @@
+-- Поиск по названию и описанию заданий (tasks GET q=...): полнотекстовый по русской конфигурации
+-- и нечеткий по триграммам для опечаток и недописанных слов.
+-- Вектор не хранится столбцом: добавление генерируемого STORED столбца переписывает tasks и все секции
+-- архива под исключительной блокировкой. Индексы строятся по тем же IMMUTABLE функциям, что и запрос
+CREATE EXTENSION IF NOT EXISTS pg_trgm;
+
+-- Название весомее описания при ранжировании
+CREATE OR REPLACE FUNCTION task_search_vector(p_title TEXT, p_description TEXT)
+RETURNS tsvector
+LANGUAGE sql IMMUTABLE PARALLEL SAFE
+AS $$
+    SELECT setweight(to_tsvector('russian'::regconfig, COALESCE(p_title, '')), 'A')
+        || setweight(to_tsvector('russian'::regconfig, COALESCE(p_description, '')), 'B')
+$$;
+
+CREATE OR REPLACE FUNCTION task_search_text(p_title TEXT, p_description TEXT)
+RETURNS TEXT
+LANGUAGE sql IMMUTABLE PARALLEL SAFE
+AS $$
+    SELECT COALESCE(p_title, '') || ' ' || COALESCE(p_description, '')
+$$;
+
+-- Запрос пользователя в tsquery: все слова обязательны, каждое как префикс основы ("молок" найдет "молоко",
+-- "магаз" - "магазине"). Основы уже нормализованы, поэтому собираются конфигурацией simple.
+-- Строка из одних стоп-слов дает NULL и совпадает только по триграммам
+CREATE OR REPLACE FUNCTION task_search_query(p_query TEXT)
+RETURNS tsquery
+LANGUAGE sql IMMUTABLE PARALLEL SAFE
+AS $$
+    SELECT to_tsquery('simple'::regconfig, string_agg(quote_literal(lexeme) || ':*', ' & '))
+    FROM unnest(to_tsvector('russian'::regconfig, p_query))
+$$;
+
+-- Архив пишет только планировщик (job=archive_tasks), поэтому индексы по секциям строятся здесь,
+-- новые секции получают их автоматически. Индексы по tasks - в V0019 без блокировки записи
+CREATE INDEX IF NOT EXISTS idx_tasks_archive_search
+    ON tasks_archive USING gin (task_search_vector(title, description));
+
+CREATE INDEX IF NOT EXISTS idx_tasks_archive_search_trgm
+    ON tasks_archive USING gin (task_search_text(title, description) gin_trgm_ops);
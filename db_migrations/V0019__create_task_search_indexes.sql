@@ -0,0 +1,7 @@
+-- Индексы поиска по tasks (см. V0018). CONCURRENTLY не блокирует запись на время построения
+-- и выполняется вне транзакции, поэтому индексы в отдельной миграции
+CREATE INDEX CONCURRENTLY IF NOT EXISTS idx_tasks_search
+    ON tasks USING gin (task_search_vector(title, description));
+
+CREATE INDEX CONCURRENTLY IF NOT EXISTS idx_tasks_search_trgm
+    ON tasks USING gin (task_search_text(title, description) gin_trgm_ops);
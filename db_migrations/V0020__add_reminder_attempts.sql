@@ -0,0 +1,11 @@
+-- Неудачные отправки текущего напоминания подряд: планировщик повторяет чат после аренды,
+-- а после TELEGRAM_MAX_ATTEMPTS попыток пропускает напоминание до следующего интервала.
+-- Столбец с константой по умолчанию добавляется без перезаписи таблицы
+ALTER TABLE tasks ADD COLUMN IF NOT EXISTS reminder_attempts INTEGER NOT NULL DEFAULT 0;
+ALTER TABLE tasks_archive ADD COLUMN IF NOT EXISTS reminder_attempts INTEGER NOT NULL DEFAULT 0;
+
+-- Новые колонки tasks и tasks_archive попадают в представление только при его пересоздании
+CREATE OR REPLACE VIEW all_tasks AS
+SELECT * FROM tasks
+UNION ALL
+SELECT * FROM tasks_archive;
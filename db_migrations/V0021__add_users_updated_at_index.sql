@@ -0,0 +1,4 @@
+-- Рейтинг users подтягивает изменения XP, уровня и счетчика выполненных по updated_at вместо полной перезагрузки.
+-- CONCURRENTLY не блокирует запись в users на время построения и выполняется вне транзакции,
+-- поэтому индекс в отдельной миграции
+CREATE INDEX CONCURRENTLY IF NOT EXISTS idx_users_updated_at ON users (updated_at);
@@ -20,7 +20,11 @@ interface CreateTaskFormProps {
   onCreateTask: () => void;
 }
 
+const PRESET_INTERVALS = ['30min', '1hour', '2hours', 'daily'];
+
 const CreateTaskForm = ({ newTask, onTaskChange, onCreateTask }: CreateTaskFormProps) => {
+  const isCustomInterval = !PRESET_INTERVALS.includes(newTask.interval);
+
   return (
     <Card className="p-8">
       <div className="space-y-6">
@@ -49,7 +53,10 @@ const CreateTaskForm = ({ newTask, onTaskChange, onCreateTask }: CreateTaskFormP
         <div className="grid grid-cols-1 md:grid-cols-2 gap-6">
           <div>
             <Label htmlFor="interval" className="text-lg">Интервал напоминаний</Label>
-            <Select value={newTask.interval} onValueChange={(value) => onTaskChange({...newTask, interval: value})}>
+            <Select
+              value={isCustomInterval ? 'custom' : newTask.interval}
+              onValueChange={(value) => onTaskChange({...newTask, interval: value === 'custom' ? '' : value})}
+            >
               <SelectTrigger className="mt-2">
                 <SelectValue />
               </SelectTrigger>
@@ -61,6 +68,18 @@ const CreateTaskForm = ({ newTask, onTaskChange, onCreateTask }: CreateTaskFormP
                 <SelectItem value="custom">⚙️ Настроить время</SelectItem>
               </SelectContent>
             </Select>
+            {isCustomInterval && (
+              <>
+                <Input
+                  id="customInterval"
+                  placeholder="Например: 45min, 3hours, 2days, weekly"
+                  value={newTask.interval}
+                  onChange={(e) => onTaskChange({...newTask, interval: e.target.value})}
+                  className="mt-2"
+                />
+                <p className="text-sm text-muted-foreground mt-1">Число и единица: min, hour, day или week</p>
+              </>
+            )}
           </div>
 
           <div>
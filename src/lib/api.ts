@@ -14,6 +14,7 @@ interface User {
   xp: number;
   totalCompleted: number;
   streak: number;
+  timezone?: string;
   createdAt: string;
 }
 
@@ -40,26 +41,97 @@ interface Achievement {
   unlockedAt?: string;
 }
 
+interface LeaderboardEntry {
+  rank: number;
+  userId: number;
+  username?: string;
+  level: number;
+  xp: number;
+  totalCompleted: number;
+  value: number;
+}
+
+interface Leaderboard {
+  by: 'xp' | 'level' | 'total_completed';
+  total: number;
+  top: LeaderboardEntry[];
+  me?: { userId: number; rank: number };
+  around?: LeaderboardEntry[];
+}
+
+interface TaskStats {
+  byStatus: Record<string, number>;
+  byPriority: Record<string, Record<string, number>>;
+  daily: { day: string; created: number; completed: number }[];
+}
+
+interface Bootstrap {
+  user: User;
+  tasks: Task[];
+  nextCursor: string | null;
+  achievements: Achievement[];
+  stats: TaskStats;
+}
+
+interface TaskCompletion {
+  task: Pick<Task, 'id' | 'title' | 'status' | 'completedAt'>;
+  user: (User & { levelsGained: number }) | null;
+  unlockedAchievements: Omit<Achievement, 'progress' | 'unlocked'>[];
+}
+
+// Позиция WAL последней записи (X-Db-Lsn): с ней чтения не уйдут на реплику, которая ее еще не проиграла
+let lastWriteLsn: string | null = null;
+
+async function write(url: string, init: RequestInit): Promise<Response> {
+  const response = await fetch(url, init);
+  lastWriteLsn = response.headers.get('X-Db-Lsn') ?? lastWriteLsn;
+  return response;
+}
+
+function read(url: string): Promise<Response> {
+  return fetch(url, lastWriteLsn ? { headers: { 'X-Db-Lsn': lastWriteLsn } } : undefined);
+}
+
 export const api = {
   users: {
     async get(telegram_id: number): Promise<User> {
-      const response = await fetch(`${API_BASE}/${ENDPOINTS.users}?telegram_id=${telegram_id}`);
+      const response = await read(`${API_BASE}/${ENDPOINTS.users}?telegram_id=${telegram_id}`);
       const data = await response.json();
       return data.user;
     },
 
+    async bootstrap(telegram_id: number): Promise<Bootstrap | null> {
+      const response = await read(`${API_BASE}/${ENDPOINTS.users}?view=bootstrap&telegram_id=${telegram_id}`);
+      if (response.status === 404) {
+        return null;
+      }
+      if (!response.ok) {
+        throw new Error(`Bootstrap failed: ${response.status}`);
+      }
+      return await response.json();
+    },
+
     async create(telegram_id: number, username?: string): Promise<User> {
-      const response = await fetch(`${API_BASE}/${ENDPOINTS.users}`, {
+      const timezone = Intl.DateTimeFormat().resolvedOptions().timeZone;
+      const response = await write(`${API_BASE}/${ENDPOINTS.users}`, {
         method: 'POST',
         headers: { 'Content-Type': 'application/json' },
-        body: JSON.stringify({ telegram_id, username })
+        body: JSON.stringify({ telegram_id, username, timezone })
       });
       const data = await response.json();
       return data.user;
     },
 
+    async leaderboard(by: Leaderboard['by'] = 'xp', user_id?: number, limit: number = 10): Promise<Leaderboard> {
+      const params = new URLSearchParams({ view: 'leaderboard', by, limit: String(limit) });
+      if (user_id) params.set('user_id', String(user_id));
+      const response = await read(`${API_BASE}/${ENDPOINTS.users}?${params}`);
+      const data = await response.json();
+      return data.leaderboard;
+    },
+
     async update(user_id: number, xp_increment: number = 0, complete_task: boolean = false): Promise<User> {
-      const response = await fetch(`${API_BASE}/${ENDPOINTS.users}`, {
+      const response = await write(`${API_BASE}/${ENDPOINTS.users}`, {
         method: 'PUT',
         headers: { 'Content-Type': 'application/json' },
         body: JSON.stringify({ user_id, xp_increment, complete_task })
@@ -70,12 +142,40 @@ export const api = {
   },
 
   tasks: {
-    async list(user_id: number, status: string = 'active'): Promise<Task[]> {
-      const response = await fetch(`${API_BASE}/${ENDPOINTS.tasks}?user_id=${user_id}&status=${status}`);
+    async list(user_id: number, status: string = 'active', assignedToMe: boolean = false): Promise<Task[]> {
+      const params = new URLSearchParams({ user_id: String(user_id), status });
+      if (assignedToMe) params.set('assigned', 'me');
+      const response = await read(`${API_BASE}/${ENDPOINTS.tasks}?${params}`);
       const data = await response.json();
       return data.tasks;
     },
 
+    async search(user_id: number, q: string, cursor?: string): Promise<{ tasks: Task[]; match: 'fulltext' | 'fuzzy'; nextCursor: string | null }> {
+      const params = new URLSearchParams({ user_id: String(user_id), q });
+      if (cursor) params.set('cursor', cursor);
+      const response = await read(`${API_BASE}/${ENDPOINTS.tasks}?${params}`);
+      if (!response.ok) {
+        throw new Error(`Task search failed: ${response.status}`);
+      }
+      return await response.json();
+    },
+
+    async export(user_id: number, format: 'ndjson' | 'csv' = 'csv'): Promise<Blob> {
+      const parts: Blob[] = [];
+      const params = new URLSearchParams({ user_id: String(user_id), view: 'export', format });
+      while (true) {
+        const response = await read(`${API_BASE}/${ENDPOINTS.tasks}?${params}`);
+        if (!response.ok) {
+          throw new Error(`Task export failed: ${response.status}`);
+        }
+        parts.push(await response.blob());
+        const nextCursor = response.headers.get('X-Next-Cursor');
+        if (!nextCursor) break;
+        params.set('cursor', nextCursor);
+      }
+      return new Blob(parts, { type: parts[0]?.type });
+    },
+
     async create(user_id: number, task: {
       title: string;
       description: string;
@@ -83,7 +183,7 @@ export const api = {
       assigned_to?: string;
       priority: 'low' | 'medium' | 'high';
     }): Promise<Task> {
-      const response = await fetch(`${API_BASE}/${ENDPOINTS.tasks}`, {
+      const response = await write(`${API_BASE}/${ENDPOINTS.tasks}`, {
         method: 'POST',
         headers: { 'Content-Type': 'application/json' },
         body: JSON.stringify({
@@ -100,29 +200,41 @@ export const api = {
     },
 
     async update(task_id: string, status: string): Promise<Task> {
-      const response = await fetch(`${API_BASE}/${ENDPOINTS.tasks}`, {
+      const response = await write(`${API_BASE}/${ENDPOINTS.tasks}`, {
         method: 'PUT',
         headers: { 'Content-Type': 'application/json' },
-        body: JSON.stringify({ status }),
+        body: JSON.stringify({ task_id, status }),
         
       });
       const data = await response.json();
       return data.task;
+    },
+
+    async complete(task_id: string): Promise<TaskCompletion> {
+      const response = await write(`${API_BASE}/${ENDPOINTS.tasks}`, {
+        method: 'PUT',
+        headers: { 'Content-Type': 'application/json' },
+        body: JSON.stringify({ task_id, status: 'completed' })
+      });
+      if (!response.ok) {
+        throw new Error(`Task completion failed: ${response.status}`);
+      }
+      return await response.json();
     }
   },
 
   achievements: {
     async list(user_id: number): Promise<Achievement[]> {
-      const response = await fetch(`${API_BASE}/${ENDPOINTS.achievements}?user_id=${user_id}`);
+      const response = await read(`${API_BASE}/${ENDPOINTS.achievements}?user_id=${user_id}`);
       const data = await response.json();
       return data.achievements;
     },
 
-    async updateProgress(user_id: number, achievement_id: number, progress_increment: number = 1): Promise<{ progress: number; unlocked: boolean }> {
-      const response = await fetch(`${API_BASE}/${ENDPOINTS.achievements}`, {
+    async updateProgress(user_id: number, achievement_id: number): Promise<{ progress: number; unlocked: boolean }> {
+      const response = await write(`${API_BASE}/${ENDPOINTS.achievements}`, {
         method: 'POST',
         headers: { 'Content-Type': 'application/json' },
-        body: JSON.stringify({ user_id, achievement_id, progress_increment })
+        body: JSON.stringify({ user_id, achievement_id })
       });
       return await response.json();
     }
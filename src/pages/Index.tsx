@@ -62,24 +62,27 @@ const Index = () => {
     try {
       setLoading(true);
       
-      let user = await api.users.get(DEMO_TELEGRAM_ID).catch(() => null);
-      if (!user) {
-        user = await api.users.create(DEMO_TELEGRAM_ID, 'demo_user');
+      let data = await api.users.bootstrap(DEMO_TELEGRAM_ID);
+      if (!data) {
+        await api.users.create(DEMO_TELEGRAM_ID, 'demo_user');
+        data = await api.users.bootstrap(DEMO_TELEGRAM_ID);
+      }
+      if (!data) {
+        throw new Error('User not found after create');
       }
       
+      const { user } = data;
       setUserLevel(user.level);
       setUserXP(user.xp);
       setNextLevelXP(user.level * 100);
       
-      const tasksData = await api.tasks.list(user.id);
-      setTasks(tasksData.map(t => ({
+      setTasks(data.tasks.map(t => ({
         ...t,
         createdAt: new Date(t.createdAt),
         completedAt: t.completedAt ? new Date(t.completedAt) : undefined
       })));
       
-      const achievementsData = await api.achievements.list(user.id);
-      setAchievements(achievementsData);
+      setAchievements(data.achievements);
       
     } catch (error) {
       console.error('Failed to load data:', error);
@@ -102,14 +105,12 @@ const Index = () => {
 
   const completeTask = async (taskId: string) => {
     try {
-      await api.tasks.update(taskId, 'completed');
-      
-      const updatedUser = await api.users.update(DEMO_USER_ID, 25, true);
-      setUserXP(updatedUser.xp);
-      setUserLevel(updatedUser.level);
-      setNextLevelXP(updatedUser.level * 100);
-      
-      await api.achievements.updateProgress(DEMO_USER_ID, 2, 1);
+      const { user: updatedUser } = await api.tasks.complete(taskId);
+      if (updatedUser) {
+        setUserXP(updatedUser.xp);
+        setUserLevel(updatedUser.level);
+        setNextLevelXP(updatedUser.level * 100);
+      }
       
       setTasks(tasks.map(task => 
         task.id === taskId 
@@ -144,16 +145,23 @@ const Index = () => {
       return;
     }
 
+    if (!newTask.interval.trim()) {
+      toast({
+        title: "Упс! 😅",
+        description: "Укажите интервал напоминаний, например 45min",
+        variant: "destructive"
+      });
+      return;
+    }
+
     try {
       await api.tasks.create(DEMO_USER_ID, {
         title: newTask.title,
         description: newTask.description,
-        interval: newTask.interval,
+        interval: newTask.interval.trim(),
         assigned_to: newTask.assignedTo || undefined,
         priority: newTask.priority
       });
-      
-      await api.achievements.updateProgress(DEMO_USER_ID, 1, 1);
 
       setNewTask({
         title: '',